@@ -0,0 +1,187 @@
+# baselines.py
+"""
+Mức chi tiêu thường ngày của từng người dùng theo danh mục, dùng để cảnh báo khoản chi bất thường
+và dự báo vượt ngân sách thay cho ngưỡng cố định 50 triệu.
+
+Thống kê (n, mean, m2 theo Welford và EWMA) nằm trong bảng spending_stats, được Database cập nhật
+O(1) mỗi khi ghi chi tiêu. Tính lại toàn bộ từ lịch sử (vector hóa bằng NumPy, một lượt đọc):
+    python baselines.py backfill --db expenses.db
+"""
+import argparse
+import calendar
+import math
+import time
+from datetime import datetime
+
+from config import (
+    BASELINE_EWMA_ALPHA, BASELINE_MIN_SAMPLES, ANOMALY_Z_THRESHOLD, ANOMALY_EWMA_RATIO,
+    INCOME_SHARE_WARNING, LARGE_EXPENSE_FALLBACK
+)
+from metrics import registry
+
+# Dự báo theo tốc độ chi chỉ có ý nghĩa sau vài ngày đầu tháng
+BURN_RATE_MIN_DAYS = 3
+FETCH_SIZE = 100000
+
+warnings_sent = registry.counter("bot_spending_warnings_total", "Số cảnh báo chi tiêu theo loại")
+
+
+def stddev(n, m2):
+    """Độ lệch chuẩn mẫu từ thống kê Welford."""
+    return math.sqrt(m2 / (n - 1)) if n > 1 else 0.0
+
+
+def anomaly_warning(stats, category, amount):
+    """Cảnh báo nếu khoản chi vượt trung bình ANOMALY_Z_THRESHOLD độ lệch chuẩn và vượt xa mức EWMA gần đây."""
+    if stats is None:
+        return None
+    n, mean, m2, ewma, _ = stats
+    if n < BASELINE_MIN_SAMPLES:
+        return None
+    std = stddev(n, m2)
+    z = (amount - mean) / std if std > 0 else (math.inf if amount > mean else 0.0)
+    if z < ANOMALY_Z_THRESHOLD or amount < ANOMALY_EWMA_RATIO * ewma:
+        return None
+    return (f"❗ Khoản chi {category} này gấp {amount / ewma:.1f} lần mức thường ngày của bạn "
+            f"(khoảng {ewma:,.0f} đồng). Bạn có chắc chắn đây là khoản chi cần thiết không?")
+
+
+def income_warning(income, amount):
+    if not income or amount < INCOME_SHARE_WARNING * income:
+        return None
+    return f"❗ Khoản chi này bằng {amount / income:.0%} thu nhập hàng tháng của bạn."
+
+
+def burn_rate_warning(db, user_id, budget, amount, date, today=None, pending=0.0):
+    """
+    Dự báo chi tiêu cả tháng theo tốc độ chi từ đầu tháng đến nay. Chỉ cảnh báo khi chính khoản chi này
+    làm tổng chi hoặc mức dự báo vượt ngân sách, để không nhắc lại ở mọi khoản chi sau đó.
+    `pending` là tổng các khoản chi tháng này chưa ghi vào database (các khoản trước trong cùng tin nhắn).
+    """
+    today = today or datetime.now().date()
+    if not budget or date[:7] != today.strftime("%Y-%m"):
+        return None
+    month_start = today.replace(day=1).strftime("%Y-%m-%d")
+    spent_before = db.get_total_by_period(user_id, month_start, today.strftime("%Y-%m-%d")) + pending
+    spent = spent_before + amount
+    if spent_before <= budget < spent:
+        return f"⚠️ Tháng này bạn đã chi {spent:,.0f} đồng, vượt ngân sách {budget:,.0f} đồng."
+    if spent > budget or today.day < BURN_RATE_MIN_DAYS:
+        return None
+    days = calendar.monthrange(today.year, today.month)[1]
+    projected_before = spent_before / today.day * days
+    projected = spent / today.day * days
+    if projected_before <= budget < projected:
+        return (f"📉 Với tốc độ hiện tại, tháng này bạn sẽ chi khoảng {projected:,.0f} đồng, "
+                f"vượt ngân sách {budget:,.0f} đồng ({projected / budget - 1:.0%}).")
+    return None
+
+
+def check_expense(db, user_id, category, amount, date, pending=0.0):
+    """
+    Các cảnh báo cho một khoản chi sắp ghi, dựa trên lịch sử của danh mục, thu nhập và ngân sách trong hồ sơ.
+    Khi chưa có cả hồ sơ lẫn lịch sử thì dùng ngưỡng cố định LARGE_EXPENSE_FALLBACK.
+    `pending`: tổng các khoản chi tháng này cùng tin nhắn đã kiểm tra trước nhưng chưa ghi.
+    """
+    stats = db.get_spending_stats(user_id, category)
+    profile = db.get_profile(user_id)
+    income, budget = (profile.income, profile.budget) if profile else (None, None)
+    checks = (
+        ("anomaly", lambda: anomaly_warning(stats, category, amount)),
+        ("income", lambda: income_warning(income, amount)),
+        ("burn_rate", lambda: burn_rate_warning(db, user_id, budget, amount, date, pending=pending)),
+    )
+    messages = []
+    for kind, check in checks:
+        message = check()
+        if message:
+            warnings_sent.inc(kind=kind)
+            messages.append(message)
+    has_history = stats is not None and stats[0] >= BASELINE_MIN_SAMPLES
+    if not messages and not has_history and not income and amount > LARGE_EXPENSE_FALLBACK:
+        warnings_sent.inc(kind="fallback")
+        messages.append("❗ Khoản chi này khá lớn! Bạn có chắc chắn rằng đây là khoản chi cần thiết không?")
+    return messages
+
+
+def compute_baselines(groups, amounts, alpha=BASELINE_EWMA_ALPHA):
+    """
+    Tính (n, mean, m2, ewma) cho mọi nhóm cùng lúc. `groups` là chỉ số nhóm 0..G-1 đã sắp xếp tăng dần,
+    `amounts` là số tiền theo thứ tự thời gian trong từng nhóm. Kết quả trùng với việc cập nhật
+    tuần tự STATS_UPSERT theo cùng thứ tự.
+    """
+    import numpy as np
+    counts = np.bincount(groups)
+    means = np.bincount(groups, weights=amounts) / counts
+    deviations = amounts - means[groups]
+    m2 = np.bincount(groups, weights=deviations * deviations)
+    # EWMA với giá trị khởi đầu là chi tiêu đầu tiên: trọng số của phần tử thứ i trong nhóm n phần tử
+    # là alpha * (1 - alpha)^(n - 1 - i), riêng phần tử đầu là (1 - alpha)^(n - 1)
+    starts = np.cumsum(counts) - counts
+    position = np.arange(len(amounts)) - starts[groups]
+    exponent = counts[groups] - 1 - position
+    weights = np.power(1 - alpha, exponent, dtype=np.float64)
+    weights[position > 0] *= alpha
+    ewma = np.bincount(groups, weights=weights * amounts)
+    return counts, means, m2, ewma
+
+
+def _read_history(db):
+    import numpy as np
+    cursor = db.conn.cursor()
+    cursor.execute('''
+        SELECT dense_rank() OVER (ORDER BY user_id, COALESCE(category, 'Khác')) - 1, amount
+        FROM expenses ORDER BY user_id, COALESCE(category, 'Khác'), date, id
+    ''')
+    group_parts, amount_parts = [], []
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        chunk = np.array(rows, dtype=np.float64)
+        group_parts.append(chunk[:, 0].astype(np.int64))
+        amount_parts.append(chunk[:, 1])
+    if not group_parts:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    return np.concatenate(group_parts), np.concatenate(amount_parts)
+
+
+def backfill(db, alpha=BASELINE_EWMA_ALPHA):
+    """Tính lại bảng spending_stats cho tất cả người dùng từ lịch sử chi tiêu. Trả về số nhóm đã ghi."""
+    groups, amounts = _read_history(db)
+    cursor = db.conn.cursor()
+    # Cùng thứ tự với dense_rank ở trên nên dòng thứ k ứng với nhóm k
+    cursor.execute('''
+        SELECT user_id, COALESCE(category, 'Khác'), MAX(date) FROM expenses
+        GROUP BY user_id, COALESCE(category, 'Khác') ORDER BY user_id, COALESCE(category, 'Khác')
+    ''')
+    keys = cursor.fetchall()
+    if len(amounts) == 0:
+        db.replace_spending_stats([])
+        return 0
+    counts, means, m2, ewma = compute_baselines(groups, amounts, alpha)
+    rows = [
+        (user_id, category, n, mean, m, e, last_date)
+        for (user_id, category, last_date), n, mean, m, e
+        in zip(keys, counts.tolist(), means.tolist(), m2.tolist(), ewma.tolist())
+    ]
+    db.replace_spending_stats(rows)
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--db", default="expenses.db")
+    args = parser.parse_args()
+
+    from database import Database
+    db = Database(args.db)
+    start = time.perf_counter()
+    groups = backfill(db)
+    print(f"Đã tính lại mức chi tiêu của {groups:,} cặp người dùng / danh mục trong {time.perf_counter() - start:.1f}s.")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# batching.py
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+
+class BatchQueueFull(Exception):
+    """Hàng đợi của batcher đã đầy, caller nên dùng fallback thay vì chờ."""
+
+
+class MicroBatcher:
+    """
+    Gom các request inference từ nhiều chat đồng thời thành một batch.
+    Một batch được chạy khi đủ `max_batch_size` phần tử hoặc khi phần tử đầu tiên
+    đã chờ `max_wait_ms`. Mỗi caller nhận lại đúng kết quả của mình qua một Future.
+    """
+
+    def __init__(self, name, batch_fn, max_batch_size=16, max_wait_ms=10, max_queue=256, max_latency_ms=2000):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_latency = max_latency_ms / 1000
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._items = 0
+        self._rejected = 0
+        self._expired = 0
+        self._errors = 0
+        self._worker = None
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name=f"batcher-{self.name}", daemon=True)
+                    self._worker.start()
+
+    def submit(self, item):
+        """Đưa một phần tử vào hàng đợi, trả về Future chứa kết quả."""
+        self._ensure_worker()
+        future = Future()
+        try:
+            self._queue.put_nowait((item, future, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise BatchQueueFull(f"Hàng đợi batcher '{self.name}' đã đầy")
+        return future
+
+    def run(self, item):
+        """
+        Gửi một phần tử và chờ kết quả, tối đa `max_latency_ms`.
+        Ném BatchQueueFull hoặc TimeoutError để caller chuyển sang fallback.
+        """
+        future = self.submit(item)
+        try:
+            return future.result(timeout=self.max_latency)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def run_many(self, items):
+        """
+        Gửi nhiều phần tử cùng lúc (thường vào cùng một batch) và chờ tất cả, tối đa `max_latency_ms`.
+        Trả về list kết quả theo thứ tự; ném BatchQueueFull hoặc TimeoutError như run().
+        """
+        futures = []
+        try:
+            for item in items:
+                futures.append(self.submit(item))
+            deadline = time.monotonic() + self.max_latency
+            return [future.result(timeout=max(0.0, deadline - time.monotonic())) for future in futures]
+        except (BatchQueueFull, TimeoutError):
+            for future in futures:
+                future.cancel()
+            raise
+
+    def _collect(self):
+        item = self._queue.get()
+        batch = [item]
+        deadline = item[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Bỏ các phần tử caller đã hủy hoặc đã quá hạn độ trễ tối đa
+            now = time.monotonic()
+            live = []
+            for item, future, enqueued in batch:
+                if now - enqueued > self.max_latency:
+                    future.cancel()
+                if future.set_running_or_notify_cancel():
+                    live.append((item, future))
+                else:
+                    with self._lock:
+                        self._expired += 1
+            if not live:
+                continue
+            with self._lock:
+                self._batch_sizes[len(live)] += 1
+                self._items += len(live)
+            try:
+                results = self.batch_fn([item for item, _ in live])
+                for (_, future), result in zip(live, results):
+                    future.set_result(result)
+            except Exception as e:
+                with self._lock:
+                    self._errors += 1
+                for _, future in live:
+                    future.set_exception(e)
+
+    def stats(self):
+        """Bộ đếm: số batch, số phần tử, phân bố kích thước batch, độ sâu hàng đợi."""
+        with self._lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "batches": batches,
+                "items": self._items,
+                "avg_batch_size": (self._items / batches) if batches else 0.0,
+                "max_batch_size": max(self._batch_sizes, default=0),
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "queue_depth": self._queue.qsize(),
+                "rejected": self._rejected,
+                "expired": self._expired,
+                "errors": self._errors,
+            }
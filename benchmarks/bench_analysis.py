@@ -0,0 +1,132 @@
+# benchmarks/bench_analysis.py
+"""
+So sánh phần tổng hợp số liệu của analyze_spending trước và sau khi bỏ pandas:
+- legacy: đọc mọi dòng trong kỳ rồi DataFrame.sum() / groupby("category") như bản cũ
+- sql:    SpendingSummary tính bằng GROUP BY trong SQLite (bảng rollup)
+
+Mỗi chế độ chạy trong một process riêng để đo RSS độc lập. Cách chạy từ thư mục gốc repo:
+    python -m benchmarks.bench_analysis --rows 100000 --calls 200
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+USER_ID = "bench-user"
+CATEGORIES = ["Tiêu dùng", "Đầu tư", "Giải trí", "Tiết kiệm", "Đi lại", "Chi phí cố định", "Khác"]
+
+def seed(db_file, rows):
+    from database import Database
+    db = Database(db_file)
+    today = datetime.now()
+    rng = random.Random(42)
+    batch = []
+    for i in range(rows):
+        day = today.replace(day=rng.randint(1, 28)).strftime("%Y-%m-%d")
+        user_id = USER_ID if i % 4 == 0 else f"noise-{i % 1000}"
+        batch.append((user_id, day, rng.randint(1, 500) * 1000.0, rng.choice(CATEGORIES), "VND"))
+        if len(batch) >= 50000:
+            db.add_expenses(batch)
+            batch = []
+    if batch:
+        db.add_expenses(batch)
+    db.close()
+
+def legacy_details(db, user_id, start_date, end_date):
+    import pandas as pd
+    expenses = db.get_expenses_by_period(user_id, start_date, end_date)
+    if not expenses:
+        return None
+    df = pd.DataFrame(expenses, columns=["id", "user_id", "date", "amount", "category", "currency"])
+    total = df["amount"].sum()
+    category_sum = df.groupby("category")["amount"].sum()
+    analysis_details = f"Từ {start_date} đến {end_date}, tổng chi tiêu của bạn là {total:,.0f} đồng.\n"
+    if not category_sum.empty:
+        analysis_details += "Chi tiêu theo từng danh mục:\n"
+        for cat, amt in category_sum.items():
+            percentage = (amt / total * 100) if total > 0 else 0
+            analysis_details += f" - {cat}: {amt:,.0f} đồng ({percentage:.1f}%)\n"
+    analysis_details += "\nChưa có thông tin cá nhân để so sánh.\n"
+    return analysis_details
+
+def run_mode(mode, db_file, calls):
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    from database import Database
+    from spending_analysis import build_analysis_details, _period_range
+    if mode == "legacy":
+        import pandas  # noqa: F401
+    import_time = time.perf_counter() - start
+
+    db = Database(db_file)
+    start_date, end_date = _period_range("month")
+    if mode == "legacy":
+        run = lambda: legacy_details(db, USER_ID, start_date, end_date)
+    else:
+        run = lambda: build_analysis_details(db, USER_ID, "month")
+
+    text = run()
+    latencies = []
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        run()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+    return {
+        "mode": mode,
+        "import_s": round(import_time, 4),
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "rss_start_mb": round(rss_start / 1024, 1),
+        "rss_peak_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "text": text,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--mode", choices=["legacy", "sql"], help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.db, args.calls), ensure_ascii=False))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "bench.db")
+        seed(db_file, args.rows)
+        results = {}
+        for mode in ("legacy", "sql"):
+            proc = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_analysis", "--mode", mode, "--db", db_file, "--calls", str(args.calls)],
+                capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            )
+            if proc.returncode != 0:
+                print(f"[{mode}] bỏ qua: {proc.stderr.strip().splitlines()[-1]}")
+                continue
+            results[mode] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    for mode, r in results.items():
+        print(f"{mode:>6}: p50 {r['p50_ms']:.2f} ms, p95 {r['p95_ms']:.2f} ms, "
+              f"import {r['import_s']:.2f} s, peak RSS {r['rss_peak_mb']:.1f} MB")
+    if len(results) == 2:
+        same = results["legacy"]["text"] == results["sql"]["text"]
+        print("Kết quả văn bản giống nhau:", same)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"rows": args.rows, "results": results}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# benchmarks/bench_hotpaths.py
+"""
+Micro-benchmark cho các hàm nóng của bot, chạy offline với pipeline giả lập (benchmarks/stubs.py):
+extract_expense_info, extract_expense_items, convert_money_string_to_amount, extract_date, parse_profile_info,
+analyze_spending.
+
+Với mỗi kích thước database (--rows), bench tạo một file SQLite tổng hợp từ các tin nhắn chi tiêu
+tiếng Việt ngẫu nhiên (seed cố định), rồi đo độ trễ p50/p90/p99, throughput và bộ nhớ đỉnh
+(tracemalloc) của từng hàm. Kết quả ghi ra JSON để so sánh giữa các commit:
+    python -m benchmarks.bench_hotpaths --rows 10000 --output before.json
+    python -m benchmarks.bench_hotpaths --rows 10000 --output after.json --compare before.json
+
+Database đã seed được giữ lại trong --db-dir (mặc định benchmarks/.data) để các lần chạy sau
+không phải tạo lại; 1M và 10M dòng mất vài phút để seed lần đầu.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.stubs import CATEGORIES, install_stubs  # noqa: E402
+
+USER_ID = "bench-user"
+SEED_BATCH = 50000
+
+ITEMS = [
+    "ăn phở", "cà phê highlands", "trà sữa", "ăn trưa văn phòng", "đổ xăng", "grab đi làm",
+    "mua rau ở chợ", "siêu thị coopmart", "xem phim cgv", "tiền điện", "tiền nước", "tiền nhà",
+    "mua cổ phiếu", "gửi tiết kiệm", "mua áo shopee", "cắt tóc", "nạp điện thoại", "bánh mì",
+    "đi karaoke", "gửi xe", "ăn lẩu với bạn", "mua sách", "thuốc cảm", "vé xe buýt",
+]
+AMOUNTS = ["{n}k", "{n}.000 đồng", "{n}000", "{m} triệu", "{m}tr{d}", "${u}", "{n} nghìn", "{n},000 vnd"]
+DATES = ["", "hôm nay", "hôm qua", "hôm kia", "thứ 2 tuần trước", "ngày {day}/{month}", "3 ngày trước", "chủ nhật"]
+PROFILES = [
+    "/profile Tên: {name}, Thu nhập: {income:,} đồng, Ngân sách: {budget:,} đồng, "
+    "Mục tiêu tiết kiệm: {saving:,} đồng, Mục tiêu sử dụng: Tiêu dùng, Đầu tư, Tiết kiệm",
+    "/profile Tên: {name}, Thu nhập: {income:,} đồng, Ngân sách: {budget:,} đồng, Mục tiêu tiết kiệm: {saving:,} đồng",
+]
+NAMES = ["Huy", "Lan", "Minh Anh", "Tuấn", "Ngọc Hà", "Phương"]
+
+
+def make_message(rng):
+    amount = rng.choice(AMOUNTS).format(
+        n=rng.randint(10, 999), m=rng.randint(1, 20), d=rng.randint(1, 9), u=rng.randint(1, 200)
+    )
+    when = rng.choice(DATES).format(day=rng.randint(1, 28), month=rng.randint(1, 12))
+    parts = [rng.choice(ITEMS), amount, when]
+    if rng.random() < 0.2:
+        parts[0], parts[1] = parts[1], parts[0]
+    return " ".join(p for p in parts if p)
+
+
+def make_profile(rng):
+    income = rng.randint(5, 80) * 1_000_000
+    return rng.choice(PROFILES).format(
+        name=rng.choice(NAMES), income=income, budget=income * 7 // 10, saving=income // 5
+    )
+
+
+def seed(db_file, rows):
+    """Tạo database tổng hợp: người dùng ~1000 dòng, bench-user có dữ liệu trong tháng hiện tại."""
+    from database import Database
+    db = Database(db_file)
+    rng = random.Random(42)
+    today = datetime.now()
+    users = max(1, rows // 1000)
+    batch = []
+    for i in range(rows):
+        user_id = USER_ID if i % users == 0 else f"user-{i % users}"
+        day = (today - timedelta(days=rng.randint(0, 365))).strftime("%Y-%m-%d")
+        batch.append((user_id, day, rng.randint(1, 500) * 1000.0, rng.choice(CATEGORIES), "VND"))
+        if len(batch) >= SEED_BATCH:
+            db.add_expenses(batch)
+            batch = []
+            print(f"\r  seed {i + 1:,}/{rows:,}", end="", file=sys.stderr)
+    if batch:
+        db.add_expenses(batch)
+    db.add_profile(USER_ID, "Bench", 30_000_000, 20_000_000, 5_000_000, "Tiêu dùng, Tiết kiệm")
+    db.close()
+    print(file=sys.stderr)
+
+
+def percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(func, inputs, iterations, memory_iterations):
+    """Đo độ trễ (không bật tracemalloc) rồi đo bộ nhớ đỉnh trong một lượt chạy ngắn riêng."""
+    for args in inputs[:10]:
+        func(*args)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        func(*inputs[i % len(inputs)])
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    tracemalloc.start()
+    for i in range(memory_iterations):
+        func(*inputs[i % len(inputs)])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "calls": iterations,
+        "p50_ms": round(percentile(latencies, 50), 4),
+        "p90_ms": round(percentile(latencies, 90), 4),
+        "p99_ms": round(percentile(latencies, 99), 4),
+        "max_ms": round(latencies[-1], 4),
+        "mean_ms": round(sum(latencies) / len(latencies), 4),
+        "throughput_per_s": round(iterations / elapsed, 1),
+        "peak_alloc_kb": round(peak / 1024, 1),
+    }
+
+
+def nlp_cases(rng, samples):
+    from nlp_processor import (
+        extract_expense_info, extract_expense_items, convert_money_string_to_amount, extract_date, parse_profile_info
+    )
+    messages = [make_message(rng) for _ in range(samples)]
+    # Tin nhắn dán cả ngày: ba khoản chi, mỗi dòng một khoản
+    pasted = ["\n".join(make_message(rng) for _ in range(3)) for _ in range(samples)]
+    money = [rng.choice(AMOUNTS).format(n=rng.randint(10, 999), m=rng.randint(1, 20), d=5, u=rng.randint(1, 200))
+             for _ in range(samples)]
+    return {
+        "extract_expense_info": (extract_expense_info, [(m,) for m in messages]),
+        "extract_expense_items_x3": (extract_expense_items, [(m,) for m in pasted]),
+        "convert_money_string_to_amount": (convert_money_string_to_amount, [(m,) for m in money]),
+        "extract_date": (extract_date, [(m,) for m in messages]),
+        "parse_profile_info": (parse_profile_info, [(make_profile(rng),) for _ in range(samples)]),
+    }
+
+
+def analysis_cases():
+    from spending_analysis import analyze_spending, commentary_cache
+
+    def analyze_uncached(user_id, period):
+        # Xóa cache nhận xét để đo toàn bộ đường đi: truy vấn, dựng prompt, gọi pipeline
+        commentary_cache.clear()
+        return analyze_spending(user_id, period)
+
+    return {
+        "analyze_spending": (analyze_uncached, [(USER_ID, "month"), (USER_ID, "week")]),
+        "analyze_spending_cached": (analyze_spending, [(USER_ID, "month"), (USER_ID, "week")]),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_table(results, baseline=None):
+    for scope, cases in results.items():
+        print(f"\n[{scope}]")
+        for name, r in cases.items():
+            line = (f"  {name:<32} p50 {r['p50_ms']:>9.3f} ms  p99 {r['p99_ms']:>9.3f} ms  "
+                    f"{r['throughput_per_s']:>10,.0f}/s  peak {r['peak_alloc_kb']:>8.1f} KB")
+            base = (baseline or {}).get(scope, {}).get(name)
+            if base and base["p50_ms"]:
+                line += f"  (p50 {(r['p50_ms'] / base['p50_ms'] - 1) * 100:+.1f}%)"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10000", help="Các kích thước database, ví dụ 10000,1000000,10000000")
+    parser.add_argument("--iterations", type=int, default=2000, help="Số lần gọi mỗi hàm NLP")
+    parser.add_argument("--analysis-iterations", type=int, default=200, help="Số lần gọi analyze_spending")
+    parser.add_argument("--samples", type=int, default=500, help="Số tin nhắn khác nhau được sinh")
+    parser.add_argument("--stub-delay-ms", type=float, default=0.0, help="Giả lập thời gian suy luận của mô hình")
+    parser.add_argument("--db-dir", default=os.path.join(ROOT, "benchmarks", ".data"))
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    parser.add_argument("--compare", help="File JSON của lần chạy trước để so sánh")
+    args = parser.parse_args()
+
+    install_stubs(args.stub_delay_ms)
+    rng = random.Random(7)
+    results = {}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, (func, inputs) in nlp_cases(rng, args.samples).items():
+            results.setdefault("nlp", {})[name] = measure(func, inputs, args.iterations, min(args.iterations, 200))
+
+    sizes = [int(size) for size in args.rows.split(",") if size]
+    for rows in sizes:
+        # analyze_spending dùng get_database() mặc định (expenses.db) trong thư mục hiện tại
+        workdir = os.path.join(args.db_dir, str(rows))
+        os.makedirs(workdir, exist_ok=True)
+        db_file = os.path.join(workdir, "expenses.db")
+        if not os.path.exists(db_file):
+            print(f"Tạo database {rows:,} dòng tại {db_file}", file=sys.stderr)
+            seed(db_file, rows)
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                for name, (func, inputs) in analysis_cases().items():
+                    results.setdefault(f"db_{rows}", {})[name] = measure(
+                        func, inputs, args.analysis_iterations, min(args.analysis_iterations, 50)
+                    )
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "stub_delay_ms": args.stub_delay_ms,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "results": results,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print_table(results, baseline)
+    print(f"\nPeak RSS: {report['peak_rss_mb']} MB")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# benchmarks/bench_prefix_cache.py
+"""
+Đo thời gian đến token đầu tiên (TTFT) của nhận xét chi tiêu với mô hình sinh text thật:
+- legacy: bố cục prompt cũ (số liệu đầy đủ trước, hướng dẫn sau), prefill toàn bộ mỗi lần
+- full:   bố cục mới (hướng dẫn cố định trước, số liệu rút gọn sau), vẫn prefill toàn bộ
+- prefix: bố cục mới, dùng lại KV-cache của phần hướng dẫn, chỉ prefill phần số liệu
+
+TTFT đo bằng generate(max_new_tokens=1) (greedy), gồm cả tokenize và sao chép cache.
+Cần torch và model (mặc định GEN_MODEL trong .env):
+    python -m benchmarks.bench_prefix_cache --model Qwen/Qwen2.5-0.5B-Instruct --calls 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_hotpaths import NAMES, percentile  # noqa: E402
+from benchmarks.stubs import CATEGORIES  # noqa: E402
+
+LEGACY_INSTRUCTIONS = (
+    "Dựa trên các số liệu và thông tin cá nhân trên, hãy đưa ra nhận xét và lời khuyên cải thiện cách chi tiêu của bạn một cách tự nhiên, "
+    "có cảm xúc và phù hợp với hoàn cảnh. Ví dụ:\n"
+    "- Nếu chi tiêu vượt ngân sách, cảnh báo nhẹ nhàng và đề xuất giảm các khoản chi không cần thiết.\n"
+    "- Nếu một danh mục chi tiêu quá cao, gợi ý tối ưu hóa hoặc cắt giảm.\n"
+    "- Nếu chi tiêu ổn định, khen ngợi và động viên tiếp tục duy trì.\n"
+)
+
+
+def make_data(rng):
+    """Số liệu tổng hợp ngẫu nhiên cho một người dùng: (SpendingSummary, profile)."""
+    from database import Profile, SpendingSummary
+    by_category = tuple(sorted(
+        (category, rng.randint(1, 400) * 10000.0) for category in rng.sample(CATEGORIES, rng.randint(2, len(CATEGORIES)))
+    ))
+    summary = SpendingSummary("2026-10-01", "2026-10-31", sum(amount for _, amount in by_category), by_category)
+    profile = None
+    if rng.random() < 0.8:
+        income = rng.randint(5, 80) * 1_000_000
+        profile = Profile(rng.choice(NAMES), income, income * 0.7, income * 0.2, "Tiêu dùng, Tiết kiệm")
+    return summary, profile
+
+
+def load_model(model_id):
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(model_id, trust_remote_code=True)
+    model = AutoModelForCausalLM.from_pretrained(model_id, trust_remote_code=True)
+    model.eval()
+    return model, tokenizer
+
+
+def run(model, tokenizer, datasets, mode):
+    import torch
+    from spending_analysis import (
+        PROMPT_PREFIX, format_analysis_details, prompt_details_ids, build_prompt, format_prompt_details, prefix_cache
+    )
+    latencies, prompt_tokens, first_tokens = [], [], []
+    for summary, profile in datasets:
+        start = time.perf_counter()
+        if mode == "prefix":
+            inputs = prefix_cache.inputs(model, tokenizer, prompt_details_ids(tokenizer, summary, profile))
+            if inputs is None:
+                raise SystemExit("Model không hỗ trợ dùng lại KV-cache")
+            uncached = inputs["input_ids"].shape[-1] - prefix_cache.prefix_tokens
+        else:
+            if mode == "legacy":
+                prompt = f"{format_analysis_details(summary, profile)}\n{LEGACY_INSTRUCTIONS}"
+            else:
+                prompt = build_prompt(format_prompt_details(summary, profile))
+            inputs = dict(tokenizer(prompt, return_tensors="pt"))
+            uncached = inputs["input_ids"].shape[-1]
+        with torch.no_grad():
+            output = model.generate(**inputs, max_new_tokens=1, do_sample=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+        prompt_tokens.append(uncached)
+        first_tokens.append(int(output[0][-1]))
+    latencies.sort()
+    return {
+        "mode": mode,
+        "calls": len(datasets),
+        "ttft_p50_ms": round(percentile(latencies, 50), 2),
+        "ttft_p95_ms": round(percentile(latencies, 95), 2),
+        "ttft_mean_ms": round(sum(latencies) / len(latencies), 2),
+        "prefilled_tokens_avg": round(sum(prompt_tokens) / len(prompt_tokens), 1),
+        "prefix_tokens": prefix_cache.prefix_tokens if mode == "prefix" else 0,
+    }, first_tokens
+
+
+def main():
+    from config import GEN_MODEL
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=GEN_MODEL)
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=0, help="torch.set_num_threads (0 = mặc định)")
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+    if not args.model:
+        parser.error("Cần --model hoặc GEN_MODEL trong .env")
+
+    import torch
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model, tokenizer = load_model(args.model)
+    rng = random.Random(5)
+    datasets = [make_data(rng) for _ in range(args.calls)]
+
+    from spending_analysis import prefix_cache
+    start = time.perf_counter()
+    prefix_cache.prime(model, tokenizer)
+    print(f"Prefill prefix {prefix_cache.prefix_tokens} token: {(time.perf_counter() - start) * 1000:.1f} ms (một lần mỗi process)")
+
+    results = []
+    first_tokens = {}
+    for mode in ("legacy", "full", "prefix"):
+        run(model, tokenizer, datasets[:3], mode)  # warm-up
+        result, first_tokens[mode] = run(model, tokenizer, datasets, mode)
+        results.append(result)
+        print(f"{mode:>7}: TTFT p50 {result['ttft_p50_ms']:>8.1f} ms  p95 {result['ttft_p95_ms']:>8.1f} ms  "
+              f"prefill {result['prefilled_tokens_avg']:>6.1f} token")
+    # Cùng prompt nên token đầu (greedy) của full và prefix phải trùng nhau
+    agreement = sum(a == b for a, b in zip(first_tokens["full"], first_tokens["prefix"])) / len(datasets)
+    print(f"Token đầu trùng giữa full và prefix: {agreement:.0%}")
+    print(f"TTFT p50 prefix so với legacy: x{results[0]['ttft_p50_ms'] / results[2]['ttft_p50_ms']:.2f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "results": results, "first_token_agreement": agreement}, f,
+                      ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/bench_workers.py
+"""
+Đo khả năng mở rộng của chế độ nhiều worker: chia các tin nhắn tổng hợp theo crc32(user_id)
+như supervisor rồi cho mỗi worker process chạy extract_expense_info (pipeline giả lập) trên shard
+của mình. In throughput tổng và hệ số tăng tốc so với 1 worker:
+    python -m benchmarks.bench_workers --messages 20000 --workers 1,2,4
+Hệ số chỉ có ý nghĩa khi máy có ít nhất từng ấy core.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_hotpaths import make_message  # noqa: E402
+from supervisor import shard_for  # noqa: E402
+
+
+def _worker(shard, start_event, result_queue):
+    import contextlib
+    import io
+    from benchmarks.stubs import install_stubs
+    from nlp_processor import extract_expense_info
+    install_stubs()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for user_id, text in shard[:50]:
+            extract_expense_info(text)
+        start_event.wait()
+        start = time.perf_counter()
+        for user_id, text in shard:
+            extract_expense_info(text)
+    result_queue.put((len(shard), time.perf_counter() - start))
+
+
+def run(workers, messages):
+    ctx = mp.get_context("spawn")
+    shards = [[] for _ in range(workers)]
+    for user_id, text in messages:
+        shards[shard_for(user_id, workers)].append((user_id, text))
+    start_event = ctx.Event()
+    result_queue = ctx.Queue()
+    processes = [ctx.Process(target=_worker, args=(shard, start_event, result_queue)) for shard in shards]
+    for process in processes:
+        process.start()
+    time.sleep(1)  # chờ các worker import xong
+    start = time.perf_counter()
+    start_event.set()
+    results = [result_queue.get() for _ in processes]
+    wall = time.perf_counter() - start
+    for process in processes:
+        process.join()
+    return {
+        "workers": workers,
+        "messages": len(messages),
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(messages) / wall, 1),
+        "shard_sizes": [count for count, _ in results],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    messages = [(rng.randrange(args.users), make_message(rng)) for _ in range(args.messages)]
+    results = []
+    for workers in (int(n) for n in args.workers.split(",")):
+        result = run(workers, messages)
+        result["speedup"] = round(result["throughput_per_s"] / results[0]["throughput_per_s"], 2) if results else 1.0
+        results.append(result)
+        print(f"{workers:>2} worker: {result['throughput_per_s']:>10,.0f} tin/s, x{result['speedup']:.2f}, "
+              f"shard {min(result['shard_sizes'])}-{max(result['shard_sizes'])}")
+    print(f"CPU: {os.cpu_count()}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"cpu_count": os.cpu_count(), "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
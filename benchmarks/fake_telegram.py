@@ -0,0 +1,400 @@
+# benchmarks/fake_telegram.py
+"""
+Bot API giả lập chạy trên máy (không cần mạng), để chạy bot thật với pipeline giả lập và thử tải offline.
+Hỗ trợ các method bot dùng: getMe, sendMessage, editMessageText, answerCallbackQuery, getUpdates
+(long-poll), setWebhook / deleteWebhook; các method khác trả về True.
+
+Bắn update tổng hợp vào chế độ webhook (fake API và bot được khởi động tự động, bot chạy trong thư mục tạm):
+    python -m benchmarks.fake_telegram flood --updates 20000 --users 5000 --connections 40
+Chỉ chạy fake API, rồi trỏ bot tới nó bằng TELEGRAM_BASE_URL=http://127.0.0.1:8765/bot:
+    python -m benchmarks.fake_telegram serve --port 8765
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+FAKE_TOKEN = "123456:FAKE"
+
+
+def make_user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+def make_update(update_id, user_id, text=None, callback_data=None, message_id=None):
+    """Update tin nhắn riêng (`text`) hoặc callback query (`callback_data`) của người dùng `user_id`."""
+    chat = {"id": user_id, "type": "private"}
+    if callback_data is not None:
+        message = {"message_id": message_id or 1, "date": int(time.time()), "chat": chat, "from": BOT_USER, "text": "..."}
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id), "from": make_user(user_id), "chat_instance": str(user_id),
+                "data": callback_data, "message": message,
+            },
+        }
+    message = {
+        "message_id": message_id or update_id, "date": int(time.time()), "chat": chat,
+        "from": make_user(user_id), "text": text,
+    }
+    if text.startswith("/"):
+        # CommandHandler chỉ nhận tin nhắn có entity bot_command ở đầu
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+class FakeTelegram:
+    """
+    Server Bot API giả lập. `on_call(method, params)` (nếu có) được gọi với mọi request, từ thread của server.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, on_call=None):
+        self.on_call = on_call
+        self.calls = Counter()
+        self.webhook = None
+        self._message_ids = itertools.count(1)
+        self._updates = deque()
+        self._updates_changed = threading.Condition()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class(), bind_and_activate=False)
+        self.server.daemon_threads = True
+        # Bot mở nhiều kết nối cùng lúc khi tải cao; backlog mặc định (5) làm kết nối bị từ chối
+        self.server.request_queue_size = 1024
+        self.server.server_bind()
+        self.server.server_activate()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-telegram", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def push_update(self, update):
+        """Đưa update vào hàng đợi cho getUpdates (chế độ polling)."""
+        with self._updates_changed:
+            self._updates.append(update)
+            self._updates_changed.notify_all()
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        deadline = time.monotonic() + timeout
+        with self._updates_changed:
+            while self._updates and self._updates[0]["update_id"] < offset:
+                self._updates.popleft()
+            while not self._updates and time.monotonic() < deadline:
+                self._updates_changed.wait(deadline - time.monotonic())
+            return list(itertools.islice(self._updates, limit))
+
+    def result(self, method, params):
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return self._get_updates(params)
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id") or 0)
+            message_id = int(params["message_id"]) if method == "editMessageText" else next(self._message_ids)
+            return {
+                "message_id": message_id, "date": int(time.time()), "from": BOT_USER,
+                "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", ""),
+            }
+        if method == "setWebhook":
+            self.webhook = (params.get("url"), params.get("secret_token"))
+        elif method == "deleteWebhook":
+            self.webhook = None
+        elif method == "getWebhookInfo":
+            return {"url": self.webhook[0] if self.webhook else "", "has_custom_certificate": False,
+                    "pending_update_count": 0}
+        return True
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                method = self.path.rsplit("/", 1)[-1]
+                params = _parse_params(self.headers.get("Content-Type", ""), body)
+                with api._lock:
+                    api.calls[method] += 1
+                if api.on_call is not None:
+                    api.on_call(method, params)
+                payload = json.dumps({"ok": True, "result": api.result(method, params)}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _parse_params(content_type, body):
+    if not body:
+        return {}
+    if "json" in content_type:
+        return json.loads(body)
+    # python-telegram-bot gửi form-urlencoded, giá trị không phải chuỗi được mã hóa JSON
+    params = {}
+    for key, value in parse_qsl(body.decode("utf-8")):
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+def start_bot(api, workdir, mode="webhook", port=None, secret="load-test", delay_ms=0.0, workers=0, metrics_port=0,
+              env=None, log=None):
+    """
+    Chạy bot (main.py với pipeline giả lập, `workers` > 0 là chế độ supervisor) trong `workdir`, trỏ tới `api`.
+    `log` là file nhận stderr của bot (mặc định in ra stderr). Trả về (process, webhook_url).
+    """
+    port = port or _free_port()
+    bot_env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        TELEGRAM_TOKEN=FAKE_TOKEN,
+        TELEGRAM_BASE_URL=api.base_url,
+        WEBHOOK_LISTEN="127.0.0.1",
+        WEBHOOK_PORT=str(port),
+        WEBHOOK_SECRET=secret,
+        WEBHOOK_URL="",
+        WORKER_PROCESSES=str(workers),
+        METRICS_PORT=str(metrics_port),
+        # Streaming cần tokenizer của model thật, pipeline giả lập chỉ hỗ trợ sinh text một lần
+        STREAM_COMMENTARY="0",
+        **(env or {}),
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_telegram", "bot", "--mode", mode, "--delay-ms", str(delay_ms),
+         "--workers", str(workers)],
+        cwd=workdir, env=bot_env, stdout=subprocess.DEVNULL, stderr=log,
+    )
+    url = f"http://127.0.0.1:{port}/telegram"
+    if mode == "webhook":
+        _wait_for_port(port, process)
+    return process, url
+
+
+def stop_bot(process, timeout=30):
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def _free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port, process, timeout=60):
+    import socket
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Bot đã thoát với mã {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit("Bot không mở cổng webhook kịp")
+
+
+class WebhookSender:
+    """
+    Gửi update tới webhook như Telegram: mỗi kết nối keep-alive gửi tuần tự, update bị từ chối
+    (429 / 503 / lỗi kết nối) được gửi lại sau một khoảng chờ tăng dần.
+    """
+
+    def __init__(self, url, secret, max_retries=20):
+        address = url.split("://", 1)[1]
+        host_port, _, path = address.partition("/")
+        self.host, _, port = host_port.partition(":")
+        self.port = int(port or 80)
+        self.path = "/" + path
+        self.secret = secret
+        self.max_retries = max_retries
+        self.statuses = Counter()
+        self.latencies = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def send_all(self, updates, connections):
+        """Gửi `updates` qua `connections` kết nối song song, chặn cho đến khi gửi xong."""
+        pending = deque(updates)
+        threads = [threading.Thread(target=self._worker, args=(pending,)) for _ in range(connections)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _worker(self, pending):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        headers = {"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": self.secret}
+        while True:
+            try:
+                update = pending.popleft()
+            except IndexError:
+                break
+            body = json.dumps(update).encode("utf-8")
+            for attempt in range(self.max_retries + 1):
+                start = time.perf_counter()
+                try:
+                    conn.request("POST", self.path, body, headers)
+                    response = conn.getresponse()
+                    response.read()
+                    status = response.status
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                    status = 0
+                with self._lock:
+                    self.statuses[status] += 1
+                    self.latencies.append(time.perf_counter() - start)
+                if status == 200:
+                    break
+                if status not in (0, 429, 503):
+                    break
+                time.sleep(min(0.05 * 2 ** attempt, 2.0))
+            else:
+                with self._lock:
+                    self.dropped += 1
+        conn.close()
+
+    def send(self, update):
+        """Gửi một update (không thử lại), trả về mã trạng thái."""
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        headers = {"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": self.secret}
+        try:
+            conn.request("POST", self.path, json.dumps(update).encode("utf-8"), headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        finally:
+            conn.close()
+
+
+def _stub_worker(delay_ms, *args):
+    """Worker process của supervisor, dùng pipeline giả lập (worker spawn không thừa hưởng registry của cha)."""
+    from benchmarks.stubs import install_stubs
+    import supervisor
+    install_stubs(delay_ms)
+    supervisor.run_worker(*args)
+
+
+def run_bot(args):
+    from benchmarks.stubs import install_stubs
+    install_stubs(args.delay_ms)
+    if args.workers:
+        import functools
+        import supervisor
+        # Lấy hàm qua tên module (không phải __main__) để worker spawn unpickle được
+        from benchmarks.fake_telegram import _stub_worker as stub_worker
+        # start_worker tra run_worker lúc khởi động từng worker
+        supervisor.run_worker = functools.partial(stub_worker, args.delay_ms)
+    import main as bot_main
+    sys.argv = ["main.py", "--mode", args.mode, "--workers", str(args.workers)]
+    bot_main.main()
+
+
+def flood(args):
+    from benchmarks.bench_hotpaths import make_message, percentile
+    rng = random.Random(7)
+    updates = [make_update(i + 1, 1000 + rng.randrange(args.users), make_message(rng)) for i in range(args.updates)]
+    replies = threading.Semaphore(0)
+    api = FakeTelegram(on_call=lambda method, params: method == "sendMessage" and replies.release()).start()
+    env = {"WEBHOOK_MAX_PENDING": str(args.max_pending)} if args.max_pending else None
+    with tempfile.TemporaryDirectory() as workdir:
+        process, url = start_bot(api, workdir, delay_ms=args.delay_ms, env=env)
+        try:
+            sender = WebhookSender(url, "load-test")
+            print("Sai secret token:", WebhookSender(url, "wrong").send(make_update(0, 1, "/start")))
+            start = time.perf_counter()
+            sender.send_all(updates, args.connections)
+            accepted = time.perf_counter() - start
+            answered = 0
+            while answered < args.updates - sender.dropped and replies.acquire(timeout=args.drain_timeout):
+                answered += 1
+            wall = time.perf_counter() - start
+        finally:
+            stop_bot(process)
+            api.stop()
+    latencies = sorted(sender.latencies)
+    print(f"{args.updates:,} update, {args.connections} kết nối: nhận xong sau {accepted:.1f}s, "
+          f"trả lời {answered:,} sau {wall:.1f}s ({answered / wall:,.0f} update/s)")
+    print("Mã trạng thái:", dict(sorted(sender.statuses.items())), f"bỏ sau {sender.max_retries} lần thử: {sender.dropped}")
+    print(f"Thời gian phản hồi webhook: p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p95 {percentile(latencies, 95) * 1000:.1f} ms, p99 {percentile(latencies, 99) * 1000:.1f} ms")
+
+
+def serve(args):
+    api = FakeTelegram(args.host, args.port)
+    print(f"Fake Bot API: TELEGRAM_BASE_URL={api.base_url}")
+    try:
+        api.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print("Số lần gọi:", dict(api.calls))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="Chạy fake Bot API")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    bot_parser = commands.add_parser("bot", help="Chạy bot với pipeline giả lập (cấu hình qua biến môi trường)")
+    bot_parser.add_argument("--mode", choices=["polling", "webhook"], default="webhook")
+    bot_parser.add_argument("--delay-ms", type=float, default=0.0, help="Thời gian suy luận giả lập mỗi lần gọi model")
+    bot_parser.add_argument("--workers", type=int, default=0, help="Số worker process (0 = một process)")
+    flood_parser = commands.add_parser("flood", help="Bắn update tổng hợp vào bot chạy chế độ webhook")
+    flood_parser.add_argument("--updates", type=int, default=20000)
+    flood_parser.add_argument("--users", type=int, default=5000)
+    flood_parser.add_argument("--connections", type=int, default=40)
+    flood_parser.add_argument("--max-pending", type=int, default=0, help="WEBHOOK_MAX_PENDING của bot (0 = mặc định)")
+    flood_parser.add_argument("--delay-ms", type=float, default=0.0)
+    flood_parser.add_argument("--drain-timeout", type=float, default=30.0, help="Số giây chờ tối đa giữa hai câu trả lời")
+    args = parser.parse_args()
+    {"serve": serve, "bot": run_bot, "flood": flood}[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,447 @@
+# benchmarks/load_test.py
+"""
+Thử tải end-to-end offline: chạy bot thật (setup_dispatcher, Database, NLP, phân tích) với pipeline giả lập,
+trỏ tới Bot API giả lập (benchmarks/fake_telegram.py), rồi cho hàng nghìn người dùng ảo cùng chat.
+
+Mỗi người dùng ảo gửi một lệnh, chờ câu trả lời, nghỉ (phân phối mũ, trung bình --think-time giây) rồi gửi
+lệnh tiếp theo, chọn theo tỷ lệ --mix. Độ trễ end-to-end tính từ lúc gửi update (kể cả các lần Telegram
+gửi lại khi nhận 429/503) đến khi bot gửi câu trả lời cuối cho lệnh đó:
+- expense / expense_multi: tin xác nhận "Đã lưu ..." (các tin cảnh báo trước đó không tính)
+- report_month: trang báo cáo; report_page: editMessageText khi bấm nút "Chi tiết"
+- review: tin nhận xét (STREAM_COMMENTARY=0 vì pipeline giả lập không stream được)
+Nhận xét tự động sau khi nhập chi tiêu (debounce) được đếm riêng, không tính vào lệnh nào.
+
+Kết quả gồm phân vị độ trễ và tỷ lệ lỗi theo lệnh, mã trạng thái webhook, thời gian chờ khóa ghi SQLite
+(bot_db_lock_wait_seconds) và số lần hết busy_timeout, đọc từ endpoint /metrics của bot (và từng worker).
+
+    python -m benchmarks.load_test --users 5000 --duration 60 --think-time 30
+    python -m benchmarks.load_test --mix expense=60,review=20,report_month=20 --workers 4 --mode webhook
+    python -m benchmarks.load_test --env CONCURRENT_UPDATES=16 --env INGEST_BATCH_MS=50 --output load.json
+Bot chạy trong thư mục tạm với database mới, được seed --seed-expenses khoản chi tháng này cho mỗi người dùng.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_hotpaths import make_message, percentile  # noqa: E402
+from benchmarks.fake_telegram import FakeTelegram, make_update, start_bot, stop_bot, _free_port  # noqa: E402
+from benchmarks.stubs import CATEGORIES  # noqa: E402
+
+DEFAULT_MIX = "expense=70,expense_multi=10,report_month=10,report_page=5,review=5"
+COMMANDS = ("expense", "expense_multi", "report_month", "report_page", "review")
+FIRST_USER_ID = 100000
+SECRET = "load-test"
+
+# Tiền tố các tin bot gửi, dùng để ghép câu trả lời với lệnh đang chờ của từng chat
+WARNING_PREFIXES = ("❗", "⚠️", "📉")
+AUTO_REVIEW_PREFIXES = ("Từ ", "Không có dữ liệu chi tiêu")
+FAILURE_PREFIXES = ("Không thể", "Không nhận ra", "Xin lỗi")
+
+METRIC_LINE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+METRIC_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in COMMANDS:
+            raise argparse.ArgumentTypeError(f"Lệnh không hỗ trợ: {name} (chọn trong {', '.join(COMMANDS)})")
+        mix[name] = float(weight or 1)
+    if not sum(mix.values()) > 0:
+        raise argparse.ArgumentTypeError("Tổng tỷ lệ phải lớn hơn 0")
+    return mix
+
+
+def seed(db_file, users, expenses_per_user, profile_share, rng):
+    """Database ban đầu: mỗi người dùng có `expenses_per_user` khoản chi trong tháng này, một phần có hồ sơ."""
+    from database import Database
+    db = Database(db_file)
+    today = datetime.now()
+    month_start = today.replace(day=1)
+    batch, user_rows = [], []
+    for user_id in range(FIRST_USER_ID, FIRST_USER_ID + users):
+        user_rows.append((str(user_id), str(user_id)))
+        for _ in range(expenses_per_user):
+            day = month_start + timedelta(days=rng.randint(0, today.day - 1))
+            batch.append((str(user_id), day.strftime("%Y-%m-%d"), rng.randint(1, 500) * 1000.0, rng.choice(CATEGORIES), "VND"))
+        if len(batch) >= 20000:
+            db.write_batch(expenses=batch, users=user_rows)
+            batch, user_rows = [], []
+        if rng.random() < profile_share:
+            income = rng.randint(5, 80) * 1_000_000
+            db.add_profile(str(user_id), f"user{user_id}", income, income * 0.7, income * 0.2, "Tiêu dùng, Tiết kiệm")
+    db.write_batch(expenses=batch, users=user_rows)
+    db.close()
+
+
+class LoadTest:
+    def __init__(self, args, api, webhook_url):
+        self.args = args
+        self.api = api
+        self.rng = random.Random(args.seed)
+        self.commands = list(args.mix)
+        self.weights = [args.mix[name] for name in self.commands]
+        host_port = webhook_url.split("://", 1)[1].split("/", 1)[0]
+        self.host, port = host_port.split(":")
+        self.port = int(port)
+        self.path = "/" + webhook_url.split("://", 1)[1].split("/", 1)[1]
+        self.month_start = datetime.now().replace(day=1).strftime("%Y-%m-%d")
+        self.update_ids = iter(range(1, 1 << 62))
+        self.pending = {}
+        self.latencies = defaultdict(list)
+        self.outcomes = defaultdict(Counter)
+        self.webhook_statuses = Counter()
+        self.background = Counter()
+        self.loop = None
+        self.connections = None
+
+    # --- Phía fake Bot API (thread của HTTP server) ---
+
+    def on_call(self, method, params):
+        if method not in ("sendMessage", "editMessageText"):
+            return
+        try:
+            self.loop.call_soon_threadsafe(
+                self._on_reply, method, int(params.get("chat_id") or 0), params.get("text", ""), time.perf_counter()
+            )
+        except RuntimeError:
+            pass  # Đã hết thời gian đo, vòng lặp đã đóng; nhận xét tự động gửi muộn bị bỏ qua
+
+    def _on_reply(self, method, chat_id, text, at):
+        if method == "sendMessage" and text.startswith(AUTO_REVIEW_PREFIXES):
+            self.background["auto_review"] += 1
+            return
+        pending = self.pending.get(chat_id)
+        if pending is None:
+            self.background["unmatched"] += 1
+            return
+        command, future = pending
+        if (command == "report_page") != (method == "editMessageText"):
+            self.background["unmatched"] += 1
+            return
+        if command.startswith("expense") and text.startswith(WARNING_PREFIXES):
+            self.background["warning"] += 1
+            return
+        if not future.done():
+            future.set_result((at, "failed" if text.startswith(FAILURE_PREFIXES) else "ok"))
+
+    # --- Gửi update ---
+
+    def make_request(self, user_id, command):
+        update_id = next(self.update_ids)
+        if command == "expense":
+            return make_update(update_id, user_id, make_message(self.rng))
+        if command == "expense_multi":
+            lines = [make_message(self.rng) for _ in range(self.rng.randint(2, 4))]
+            return make_update(update_id, user_id, "\n".join(lines))
+        if command == "report_page":
+            return make_update(update_id, user_id, callback_data=f"rp:m:{self.month_start}:d:n:::0")
+        return make_update(update_id, user_id, f"/{command}")
+
+    async def _post(self, body):
+        """POST một update qua một kết nối keep-alive trong pool; trả về mã trạng thái (0 nếu lỗi kết nối)."""
+        conn = await self.connections.get()
+        try:
+            if conn is None:
+                conn = await asyncio.open_connection(self.host, self.port)
+            reader, writer = conn
+            writer.write(
+                f"POST {self.path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                f"X-Telegram-Bot-Api-Secret-Token: {SECRET}\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1")
+                + body
+            )
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            if length:
+                await reader.readexactly(length)
+            if headers.get("connection", "").lower() == "close":
+                writer.close()
+                conn = None
+            return status
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+            if conn is not None:
+                conn[1].close()
+            conn = None
+            return 0
+        finally:
+            self.connections.put_nowait(conn)
+
+    async def deliver(self, update):
+        """Giao update cho bot; webhook thì gửi lại khi 429 / 503 / lỗi kết nối như Telegram. Trả về True nếu bot đã nhận."""
+        if self.args.mode == "polling":
+            self.api.push_update(update)
+            return True
+        body = json.dumps(update).encode("utf-8")
+        for attempt in range(self.args.max_retries + 1):
+            status = await self._post(body)
+            self.webhook_statuses[status] += 1
+            if status == 200:
+                return True
+            if status not in (0, 429, 503):
+                return False
+            await asyncio.sleep(min(0.05 * 2 ** attempt, 2.0))
+        return False
+
+    # --- Người dùng ảo ---
+
+    async def user_session(self, user_id, deadline):
+        rng = random.Random(self.args.seed * 1_000_003 + user_id)
+        # Giãn thời điểm bắt đầu để không dồn toàn bộ người dùng vào giây đầu
+        await asyncio.sleep(min(rng.uniform(0, self.args.think_time), self.args.duration))
+        while time.monotonic() < deadline:
+            command = rng.choices(self.commands, self.weights)[0]
+            update = self.make_request(user_id, command)
+            future = self.loop.create_future()
+            self.pending[user_id] = (command, future)
+            sent_at = time.perf_counter()
+            try:
+                if not await self.deliver(update):
+                    self.outcomes[command]["dropped"] += 1
+                    continue
+                try:
+                    answered_at, outcome = await asyncio.wait_for(future, self.args.timeout)
+                except asyncio.TimeoutError:
+                    self.outcomes[command]["timeout"] += 1
+                    continue
+                self.outcomes[command][outcome] += 1
+                self.latencies[command].append(answered_at - sent_at)
+            finally:
+                self.pending.pop(user_id, None)
+                pause = rng.expovariate(1 / self.args.think_time)
+                await asyncio.sleep(min(pause, max(0.0, deadline - time.monotonic())))
+
+    async def progress(self, started):
+        while True:
+            await asyncio.sleep(10)
+            done = sum(sum(outcomes.values()) for outcomes in self.outcomes.values())
+            print(f"  {time.perf_counter() - started:5.0f}s: {done:,} lệnh xong, {len(self.pending):,} đang chờ", file=sys.stderr)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.connections = asyncio.Queue()
+        for _ in range(self.args.connections):
+            self.connections.put_nowait(None)
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.args.duration
+        reporter = asyncio.create_task(self.progress(started))
+        users = range(FIRST_USER_ID, FIRST_USER_ID + self.args.users)
+        await asyncio.gather(*(self.user_session(user_id, deadline) for user_id in users))
+        reporter.cancel()
+        while not self.connections.empty():
+            conn = self.connections.get_nowait()
+            if conn is not None:
+                conn[1].close()
+        return time.perf_counter() - started
+
+
+# --- Đọc metrics của bot ---
+
+def scrape(ports):
+    """Gộp các mẫu /metrics của nhiều process: {(tên, labels): giá trị}."""
+    samples = Counter()
+    for port in ports:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+                text = response.read().decode("utf-8")
+        except OSError:
+            continue
+        for line in text.splitlines():
+            match = METRIC_LINE.match(line)
+            if not match:
+                continue
+            name, labels, value = match.groups()
+            key = tuple(sorted(METRIC_LABEL.findall(labels or "")))
+            samples[(name, key)] += float(value)
+    return samples
+
+
+def histogram_summary(samples, name, group_label):
+    """{giá trị group_label: (count, sum, p95, p99)} từ các bucket tích lũy (phân vị nội suy trong bucket)."""
+    buckets = defaultdict(list)
+    totals = defaultdict(lambda: [0.0, 0.0])
+    for (metric, labels), value in samples.items():
+        labels = dict(labels)
+        group = labels.get(group_label, "")
+        if metric == f"{name}_bucket":
+            bound = float("inf") if labels["le"] == "+Inf" else float(labels["le"])
+            buckets[group].append((bound, value))
+        elif metric == f"{name}_count":
+            totals[group][0] += value
+        elif metric == f"{name}_sum":
+            totals[group][1] += value
+    result = {}
+    for group, (count, total) in totals.items():
+        ordered = sorted(buckets[group])
+        result[group] = (count, total, _bucket_quantile(ordered, count, 0.95), _bucket_quantile(ordered, count, 0.99))
+    return result
+
+
+def _bucket_quantile(buckets, count, q):
+    if not count:
+        return 0.0
+    rank = q * count
+    previous_bound, previous_count = 0.0, 0.0
+    for bound, cumulative in buckets:
+        if cumulative >= rank:
+            if bound == float("inf"):
+                return previous_bound
+            return previous_bound + (bound - previous_bound) * (rank - previous_count) / max(cumulative - previous_count, 1)
+        previous_bound, previous_count = bound, cumulative
+    return previous_bound
+
+
+def counter_values(samples, name, label):
+    return {dict(labels).get(label, ""): value for (metric, labels), value in samples.items() if metric == name}
+
+
+# --- Báo cáo ---
+
+def command_results(test, wall):
+    results = []
+    for command in test.commands:
+        outcomes = test.outcomes[command]
+        latencies = sorted(test.latencies[command])
+        total = sum(outcomes.values())
+        errors = total - outcomes["ok"]
+        row = {
+            "command": command,
+            "requests": total,
+            "ok": outcomes["ok"],
+            "failed": outcomes["failed"],
+            "timeout": outcomes["timeout"],
+            "dropped": outcomes["dropped"],
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "throughput_per_s": round(total / wall, 2),
+        }
+        if latencies:
+            row.update({
+                f"p{q}_ms": round(percentile(latencies, q) * 1000, 1) for q in (50, 95, 99)
+            })
+            row["max_ms"] = round(latencies[-1] * 1000, 1)
+        results.append(row)
+    return results
+
+
+def print_report(report):
+    print(f"\n{report['users']:,} người dùng, {report['wall_s']:.0f}s, chế độ {report['mode']}, "
+          f"{report['workers'] or 1} process xử lý, think time {report['think_time_s']}s")
+    print(f"{'lệnh':<14}{'số lệnh':>9}{'lỗi %':>8}{'timeout':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for row in report["commands"]:
+        print(f"{row['command']:<14}{row['requests']:>9,}{row['error_rate'] * 100:>8.2f}{row['timeout']:>9,}"
+              f"{row.get('p50_ms', 0):>10.1f}{row.get('p95_ms', 0):>10.1f}{row.get('p99_ms', 0):>10.1f}{row.get('max_ms', 0):>10.1f}")
+    if report["webhook_statuses"]:
+        print("Webhook (phía client):", report["webhook_statuses"])
+    print("Tin ngoài lệnh:", report["background"])
+    print("SQLite - chờ khóa ghi theo phương thức:")
+    for method, row in sorted(report["sqlite_lock_wait"].items()):
+        print(f"  {method:<24}{row['count']:>9,.0f} lần, trung bình {row['mean_ms']:.2f} ms, "
+              f"p95 {row['p95_ms']:.2f} ms, p99 {row['p99_ms']:.2f} ms, tổng {row['total_s']:.2f}s")
+    print("SQLite - hết busy_timeout:", report["sqlite_locked"] or 0)
+    print("Lỗi phía bot (bot_errors_total):", report["bot_errors"] or 0)
+    print(f"CPU: bot {report['cpu_s']['bot']}s, load generator {report['cpu_s']['load_generator']}s "
+          f"trên {os.cpu_count()} core")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--duration", type=float, default=60, help="Số giây phát sinh lệnh mới")
+    parser.add_argument("--think-time", type=float, default=30, help="Thời gian nghỉ trung bình giữa hai lệnh của một người dùng (giây)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Tỷ lệ lệnh (mặc định {DEFAULT_MIX})")
+    parser.add_argument("--mode", choices=["webhook", "polling"], default="webhook")
+    parser.add_argument("--workers", type=int, default=0, help="Số worker process của bot (0 = một process)")
+    parser.add_argument("--connections", type=int, default=40, help="Số kết nối webhook song song (max_connections của Telegram)")
+    parser.add_argument("--max-retries", type=int, default=20, help="Số lần gửi lại update bị 429 / 503")
+    parser.add_argument("--timeout", type=float, default=60, help="Số giây chờ câu trả lời trước khi tính là timeout")
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Thời gian suy luận giả lập mỗi lần gọi model")
+    parser.add_argument("--seed-expenses", type=int, default=20, help="Số khoản chi có sẵn trong tháng của mỗi người dùng")
+    parser.add_argument("--profile-share", type=float, default=0.5, help="Tỷ lệ người dùng có hồ sơ")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Biến môi trường thêm cho bot (lặp lại được)")
+    parser.add_argument("--bot-log", default=os.path.join(ROOT, "benchmarks", ".data", "load_test_bot.log"),
+                        help="File ghi stderr (log) của bot")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+    env = dict(item.split("=", 1) for item in args.env)
+    os.makedirs(os.path.dirname(os.path.abspath(args.bot_log)), exist_ok=True)
+
+    with tempfile.TemporaryDirectory(prefix="load-test-") as workdir, open(args.bot_log, "w") as bot_log:
+        start = time.perf_counter()
+        seed(os.path.join(workdir, "expenses.db"), args.users, args.seed_expenses, args.profile_share, random.Random(args.seed))
+        print(f"Seed {args.users * args.seed_expenses:,} khoản chi: {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+        # Bot gọi getMe khi khởi động nên fake API phải chạy trước; câu trả lời chỉ được ghép sau khi có LoadTest
+        api = FakeTelegram().start()
+        metrics_port = _free_port()
+        process, webhook_url = start_bot(
+            api, workdir, mode=args.mode, secret=SECRET, delay_ms=args.delay_ms, workers=args.workers,
+            metrics_port=metrics_port, env=env, log=bot_log
+        )
+        test = LoadTest(args, api, webhook_url)
+        api.on_call = test.on_call
+        try:
+            if args.mode == "polling" or args.workers:
+                time.sleep(3)  # chờ bot (và các worker) khởi động
+            wall = asyncio.run(test.run())
+            samples = scrape([metrics_port] + [metrics_port + 1 + index for index in range(args.workers)])
+        finally:
+            stop_bot(process)
+            api.stop()
+    harness_cpu = sum(os.times()[:2])
+    bot_cpu = sum(resource.getrusage(resource.RUSAGE_CHILDREN)[:2])
+
+    lock_wait = histogram_summary(samples, "bot_db_lock_wait_seconds", "method")
+    report = {
+        "users": args.users,
+        "mode": args.mode,
+        "workers": args.workers,
+        "think_time_s": args.think_time,
+        "mix": args.mix,
+        "wall_s": round(wall, 1),
+        "commands": command_results(test, wall),
+        "webhook_statuses": {str(status): count for status, count in sorted(test.webhook_statuses.items())},
+        "background": dict(test.background),
+        "sqlite_lock_wait": {
+            method: {
+                "count": count, "total_s": round(total, 3), "mean_ms": round(total / count * 1000, 3) if count else 0.0,
+                "p95_ms": round(p95 * 1000, 3), "p99_ms": round(p99 * 1000, 3),
+            }
+            for method, (count, total, p95, p99) in lock_wait.items()
+        },
+        "sqlite_locked": counter_values(samples, "bot_db_locked_total", "method"),
+        "bot_errors": counter_values(samples, "bot_errors_total", "component"),
+        "api_calls": dict(api.calls),
+        # Bot và load generator chạy trên cùng máy: CPU của load generator (kể cả fake API) cũng là một giới hạn
+        "cpu_s": {"bot": round(bot_cpu, 1), "load_generator": round(harness_cpu, 1)},
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/stubs.py
+"""
+Pipeline giả lập (deterministic) thay cho NER, bộ phân loại và mô hình sinh text,
+để benchmark chạy offline và đo riêng phần code của bot chứ không đo mô hình.
+"""
+import time
+import zlib
+
+from fast_parser import AMOUNT_PATTERN
+from model_registry import models
+
+CATEGORIES = ["Tiêu dùng", "Đầu tư", "Giải trí", "Tiết kiệm", "Đi lại", "Chi phí cố định", "Khác"]
+
+STUB_COMMENTARY = (
+    " Bạn đang chi tiêu khá cân đối. Hãy tiếp tục theo dõi các khoản giải trí"
+    " và dành thêm một phần thu nhập cho tiết kiệm."
+)
+
+
+class StubNER:
+    """Trả về thực thể MONEY cho mỗi cụm số tiền, cùng định dạng aggregation_strategy="simple"."""
+
+    def __init__(self, delay_ms=0.0):
+        self.delay = delay_ms / 1000
+
+    def _entities(self, text):
+        return [
+            {"entity_group": "MONEY", "entity": "MONEY", "word": m.group(0).strip(), "score": 0.99,
+             "start": m.start(), "end": m.end()}
+            for m in AMOUNT_PATTERN.finditer(text.lower())
+        ]
+
+    def __call__(self, texts, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        if isinstance(texts, str):
+            return self._entities(texts)
+        return [self._entities(text) for text in texts]
+
+
+class StubClassifier:
+    """Chọn danh mục theo crc32 của prompt: cùng đầu vào luôn cho cùng kết quả."""
+
+    def __init__(self, delay_ms=0.0):
+        self.delay = delay_ms / 1000
+
+    def _classify(self, prompt):
+        return {"generated_text": CATEGORIES[zlib.crc32(prompt.encode("utf-8")) % len(CATEGORIES)]}
+
+    def __call__(self, prompts, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        if isinstance(prompts, str):
+            return [self._classify(prompts)]
+        return [self._classify(prompt) for prompt in prompts]
+
+
+class StubGenerator:
+    """Trả về prompt kèm một đoạn nhận xét cố định, giống pipeline text-generation."""
+
+    def __init__(self, delay_ms=0.0):
+        self.delay = delay_ms / 1000
+
+    def __call__(self, prompt, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        if not kwargs.get("return_full_text", True):
+            return [{"generated_text": STUB_COMMENTARY}]
+        return [{"generated_text": prompt + STUB_COMMENTARY}]
+
+
+def install_stubs(delay_ms=0.0):
+    """Đăng ký các pipeline giả lập vào registry; `delay_ms` giả lập thời gian suy luận mỗi lần gọi."""
+    models.set("ner", StubNER(delay_ms))
+    models.set("category", StubClassifier(delay_ms))
+    models.set("gen", StubGenerator(delay_ms))
+
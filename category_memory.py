@@ -0,0 +1,42 @@
+# category_memory.py
+from cache import LRUCache
+
+_MISSING = object()
+
+
+class CategoryMemory:
+    """
+    Bộ nhớ danh mục theo từng người dùng: từ khóa / tên cửa hàng đã chuẩn hóa -> danh mục,
+    học từ các lần phân loại trước và từ lệnh sửa danh mục của người dùng.
+    Lưu bền trong bảng category_memory, kèm một LRU trong bộ nhớ để tránh truy vấn lặp lại.
+    """
+
+    def __init__(self, db, cache_size=10000):
+        self.db = db
+        self._cache = LRUCache(maxsize=cache_size)
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, user_id, keyword):
+        category = self._cache.get((user_id, keyword), _MISSING)
+        if category is _MISSING:
+            category = self.db.get_learned_category(user_id, keyword)
+            self._cache.set((user_id, keyword), category)
+        if category:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return category
+
+    def learn(self, user_id, keyword, category, source="model"):
+        self.db.learn_category(user_id, keyword, category, source)
+        # Đọc lại ở lần tra cứu sau vì danh mục do người dùng sửa được ưu tiên hơn kết quả tự động
+        self._cache.pop((user_id, keyword))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
@@ -15,7 +15,114 @@ NER_TOKENIZER = os.getenv("NER_TOKENIZER")
 CLASSIFIER_MODEL = os.getenv("CLASSIFIER_MODEL")
 CLASSIFIER_TOKENIZER = os.getenv("CLASSIFIER_TOKENIZER")
 
+# Backend suy luận cho NER và bộ phân loại trên CPU: transformers (fp32), torch-int8 hoặc onnx.
+# Backend onnx cần `pip install optimum[onnxruntime]` và export trước: python inference_backends.py export --quantize
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "transformers")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_models")
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "1") == "1"  # Dùng model_quantized.onnx nếu đã có
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", 0))  # 0 = để ONNX Runtime tự chọn
+
 # Cấu hình cho text-generation model (spending analysis)
 GEN_MODEL = os.getenv("GEN_MODEL")
 GEN_TOKENIZER = os.getenv("GEN_TOKENIZER")
 GEN_DEVICE = int(os.getenv("GEN_DEVICE", -1))
+GEN_MAX_NEW_TOKENS = int(os.getenv("GEN_MAX_NEW_TOKENS", 100))
+# Dùng lại KV-cache của phần hướng dẫn cố định ở đầu prompt; phần số liệu giới hạn trong GEN_PROMPT_MAX_TOKENS token
+GEN_PREFIX_CACHE = os.getenv("GEN_PREFIX_CACHE", "1") == "1"
+GEN_PROMPT_MAX_TOKENS = int(os.getenv("GEN_PROMPT_MAX_TOKENS", 256))
+
+# Cấu hình load model: mặc định không chặn request khi model chưa sẵn sàng (dùng fallback),
+# và warm-up các model trong thread nền sau khi bot đã bắt đầu polling.
+MODEL_WAIT_FOR_LOAD = os.getenv("MODEL_WAIT_FOR_LOAD", "0") == "1"
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"
+
+# Telegram bot
+TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "YOUR_TELEGRAM_BOT_TOKEN_HERE")
+# Địa chỉ Bot API (đổi khi dùng Bot API server tự host)
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "https://api.telegram.org/bot")
+# Số update được xử lý đồng thời (các chat khác nhau không phải chờ nhau)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", 64))
+
+# Cách nhận update: polling (mặc định) hoặc webhook (server HTTP cục bộ, đặt sau reverse proxy có TLS)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # URL công khai Telegram gọi tới; để trống thì không gọi setWebhook
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8443))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Bắt buộc khi chạy webhook: 1-256 ký tự A-Z, a-z, 0-9, _ và -
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", 1000))  # Số update chờ xử lý tối đa, vượt thì trả 429
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40))  # Số kết nối đồng thời Telegram được mở
+# Số luồng tối đa chạy inference (NER, phân loại, sinh text) cùng lúc
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 2))
+
+# Micro-batching cho NER và phân loại danh mục
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 16))  # Số phần tử tối đa trong một batch
+BATCH_MAX_WAIT_MS = int(os.getenv("BATCH_MAX_WAIT_MS", 10))  # Thời gian tối đa chờ gom batch
+BATCH_MAX_QUEUE = int(os.getenv("BATCH_MAX_QUEUE", 256))  # Độ sâu hàng đợi tối đa trước khi từ chối
+BATCH_MAX_LATENCY_MS = int(os.getenv("BATCH_MAX_LATENCY_MS", 2000))  # Độ trễ tối đa trước khi dùng fallback
+# Số luồng xử lý phần glue (regex, dateparser) của tin nhắn; các lời gọi model đi qua batcher
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", 32))
+
+# Hàng đợi ghi chi tiêu theo lô (write-behind)
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", 20))  # Chu kỳ ghi một lô
+INGEST_MAX_BATCH_ROWS = int(os.getenv("INGEST_MAX_BATCH_ROWS", 500))  # Số dòng tối đa mỗi lô
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", 10000))  # Số dòng chờ tối đa trước khi ghi trực tiếp
+# Chế độ bền vững: chỉ báo "Đã lưu chi tiêu" sau khi lô chứa chi tiêu đã commit
+INGEST_DURABLE = os.getenv("INGEST_DURABLE", "1") == "1"
+
+# Nhập chi tiêu từ file CSV / sao kê ngân hàng
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 5000))  # Số dòng xử lý và ghi mỗi lần
+# Dùng mô hình phân loại cho các dòng không có danh mục (chậm hơn nhiều với file lớn)
+IMPORT_USE_MODEL = os.getenv("IMPORT_USE_MODEL", "0") == "1"
+
+# Cache và debounce nhận xét chi tiêu do LLM sinh ra
+COMMENTARY_CACHE_SIZE = int(os.getenv("COMMENTARY_CACHE_SIZE", 1024))
+COMMENTARY_CACHE_TTL = int(os.getenv("COMMENTARY_CACHE_TTL", 3600))  # giây
+# Sau mỗi chi tiêu, chờ thêm từng này giây; nếu có chi tiêu mới thì chỉ phân tích một lần
+REVIEW_DEBOUNCE_SECONDS = float(os.getenv("REVIEW_DEBOUNCE_SECONDS", 5))
+
+# Streaming nhận xét: gửi số liệu ngay, sau đó cập nhật dần nhận xét vào một tin nhắn
+STREAM_COMMENTARY = os.getenv("STREAM_COMMENTARY", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", 1.5))  # giây giữa hai lần sửa tin nhắn
+STREAM_TOKEN_TIMEOUT = float(os.getenv("STREAM_TOKEN_TIMEOUT", 60))  # giây chờ tối đa cho mỗi token
+
+# Fast path quy tắc: chỉ gọi NER / bộ phân loại khi độ tin cậy thấp hơn ngưỡng này
+FAST_PATH_THRESHOLD = float(os.getenv("FAST_PATH_THRESHOLD", 0.8))
+
+# Cache danh mục: số từ khóa tối đa trong LRU toàn cục
+CATEGORY_CACHE_SIZE = int(os.getenv("CATEGORY_CACHE_SIZE", 50000))
+
+# Cache hồ sơ người dùng trong process (ghi xuyên khi /profile cập nhật)
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 10000))
+
+# Nhắc nhở chi tiêu hằng ngày
+REMINDER_TIME = os.getenv("REMINDER_TIME", "21:00")  # Giờ gửi (HH:MM) theo REMINDER_TIMEZONE
+REMINDER_TIMEZONE = os.getenv("REMINDER_TIMEZONE", "Asia/Ho_Chi_Minh")
+REMINDER_PAGE_SIZE = int(os.getenv("REMINDER_PAGE_SIZE", 1000))  # Số người dùng đọc mỗi trang
+REMINDER_RATE = float(os.getenv("REMINDER_RATE", 25))  # Tin nhắn/giây, dưới giới hạn ~30/giây của Telegram
+REMINDER_CONCURRENCY = int(os.getenv("REMINDER_CONCURRENCY", 16))  # Số worker gửi song song
+REMINDER_MAX_RETRIES = int(os.getenv("REMINDER_MAX_RETRIES", 3))
+
+# Metrics: endpoint Prometheus cục bộ (0 = tắt) và danh sách quản trị viên được dùng /stats
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+ADMIN_USER_IDS = {uid.strip() for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()}
+
+# Chế độ nhiều process: số worker (0 = chạy một process như cũ); update được chia theo crc32(user_id)
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", 0))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", 1000))  # Số update chờ tối đa mỗi worker
+WORKER_HEARTBEAT_TIMEOUT = float(os.getenv("WORKER_HEARTBEAT_TIMEOUT", 30))  # giây không có heartbeat thì khởi động lại
+WORKER_HEALTH_INTERVAL = float(os.getenv("WORKER_HEALTH_INTERVAL", 5))  # giây giữa hai lần kiểm tra
+WORKER_MAX_RESTART_BACKOFF = float(os.getenv("WORKER_MAX_RESTART_BACKOFF", 60))  # giây chờ tối đa giữa hai lần khởi động lại
+
+# Báo cáo chi tiêu: số khoản tối đa và số ký tự tối đa mỗi trang (giới hạn tin nhắn Telegram là 4096)
+REPORT_PAGE_ROWS = int(os.getenv("REPORT_PAGE_ROWS", 25))
+REPORT_PAGE_CHARS = int(os.getenv("REPORT_PAGE_CHARS", 3800))
+
+# Thống kê chi tiêu theo danh mục (Welford + EWMA) cho cảnh báo bất thường và dự báo vượt ngân sách
+BASELINE_EWMA_ALPHA = float(os.getenv("BASELINE_EWMA_ALPHA", 0.1))  # Trọng số của chi tiêu mới nhất trong EWMA
+BASELINE_MIN_SAMPLES = int(os.getenv("BASELINE_MIN_SAMPLES", 5))  # Số chi tiêu tối thiểu trước khi cảnh báo theo lịch sử
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", 3))  # Số độ lệch chuẩn trên trung bình
+ANOMALY_EWMA_RATIO = float(os.getenv("ANOMALY_EWMA_RATIO", 2))  # Và phải gấp ít nhất từng này lần mức gần đây
+INCOME_SHARE_WARNING = float(os.getenv("INCOME_SHARE_WARNING", 0.3))  # Tỷ lệ thu nhập tháng của một khoản chi
+LARGE_EXPENSE_FALLBACK = float(os.getenv("LARGE_EXPENSE_FALLBACK", 50000000))  # Ngưỡng khi chưa có hồ sơ lẫn lịch sử
@@ -1,21 +1,259 @@
 # database.py
+import os
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 from sqlite3 import Error
 
+from cache import LRUCache
+from config import BASELINE_EWMA_ALPHA, PROFILE_CACHE_SIZE
+from metrics import db_latency, errors, registry, timed
+
+# Pragma áp dụng cho mỗi connection: WAL cho phép đọc song song với ghi,
+# synchronous=NORMAL là đủ an toàn với WAL và giảm số lần fsync.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Bảng tổng hợp (rollup) chi tiêu theo ngày/tháng và danh mục, được cập nhật
+# trong cùng transaction với việc ghi chi tiêu để báo cáo chỉ cần đọc O(số danh mục).
+ROLLUP_TABLES = (
+    '''
+    CREATE TABLE IF NOT EXISTS expense_daily_totals (
+        user_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        category TEXT NOT NULL,
+        total REAL NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, category)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS expense_monthly_totals (
+        user_id TEXT NOT NULL,
+        month TEXT NOT NULL,
+        category TEXT NOT NULL,
+        total REAL NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month, category)
+    ) WITHOUT ROWID
+    ''',
+)
+
+# Chi tiêu không có danh mục được gộp vào "Khác" trong bảng rollup
+ROLLUP_UPSERTS = (
+    '''
+    INSERT INTO expense_daily_totals (user_id, day, category, total, count)
+    VALUES (?, ?, COALESCE(?, 'Khác'), ?, 1)
+    ON CONFLICT (user_id, day, category) DO UPDATE SET
+        total = total + excluded.total, count = count + 1
+    ''',
+    '''
+    INSERT INTO expense_monthly_totals (user_id, month, category, total, count)
+    VALUES (?, substr(?, 1, 7), COALESCE(?, 'Khác'), ?, 1)
+    ON CONFLICT (user_id, month, category) DO UPDATE SET
+        total = total + excluded.total, count = count + 1
+    ''',
+)
+
+ROLLUP_REMOVALS = (
+    '''
+    UPDATE expense_daily_totals SET total = total - ?, count = count - 1
+    WHERE user_id = ? AND day = ? AND category = COALESCE(?, 'Khác')
+    ''',
+    '''
+    UPDATE expense_monthly_totals SET total = total - ?, count = count - 1
+    WHERE user_id = ? AND month = substr(?, 1, 7) AND category = COALESCE(?, 'Khác')
+    ''',
+)
+
+ROLLUP_REBUILD = (
+    "DELETE FROM expense_daily_totals",
+    "DELETE FROM expense_monthly_totals",
+    '''
+    INSERT INTO expense_daily_totals (user_id, day, category, total, count)
+    SELECT user_id, date, COALESCE(category, 'Khác'), SUM(amount), COUNT(*)
+    FROM expenses GROUP BY user_id, date, COALESCE(category, 'Khác')
+    ''',
+    '''
+    INSERT INTO expense_monthly_totals (user_id, month, category, total, count)
+    SELECT user_id, substr(day, 1, 7), category, SUM(total), SUM(count)
+    FROM expense_daily_totals GROUP BY user_id, substr(day, 1, 7), category
+    ''',
+)
+
+# Thống kê chạy (running) theo người dùng và danh mục: Welford (n, mean, m2) cho trung bình /
+# phương sai và trung bình trượt có trọng số mũ (EWMA), cập nhật O(1) cùng transaction ghi chi tiêu.
+STATS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS spending_stats (
+        user_id TEXT NOT NULL,
+        category TEXT NOT NULL,
+        n INTEGER NOT NULL DEFAULT 0,
+        mean REAL NOT NULL DEFAULT 0,
+        m2 REAL NOT NULL DEFAULT 0,
+        ewma REAL NOT NULL DEFAULT 0,
+        last_date TEXT,
+        PRIMARY KEY (user_id, category)
+    ) WITHOUT ROWID
+'''
+
+# Vế phải của SET đọc giá trị cũ của dòng, nên mean / m2 dùng cùng n, mean trước khi cập nhật.
+# Tham số: (user_id, category, amount, date, alpha)
+STATS_UPSERT = '''
+    INSERT INTO spending_stats (user_id, category, n, mean, m2, ewma, last_date)
+    VALUES (?1, COALESCE(?2, 'Khác'), 1, ?3, 0, ?3, ?4)
+    ON CONFLICT (user_id, category) DO UPDATE SET
+        n = n + 1,
+        mean = mean + (excluded.mean - mean) / (n + 1),
+        m2 = m2 + (excluded.mean - mean) * (excluded.mean - mean - (excluded.mean - mean) / (n + 1)),
+        ewma = ewma + ?5 * (excluded.mean - ewma),
+        last_date = max(COALESCE(last_date, ''), excluded.last_date)
+'''
+
+# Bỏ một chi tiêu khỏi thống kê (Welford ngược); EWMA không đảo ngược được nên giữ nguyên.
+# Tham số: (amount, user_id, category)
+STATS_REMOVAL = '''
+    UPDATE spending_stats SET
+        n = n - 1,
+        mean = CASE WHEN n > 1 THEN (n * mean - ?1) / (n - 1) ELSE 0 END,
+        m2 = CASE WHEN n > 1 THEN max(0, m2 - (?1 - mean) * (?1 - (n * mean - ?1) / (n - 1))) ELSE 0 END
+    WHERE user_id = ?2 AND category = COALESCE(?3, 'Khác')
+'''
+
+# Khởi tạo từ dữ liệu cũ bằng SQL thuần (EWMA lấy bằng trung bình); `python baselines.py backfill`
+# tính lại chính xác theo thứ tự thời gian.
+STATS_REBUILD = (
+    "DELETE FROM spending_stats",
+    '''
+    INSERT INTO spending_stats (user_id, category, n, mean, m2, ewma, last_date)
+    SELECT user_id, category, n, mean, max(0, sq - n * mean * mean), mean, last_date FROM (
+        SELECT user_id, COALESCE(category, 'Khác') AS category, COUNT(*) AS n, AVG(amount) AS mean,
+               SUM(amount * amount) AS sq, MAX(date) AS last_date
+        FROM expenses GROUP BY user_id, COALESCE(category, 'Khác')
+    )
+    ''',
+)
+
+# Các bước nâng cấp schema, áp dụng theo thứ tự dựa trên PRAGMA user_version.
+MIGRATIONS = [
+    # 1: index bao phủ (covering) cho các truy vấn theo user và ngày
+    [
+        "CREATE INDEX IF NOT EXISTS idx_expenses_user_date "
+        "ON expenses (user_id, date, amount, category, currency)",
+    ],
+    # 2: bảng rollup theo ngày/tháng, backfill từ dữ liệu cũ
+    [*ROLLUP_TABLES, *ROLLUP_REBUILD],
+    # 3: ghi chú (từ khóa đã chuẩn hóa) của chi tiêu và bộ nhớ danh mục theo từng người dùng
+    [
+        "ALTER TABLE expenses ADD COLUMN note TEXT",
+        '''
+        CREATE TABLE IF NOT EXISTS category_memory (
+            user_id TEXT NOT NULL,
+            keyword TEXT NOT NULL,
+            category TEXT NOT NULL,
+            source TEXT NOT NULL DEFAULT 'model',
+            hits INTEGER NOT NULL DEFAULT 1,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, keyword)
+        ) WITHOUT ROWID
+        ''',
+    ],
+    # 4: checkpoint của job nhắc nhở hằng ngày, để chạy tiếp sau khi bot bị dừng giữa chừng
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS reminder_checkpoints (
+            day TEXT PRIMARY KEY,
+            last_user_id TEXT,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            finished INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ],
+    # 5: thống kê chi tiêu theo người dùng và danh mục cho cảnh báo bất thường
+    [STATS_TABLE, *STATS_REBUILD],
+]
+
+def _timed(method):
+    """Ghi thời gian mỗi lời gọi phương thức Database vào histogram bot_db_seconds{method=...}."""
+    return timed(db_latency, method=method.__name__)(method)
+
+# Tranh chấp khóa ghi SQLite (giữa các thread / worker process ghi cùng file)
+lock_wait = registry.histogram("bot_db_lock_wait_seconds", "Thời gian chờ lấy khóa ghi SQLite (BEGIN IMMEDIATE)")
+lock_timeouts = registry.counter("bot_db_locked_total", "Số lần hết busy_timeout mà chưa lấy được khóa ghi SQLite")
+
+@dataclass(frozen=True)
+class SpendingSummary:
+    """Tổng chi tiêu trong một khoảng ngày và phân bổ theo danh mục (sắp xếp theo tên danh mục)."""
+    start_date: str
+    end_date: str
+    total: float
+    by_category: tuple
+
+    def __bool__(self):
+        return bool(self.by_category)
+
+@dataclass(frozen=True, slots=True)
+class Profile:
+    """Hồ sơ tài chính của người dùng (một dòng bảng profiles)."""
+    name: str
+    income: float
+    budget: float
+    savings_goal: float
+    spending_targets: str
+
+# Đánh dấu "chưa có trong cache", vì None cũng được cache cho người dùng chưa có hồ sơ
+_MISSING = object()
+
 class Database:
-    def __init__(self, db_file='expenses.db'):
+    def __init__(self, db_file='expenses.db', profile_cache_size=PROFILE_CACHE_SIZE):
         self.db_file = db_file
-        self.conn = self.create_connection()
+        # Mỗi thread có connection riêng thay vì chia sẻ một connection không khóa
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.profile_cache = LRUCache(maxsize=profile_cache_size)
         self.create_tables()
-    
+        self.migrate()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.create_connection()
+            self._local.conn = conn
+        return conn
+
     def create_connection(self):
         conn = None
         try:
-            # Cho phép dùng connection trên nhiều thread (dùng cho Job Queue)
-            conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            # Mỗi connection chỉ được dùng trong thread tạo ra nó (threading.local);
+            # tắt kiểm tra thread để close() đóng được mọi connection từ một thread
+            conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            with self._connections_lock:
+                self._connections.append(conn)
         except Error as e:
             print(e)
+            errors.inc(component="db")
         return conn
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
     
     def create_tables(self):
         try:
@@ -52,67 +290,457 @@ class Database:
             self.conn.commit()
         except Error as e:
             print(e)
+            errors.inc(component="db")
+
+    @contextmanager
+    def _write_transaction(self, method):
+        """
+        Transaction ghi lấy khóa ngay từ đầu (BEGIN IMMEDIATE): chờ khóa theo busy_timeout thay vì lỗi
+        SQLITE_BUSY khi nâng cấp từ đọc lên ghi giữa chừng, và đo được thời gian chờ khóa.
+        Commit khi thoát khối, rollback nếu có exception.
+        """
+        start = time.perf_counter()
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e) or "busy" in str(e):
+                lock_timeouts.inc(method=method)
+            raise
+        finally:
+            lock_wait.observe(time.perf_counter() - start, method=method)
+        with self.conn:
+            yield self.conn.cursor()
+
+    def migrate(self):
+        """Nâng cấp file database cũ lên schema mới nhất (idempotent)."""
+        try:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            for target, statements in enumerate(MIGRATIONS, start=1):
+                if target <= version:
+                    continue
+                # Nhiều worker process có thể cùng mở một file mới: giữ khóa ghi và đọc lại
+                # user_version để mỗi bước chỉ được áp dụng một lần
+                with self.conn:
+                    self.conn.execute("BEGIN IMMEDIATE")
+                    if self.conn.execute("PRAGMA user_version").fetchone()[0] >= target:
+                        continue
+                    for statement in statements:
+                        self.conn.execute(statement)
+                    self.conn.execute(f"PRAGMA user_version = {target}")
+                print(f"Database migrated to schema version {target}")
+        except Error as e:
+            print(e)
+            errors.inc(component="db")
     
+    @_timed
     def add_user(self, user_id, chat_id):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("INSERT OR IGNORE INTO users (user_id, chat_id) VALUES (?, ?)", (user_id, chat_id))
-            self.conn.commit()
+            with self._write_transaction("add_user") as cursor:
+                cursor.execute("INSERT OR IGNORE INTO users (user_id, chat_id) VALUES (?, ?)", (user_id, chat_id))
         except Error as e:
             print(e)
+            errors.inc(component="db")
     
-    def add_expense(self, user_id, date, amount, category, currency="VND"):
+    @_timed
+    def add_expense(self, user_id, date, amount, category, currency="VND", note=None):
+        return self.write_batch(expenses=[(user_id, date, amount, category, currency, note)])
+
+    @_timed
+    def write_batch(self, expenses=(), users=()):
+        """
+        Ghi nhiều chi tiêu (user_id, date, amount, category, currency[, note]) và người dùng (user_id, chat_id)
+        bằng executemany trong một transaction duy nhất. Trả về True nếu đã commit thành công.
+        """
+        expenses = [row if len(row) == 6 else (*row, None) for row in expenses]
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT INTO expenses (user_id, date, amount, category, currency)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, date, amount, category, currency))
-            self.conn.commit()
+            with self._write_transaction("write_batch") as cursor:
+                if users:
+                    cursor.executemany("INSERT OR IGNORE INTO users (user_id, chat_id) VALUES (?, ?)", users)
+                if expenses:
+                    cursor.executemany('''
+                        INSERT INTO expenses (user_id, date, amount, category, currency, note)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', expenses)
+                    self._update_rollups(cursor, [row[:4] for row in expenses])
+                    self._update_stats(cursor, [row[:4] for row in expenses])
+            return True
+        except Error as e:
+            print(e)
+            errors.inc(component="db")
+            return False
+
+    @_timed
+    def add_expenses(self, expenses):
+        return self.write_batch(expenses=expenses)
+
+    def _update_rollups(self, cursor, rows):
+        """Cộng dồn các chi tiêu (user_id, date, amount, category) vào bảng rollup; gọi trong transaction ghi."""
+        params = [(user_id, date, category, amount) for user_id, date, amount, category in rows]
+        for statement in ROLLUP_UPSERTS:
+            cursor.executemany(statement, params)
+
+    def _update_stats(self, cursor, rows):
+        """Cập nhật thống kê Welford / EWMA cho các chi tiêu (user_id, date, amount, category), theo thứ tự ghi."""
+        params = [(user_id, category, amount, date, BASELINE_EWMA_ALPHA) for user_id, date, amount, category in rows]
+        cursor.executemany(STATS_UPSERT, params)
+
+    @_timed
+    def get_last_expense(self, user_id):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT id, user_id, date, amount, category, currency, note FROM expenses
+            WHERE user_id = ? ORDER BY id DESC LIMIT 1
+        ''', (user_id,))
+        return cursor.fetchone()
+
+    @_timed
+    def update_expense_category(self, expense_id, category):
+        """Đổi danh mục của một chi tiêu, chuyển số tiền tương ứng giữa các dòng rollup."""
+        try:
+            with self._write_transaction("update_expense_category") as cursor:
+                cursor.execute("SELECT user_id, date, amount, category FROM expenses WHERE id = ?", (expense_id,))
+                row = cursor.fetchone()
+                if row is None:
+                    return False
+                user_id, date, amount, old_category = row
+                cursor.execute("UPDATE expenses SET category = ? WHERE id = ?", (category, expense_id))
+                # Trừ khỏi dòng rollup của danh mục cũ rồi cộng vào danh mục mới
+                for statement in ROLLUP_REMOVALS:
+                    cursor.execute(statement, (amount, user_id, date, old_category))
+                cursor.execute("DELETE FROM expense_daily_totals WHERE user_id = ? AND day = ? AND count <= 0", (user_id, date))
+                cursor.execute(
+                    "DELETE FROM expense_monthly_totals WHERE user_id = ? AND month = substr(?, 1, 7) AND count <= 0",
+                    (user_id, date)
+                )
+                self._update_rollups(cursor, [(user_id, date, amount, category)])
+                cursor.execute(STATS_REMOVAL, (amount, user_id, old_category))
+                cursor.execute("DELETE FROM spending_stats WHERE user_id = ? AND n <= 0", (user_id,))
+                self._update_stats(cursor, [(user_id, date, amount, category)])
+            return True
+        except Error as e:
+            print(e)
+            errors.inc(component="db")
+            return False
+
+    @_timed
+    def get_learned_category(self, user_id, keyword):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT category FROM category_memory WHERE user_id = ? AND keyword = ?", (user_id, keyword)
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    @_timed
+    def learn_category(self, user_id, keyword, category, source="model"):
+        """
+        Ghi nhớ danh mục cho từ khóa của người dùng. Danh mục do người dùng sửa (source='user')
+        không bị kết quả phân loại tự động ghi đè.
+        """
+        try:
+            with self._write_transaction("learn_category") as cursor:
+                cursor.execute('''
+                    INSERT INTO category_memory (user_id, keyword, category, source)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (user_id, keyword) DO UPDATE SET
+                        category = CASE WHEN category_memory.source = 'user' AND excluded.source != 'user'
+                                        THEN category_memory.category ELSE excluded.category END,
+                        source = CASE WHEN category_memory.source = 'user' THEN 'user' ELSE excluded.source END,
+                        hits = category_memory.hits + 1,
+                        updated_at = CURRENT_TIMESTAMP
+                ''', (user_id, keyword, category, source))
         except Error as e:
             print(e)
+            errors.inc(component="db")
+
+    @_timed
+    def rebuild_rollups(self):
+        """Tính lại toàn bộ bảng rollup từ bảng expenses (dùng để backfill dữ liệu cũ)."""
+        try:
+            with self.conn:
+                for statement in ROLLUP_REBUILD:
+                    self.conn.execute(statement)
+        except Error as e:
+            print(e)
+            errors.inc(component="db")
     
+    @_timed
+    def get_spending_stats(self, user_id, category):
+        """Thống kê (n, mean, m2, ewma, last_date) của người dùng cho một danh mục, hoặc None."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT n, mean, m2, ewma, last_date FROM spending_stats WHERE user_id = ? AND category = COALESCE(?, 'Khác')",
+            (user_id, category)
+        )
+        return cursor.fetchone()
+
+    @_timed
+    def replace_spending_stats(self, rows):
+        """Thay toàn bộ bảng spending_stats bằng các dòng (user_id, category, n, mean, m2, ewma, last_date)."""
+        try:
+            with self.conn:
+                self.conn.execute("DELETE FROM spending_stats")
+                self.conn.executemany('''
+                    INSERT INTO spending_stats (user_id, category, n, mean, m2, ewma, last_date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+            return True
+        except Error as e:
+            print(e)
+            errors.inc(component="db")
+            return False
+
+    @_timed
     def get_expenses_by_date(self, user_id, date):
         cursor = self.conn.cursor()
         cursor.execute('''
-            SELECT * FROM expenses WHERE user_id = ? AND date = ?
+            SELECT id, user_id, date, amount, category, currency FROM expenses WHERE user_id = ? AND date = ?
         ''', (user_id, date))
         return cursor.fetchall()
     
+    @_timed
     def get_expenses_by_period(self, user_id, start_date, end_date):
         cursor = self.conn.cursor()
         cursor.execute('''
-            SELECT * FROM expenses WHERE user_id = ? AND date BETWEEN ? AND ?
+            SELECT id, user_id, date, amount, category, currency FROM expenses WHERE user_id = ? AND date BETWEEN ? AND ?
         ''', (user_id, start_date, end_date))
         return cursor.fetchall()
     
+    @_timed
+    def get_expenses_page(self, user_id, start_date, end_date, key=None, direction="next", limit=25):
+        """
+        Một trang chi tiêu trong [start_date, end_date], phân trang theo khóa (date, id) thay vì OFFSET:
+        "next" lấy các dòng sau `key`, "prev" lấy các dòng ngay trước `key`.
+        `key` là (date, id) của dòng biên trang hiện tại, None để lấy trang đầu.
+        Trả về list (id, user_id, date, amount, category, currency) theo thứ tự (date, id) tăng dần.
+        """
+        params = [user_id, start_date, end_date]
+        condition = ""
+        if key is not None:
+            condition = "AND (date, id) < (?, ?)" if direction == "prev" else "AND (date, id) > (?, ?)"
+            params += list(key)
+        order = "DESC" if direction == "prev" else "ASC"
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT id, user_id, date, amount, category, currency FROM expenses
+            WHERE user_id = ? AND date BETWEEN ? AND ? {condition}
+            ORDER BY date {order}, id {order}
+            LIMIT ?
+        ''', (*params, limit))
+        rows = cursor.fetchall()
+        return rows[::-1] if direction == "prev" else rows
+
+    @_timed
+    def get_expense_count(self, user_id, start_date, end_date):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT COALESCE(SUM(count), 0) FROM expense_daily_totals WHERE user_id = ? AND day BETWEEN ? AND ?",
+            (user_id, start_date, end_date)
+        )
+        return cursor.fetchone()[0]
+
+    @_timed
+    def get_daily_totals(self, user_id, start_date, end_date):
+        """Tổng chi tiêu theo từng ngày trong khoảng, đọc từ bảng rollup. Trả về list (day, total, count)."""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT day, SUM(total), SUM(count) FROM expense_daily_totals
+            WHERE user_id = ? AND day BETWEEN ? AND ?
+            GROUP BY day ORDER BY day
+        ''', (user_id, start_date, end_date))
+        return cursor.fetchall()
+
+    @_timed
     def get_total_expense_by_date(self, user_id, date):
         cursor = self.conn.cursor()
         cursor.execute('''
-            SELECT SUM(amount) FROM expenses WHERE user_id = ? AND date = ?
+            SELECT SUM(total) FROM expense_daily_totals WHERE user_id = ? AND day = ?
         ''', (user_id, date))
         result = cursor.fetchone()[0]
         return result if result else 0.0
+
+    @_timed
+    def get_category_totals(self, user_id, start_date, end_date):
+        """
+        Tổng chi tiêu theo danh mục trong khoảng [start_date, end_date], đọc từ bảng rollup.
+        Các tháng trọn vẹn dùng bảng theo tháng, phần lẻ ở hai đầu dùng bảng theo ngày.
+        Trả về list (category, total) sắp xếp theo tên danh mục.
+        """
+        full_start, full_end = _full_month_range(start_date, end_date)
+        parts = []
+        params = []
+        if full_start is None:
+            parts.append("SELECT category, total FROM expense_daily_totals WHERE user_id = ? AND day BETWEEN ? AND ?")
+            params += [user_id, start_date, end_date]
+        else:
+            parts.append("SELECT category, total FROM expense_monthly_totals WHERE user_id = ? AND month BETWEEN ? AND ?")
+            params += [user_id, full_start[:7], full_end[:7]]
+            if start_date < full_start:
+                parts.append("SELECT category, total FROM expense_daily_totals WHERE user_id = ? AND day >= ? AND day < ?")
+                params += [user_id, start_date, full_start]
+            if end_date > full_end:
+                parts.append("SELECT category, total FROM expense_daily_totals WHERE user_id = ? AND day > ? AND day <= ?")
+                params += [user_id, full_end, end_date]
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT category, SUM(total) FROM (" + " UNION ALL ".join(parts) + ") "
+            "GROUP BY category ORDER BY category",
+            params
+        )
+        return cursor.fetchall()
+
+    @_timed
+    def get_total_by_period(self, user_id, start_date, end_date):
+        return self.get_spending_summary(user_id, start_date, end_date).total
+
+    @_timed
+    def get_spending_summary(self, user_id, start_date, end_date):
+        by_category = tuple(self.get_category_totals(user_id, start_date, end_date))
+        total = sum(amount for _, amount in by_category)
+        return SpendingSummary(start_date, end_date, total, by_category)
     
+    @_timed
     def get_all_users(self):
         cursor = self.conn.cursor()
         cursor.execute('SELECT * FROM users')
         return cursor.fetchall()
     
+    @_timed
+    def get_daily_totals_page(self, day, after_user_id="", limit=1000):
+        """
+        Tổng chi tiêu trong ngày của từng người dùng, phân trang theo khóa (user_id > after_user_id).
+        Một truy vấn GROUP BY cho cả trang thay vì một truy vấn cho mỗi người dùng.
+        Trả về list (user_id, chat_id, total) sắp xếp theo user_id.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT u.user_id, u.chat_id, COALESCE(SUM(t.total), 0)
+            FROM users u
+            LEFT JOIN expense_daily_totals t ON t.user_id = u.user_id AND t.day = ?
+            WHERE u.user_id > ?
+            GROUP BY u.user_id
+            ORDER BY u.user_id
+            LIMIT ?
+        ''', (day, after_user_id or "", limit))
+        return cursor.fetchall()
+
+    @_timed
+    def get_reminder_checkpoint(self, day):
+        """Trả về (last_user_id, sent, failed, finished) của lượt nhắc nhở ngày `day`, hoặc None."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT last_user_id, sent, failed, finished FROM reminder_checkpoints WHERE day = ?", (day,)
+        )
+        return cursor.fetchone()
+
+    @_timed
+    def save_reminder_checkpoint(self, day, last_user_id, sent, failed, finished=False):
+        try:
+            with self.conn:
+                self.conn.execute('''
+                    INSERT INTO reminder_checkpoints (day, last_user_id, sent, failed, finished, updated_at)
+                    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(day) DO UPDATE SET
+                        last_user_id = excluded.last_user_id,
+                        sent = excluded.sent,
+                        failed = excluded.failed,
+                        finished = excluded.finished,
+                        updated_at = excluded.updated_at
+                ''', (day, last_user_id, sent, failed, int(finished)))
+            return True
+        except Error as e:
+            print(e)
+            errors.inc(component="db")
+            return False
+
+    @_timed
     def add_profile(self, user_id, name, income, budget, savings_goal, spending_targets):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO profiles (user_id, name, income, budget, savings_goal, spending_targets)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, name, income, budget, savings_goal, spending_targets))
-            self.conn.commit()
+            with self._write_transaction("add_profile") as cursor:
+                cursor.execute('''
+                    INSERT OR REPLACE INTO profiles (user_id, name, income, budget, savings_goal, spending_targets)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (user_id, name, income, budget, savings_goal, spending_targets))
+            # Ghi xuyên: cache giữ đúng bản vừa commit, lần đọc sau không cần truy vấn lại
+            self.profile_cache.set(user_id, Profile(name, income, budget, savings_goal, spending_targets))
         except Error as e:
             print(e)
-    
+            errors.inc(component="db")
+
+    @_timed
     def get_profile(self, user_id):
+        """Hồ sơ (Profile) của người dùng hoặc None, đọc qua cache LRU trong process."""
+        profile = self.profile_cache.get(user_id, _MISSING)
+        if profile is not _MISSING:
+            return profile
         cursor = self.conn.cursor()
         cursor.execute('''
             SELECT name, income, budget, savings_goal, spending_targets FROM profiles WHERE user_id = ?
         ''', (user_id,))
-        return cursor.fetchone()
+        row = cursor.fetchone()
+        profile = Profile(*row) if row else None
+        self.profile_cache.set(user_id, profile)
+        return profile
+
+
+# Một Database dùng chung cho mỗi file trong process: bảng / migration chỉ chạy một lần,
+# connection theo từng thread được giữ lại và cache hồ sơ được chia sẻ giữa các handler.
+_databases = {}
+_databases_lock = threading.Lock()
+
+def get_database(db_file='expenses.db'):
+    path = os.path.abspath(db_file)
+    with _databases_lock:
+        db = _databases.get(path)
+        if db is None:
+            db = _databases[path] = Database(path)
+        return db
+
+def profile_cache_stats():
+    """Số hit / miss cộng dồn của cache hồ sơ trên các Database dùng chung."""
+    with _databases_lock:
+        caches = [db.profile_cache.stats() for db in _databases.values()]
+    hits = sum(stats["hits"] for stats in caches)
+    misses = sum(stats["misses"] for stats in caches)
+    return {
+        "size": sum(stats["size"] for stats in caches),
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": (hits / (hits + misses)) if hits + misses else 0.0,
+    }
+
+registry.gauge(
+    "bot_profile_cache_requests", "Số lần đọc hồ sơ trúng (hit) / trượt (miss) cache",
+    lambda: {"hit": profile_cache_stats()["hits"], "miss": profile_cache_stats()["misses"]}, label="result"
+)
+registry.gauge("bot_profile_cache_hit_ratio", "Tỷ lệ hit của cache hồ sơ", lambda: profile_cache_stats()["hit_rate"])
+
+
+def _full_month_range(start_date, end_date):
+    """
+    Trả về (ngày đầu, ngày cuối) dạng 'YYYY-MM-DD' của dải các tháng nằm trọn trong khoảng ngày,
+    hoặc (None, None) nếu không có tháng nào trọn vẹn.
+    """
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    first = start if start.day == 1 else (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    next_day = end + timedelta(days=1)
+    last = end if next_day.day == 1 else end.replace(day=1) - timedelta(days=1)
+    if first > last:
+        return None, None
+    return first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Công cụ bảo trì database chi tiêu")
+    parser.add_argument("command", choices=["migrate", "rebuild-rollups"])
+    parser.add_argument("--db", default="expenses.db")
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    if args.command == "rebuild-rollups":
+        db.rebuild_rollups()
+        print("Đã tính lại bảng tổng hợp chi tiêu.")
+    else:
+        print("Database đã ở schema mới nhất.")
@@ -0,0 +1,153 @@
+# date_resolver.py
+import re
+import unicodedata
+from datetime import date, timedelta
+from functools import lru_cache
+
+# Ngày tương đối theo số ngày lệch so với ngày tham chiếu
+RELATIVE_DAYS = {
+    "hôm nay": 0, "bữa nay": 0,
+    "hôm qua": -1, "bữa qua": -1,
+    "hôm kia": -2, "bữa kia": -2,
+    "hôm kìa": -3,
+    "ngày mai": 1,
+}
+
+WEEKDAYS = {
+    "thứ 2": 0, "thứ hai": 0, "t2": 0,
+    "thứ 3": 1, "thứ ba": 1, "t3": 1,
+    "thứ 4": 2, "thứ tư": 2, "t4": 2,
+    "thứ 5": 3, "thứ năm": 3, "t5": 3,
+    "thứ 6": 4, "thứ sáu": 4, "t6": 4,
+    "thứ 7": 5, "thứ bảy": 5, "t7": 5,
+    "chủ nhật": 6, "cn": 6,
+}
+
+WEEK_OFFSETS = {"tuần này": 0, "tuần trước": -1, "tuần sau": 1, "tuần tới": 1}
+
+
+def _alternation(words):
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+# Các mẫu được biên dịch sẵn, thử theo thứ tự: cụ thể trước, chung sau
+PATTERNS = [
+    ("weekday", re.compile(
+        r"(?<!\w)(?P<weekday>" + _alternation(WEEKDAYS) + r")(?:\s+(?P<week>" + _alternation(WEEK_OFFSETS) + r"))?(?!\w)"
+    )),
+    ("relative", re.compile(r"(?<!\w)(?P<relative>" + _alternation(RELATIVE_DAYS) + r")(?!\w)")),
+    ("ago", re.compile(r"(?<!\w)(?P<n>\d{1,3})\s+(?P<unit>ngày|tuần|tháng)\s+trước(?!\w)")),
+    ("day_month", re.compile(
+        r"(?<![\w/.,-])(?:ngày\s+)?(?P<day>\d{1,2})[/-](?P<month>\d{1,2})(?:[/-](?P<year>\d{4}|\d{2}))?(?![\w/.,-])"
+    )),
+    ("day_only", re.compile(r"(?<!\w)ngày\s+(?P<day>\d{1,2})(?![\w/-])")),
+    ("week", re.compile(r"(?<!\w)(?P<week>" + _alternation(WEEK_OFFSETS) + r")(?!\w)")),
+]
+_PATTERNS_BY_KIND = dict(PATTERNS)
+
+# Dấu hiệu văn bản có nhắc tới thời gian mà các mẫu trên chưa xử lý, khi đó mới cần dateparser
+DATE_HINT = re.compile(r"(?<!\w)(tháng|năm|tuần|trước|sau|sáng nay|tối qua|đêm qua)(?!\w)|\d+[/-]\d+")
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFC", text).lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def resolve_date(text, reference=None):
+    """
+    Nhận diện các cách nói ngày phổ biến trong tiếng Việt ("hôm qua", "thứ 2 tuần trước",
+    "ngày 5/3", "tuần này"...) dựa trên ngày tham chiếu. Trả về `date` hoặc None nếu không khớp mẫu nào.
+    """
+    reference = reference or date.today()
+    text = normalize(text)
+    for kind, pattern in PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return _resolve_phrase(kind, match.group(0), reference)
+    return None
+
+
+def strip_dates(text):
+    """Bỏ các cụm chỉ ngày đã biết khỏi văn bản (đã chuẩn hóa)."""
+    for _, pattern in PATTERNS:
+        text = pattern.sub(" ", text)
+    return text
+
+
+@lru_cache(maxsize=4096)
+def _resolve_phrase(kind, phrase, reference):
+    match = _PATTERNS_BY_KIND[kind].search(phrase)
+    if kind == "relative":
+        return reference + timedelta(days=RELATIVE_DAYS[match.group("relative")])
+    if kind == "ago":
+        n = int(match.group("n"))
+        if match.group("unit") == "ngày":
+            return reference - timedelta(days=n)
+        if match.group("unit") == "tuần":
+            return reference - timedelta(weeks=n)
+        # "n tháng trước": cùng ngày của n tháng trước (lùi về ngày cuối tháng nếu không tồn tại)
+        month_index = reference.year * 12 + reference.month - 1 - n
+        year, month = divmod(month_index, 12)
+        month += 1
+        for day in range(reference.day, 27, -1):
+            try:
+                return date(year, month, day)
+            except ValueError:
+                continue
+        return date(year, month, min(reference.day, 28))
+    if kind == "week":
+        return reference + timedelta(weeks=WEEK_OFFSETS[match.group("week")])
+    if kind == "weekday":
+        weekday = WEEKDAYS[match.group("weekday")]
+        week = match.group("week")
+        if week:
+            monday = reference - timedelta(days=reference.weekday()) + timedelta(weeks=WEEK_OFFSETS[week])
+            return monday + timedelta(days=weekday)
+        # Không nói rõ tuần: lấy ngày gần nhất trong quá khứ (hoặc hôm nay) rơi vào thứ đó
+        return reference - timedelta(days=(reference.weekday() - weekday) % 7)
+    if kind == "day_only":
+        # "ngày 5": ngày 5 của tháng này, hoặc tháng gần nhất trước đó có ngày này
+        # ("ngày 31" giữa tháng 10 là 31/8 vì tháng 9 không có ngày 31)
+        day = int(match.group("day"))
+        if not 1 <= day <= 31:
+            return None
+        month_start = reference.replace(day=1)
+        for _ in range(4):
+            try:
+                candidate = month_start.replace(day=day)
+            except ValueError:
+                candidate = None
+            if candidate and candidate <= reference:
+                return candidate
+            month_start = (month_start - timedelta(days=1)).replace(day=1)
+        return None
+    # day_month
+    year = match.group("year")
+    if year:
+        year = int(year) + (2000 if len(year) == 2 else 0)
+    return _past_date(reference, int(match.group("day")), int(match.group("month")), year)
+
+
+def _past_date(reference, day, month, year):
+    """
+    Dựng ngày; khi không có năm, chọn lần gần nhất không vượt quá ngày tham chiếu
+    ("29/2" lùi về năm nhuận gần nhất). Ngày không tồn tại như "30/2" trả về None.
+    """
+    if year is not None:
+        try:
+            return date(year, month, day)
+        except ValueError:
+            return None
+    for candidate_year in range(reference.year, reference.year - 9, -1):
+        try:
+            candidate = date(candidate_year, month, day)
+        except ValueError:
+            continue
+        if candidate <= reference:
+            return candidate
+    return None
+
+
+def cache_info():
+    return _resolve_phrase.cache_info()
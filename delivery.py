@@ -0,0 +1,111 @@
+# delivery.py
+import asyncio
+import logging
+import time
+
+from telegram.error import Forbidden, BadRequest, RetryAfter, NetworkError
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Giới hạn tốc độ kiểu token bucket: trung bình `rate` lượt/giây, cho phép dồn tối đa `capacity` lượt."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class DeliveryQueue:
+    """
+    Hàng đợi gửi tin nhắn bất đồng bộ: `concurrency` worker cùng lấy tin từ hàng đợi,
+    tất cả đi qua chung một TokenBucket để không vượt giới hạn flood của Telegram.
+    Lỗi tạm thời (RetryAfter, lỗi mạng) được gửi lại với backoff; lỗi vĩnh viễn
+    (người dùng chặn bot, chat không tồn tại) bị bỏ qua ngay.
+    """
+
+    def __init__(self, bot, rate=25, concurrency=16, max_retries=3, base_delay=1.0, max_pending=1000):
+        self.bot = bot
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self._workers = []
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    async def __aenter__(self):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def put(self, chat_id, text):
+        # Chặn khi hàng đợi đầy để bên đọc database không chạy quá xa bên gửi
+        await self._queue.put((chat_id, text))
+
+    async def join(self):
+        await self._queue.join()
+
+    async def _worker(self):
+        while True:
+            chat_id, text = await self._queue.get()
+            try:
+                if await self._send(chat_id, text):
+                    self.sent += 1
+                else:
+                    self.failed += 1
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, chat_id, text):
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text)
+                return True
+            except RetryAfter as e:
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+            except (Forbidden, BadRequest) as e:
+                logger.warning(f"Bỏ qua chat_id {chat_id}: {e}")
+                return False
+            except NetworkError as e:
+                delay = self.base_delay * (2 ** attempt)
+                logger.warning(f"Lỗi mạng khi gửi đến chat_id {chat_id} (lần {attempt + 1}): {e}")
+            except Exception as e:
+                logger.error(f"Lỗi khi gửi tin nhắn đến chat_id {chat_id}: {e}")
+                return False
+            if attempt < self.max_retries:
+                self.retried += 1
+                await asyncio.sleep(delay)
+        logger.error(f"Không gửi được tin nhắn đến chat_id {chat_id} sau {self.max_retries + 1} lần thử")
+        return False
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "pending": self._queue.qsize(),
+        }
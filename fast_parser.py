@@ -0,0 +1,171 @@
+# fast_parser.py
+import re
+import unicodedata
+from collections import deque
+
+# Tỷ giá quy đổi sang VND
+EXCHANGE_RATES = {
+    "usd": 23000,
+    "eur": 27000,
+    "gbp": 32000,
+    "vnd": 1,
+}
+
+# Đơn vị / tiền tệ được nhận diện và hệ số hoặc mã tiền tệ tương ứng
+UNIT_MULTIPLIERS = {
+    "k": 1_000, "nghìn": 1_000, "nghin": 1_000, "ngàn": 1_000, "ngan": 1_000,
+    "tr": 1_000_000, "triệu": 1_000_000, "trieu": 1_000_000, "củ": 1_000_000,
+    "tỷ": 1_000_000_000, "tỉ": 1_000_000_000, "ty": 1_000_000_000,
+}
+CURRENCY_ALIASES = {
+    "đồng": "vnd", "dong": "vnd", "đ": "vnd", "vnd": "vnd", "vnđ": "vnd",
+    "usd": "usd", "$": "usd", "đô": "usd",
+    "eur": "eur", "€": "eur", "euro": "eur",
+    "gbp": "gbp", "£": "gbp",
+}
+
+_UNITS = sorted(list(UNIT_MULTIPLIERS) + list(CURRENCY_ALIASES), key=len, reverse=True)
+
+# Ngữ pháp số tiền: "200k", "3 triệu", "150,000 đồng", "1.5tr", "1tr5", "$20".
+# Không nhận các số nằm trong ngày/giờ như "5/3" hoặc "12:30".
+AMOUNT_PATTERN = re.compile(
+    r"(?<![\w/:.,])"
+    r"(?P<prefix>[$€£])?\s*"
+    r"(?P<number>\d{1,3}(?:[.,]\d{3})+|\d+(?:[.,]\d{1,2})?)"
+    r"\s*(?P<unit>" + "|".join(re.escape(u) for u in _UNITS) + r")?"
+    # Phần lẻ sau đơn vị: "1tr5"; sau triệu / tỷ được cách một khoảng trắng: "2 tỷ 3"
+    # khi phần lẻ đứng cuối cụm (không nhận "3 triệu 50 nghìn" hay "2 triệu 5 người")
+    r"(?:(?:(?<=triệu|trieu)|(?<=tỷ|tỉ|ty))\s+(?=\d{1,3}[ \t]*(?:$|[,;!?)\n]|\.(?!\d))))?"
+    r"(?P<tail>\d{1,3})?"
+    r"(?![\w/:])",
+    re.IGNORECASE,
+)
+
+
+class KeywordIndex:
+    """
+    Chỉ mục từ khóa Aho–Corasick: tìm mọi từ khóa trong một lần duyệt văn bản,
+    chỉ giữ các kết quả nằm trọn theo ranh giới từ (ví dụ "đi" không khớp trong "điện").
+    """
+
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for priority, (keyword, value) in enumerate(keywords.items()):
+            self._add(_normalize(keyword), value, priority)
+        self._build()
+
+    def _add(self, keyword, value, priority):
+        state = 0
+        for ch in keyword:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((keyword, value, priority))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fallback = self._goto[fail].get(ch, 0)
+                self._fail[next_state] = fallback if fallback != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text):
+        """Trả về list (start, end, keyword, value, priority) theo thứ tự xuất hiện."""
+        text = _normalize(text)
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for keyword, value, priority in self._output[state]:
+                start = i - len(keyword) + 1
+                end = i + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    matches.append((start, end, keyword, value, priority))
+        return matches
+
+    def best(self, text):
+        """
+        Chọn từ khóa dài nhất (hòa thì ưu tiên từ khóa khai báo trước).
+        Trả về (value, confidence); confidence thấp khi các từ khóa khớp chỉ về nhiều giá trị khác nhau.
+        """
+        matches = self.find(text)
+        if not matches:
+            return None, 0.0
+        best = max(matches, key=lambda m: (m[1] - m[0], -m[4]))
+        values = {m[3] for m in matches}
+        return best[3], 0.9 if len(values) == 1 else 0.6
+
+
+def _normalize(text):
+    return unicodedata.normalize("NFC", text).lower()
+
+
+def _parse_number(number):
+    """'150.000' / '150,000' là phân cách hàng nghìn; '1.5' / '1,5' đi kèm đơn vị là số thập phân."""
+    if re.fullmatch(r"\d{1,3}(?:[.,]\d{3})+", number):
+        return float(number.replace(".", "").replace(",", ""))
+    return float(number.replace(",", "."))
+
+
+def parse_amount(text):
+    """
+    Trích xuất số tiền bằng ngữ pháp quy tắc.
+    Trả về (amount_info, confidence) với amount_info cùng định dạng convert_money_string_to_amount,
+    hoặc (None, 0.0) nếu không tìm thấy số tiền.
+    """
+    candidates = []
+    for match in AMOUNT_PATTERN.finditer(_normalize(text)):
+        unit = (match.group("unit") or "").lower()
+        prefix = match.group("prefix")
+        multiplier = UNIT_MULTIPLIERS.get(unit, 1)
+        currency = CURRENCY_ALIASES.get(unit) or CURRENCY_ALIASES.get(prefix or "", "vnd")
+        value = _parse_number(match.group("number"))
+        tail = match.group("tail")
+        if tail:
+            if multiplier < 1_000_000:
+                continue
+            # "1tr5" = 1,5 triệu; "2 tỷ 3" = 2,3 tỷ; "2 triệu 3" = 2,3 triệu
+            value += float(tail) / (10 ** len(tail))
+        explicit = bool(unit or prefix)
+        candidates.append((value * multiplier, currency, explicit, match.group("number")))
+
+    if not candidates:
+        return None, 0.0
+    amount, currency, explicit, number = candidates[0]
+    if len(candidates) > 1:
+        explicit_candidates = [c for c in candidates if c[2]]
+        if len(explicit_candidates) != 1:
+            return _amount_info(amount, currency), 0.4
+        amount, currency, explicit, number = explicit_candidates[0]
+        confidence = 0.85
+    elif explicit:
+        confidence = 0.95
+    elif re.search(r"[.,]\d{3}", number) or amount >= 1000:
+        confidence = 0.85
+    else:
+        # Số nhỏ không có đơn vị ("ăn 2 bát phở") rất dễ nhầm
+        confidence = 0.3
+    return _amount_info(amount, currency), confidence
+
+
+def _amount_info(amount, currency):
+    return {
+        "original_amount": amount,
+        "amount_vnd": amount * EXCHANGE_RATES.get(currency, 1),
+        "currency": currency.upper(),
+    }
@@ -0,0 +1,230 @@
+# importer.py
+import csv
+import re
+from datetime import datetime
+from functools import lru_cache
+
+from fast_parser import EXCHANGE_RATES
+from nlp_processor import convert_money_string_to_amount, extract_categories
+
+# Tên cột được chấp nhận (so khớp không phân biệt hoa thường), gồm cả file xuất sao kê ngân hàng
+COLUMN_ALIASES = {
+    "date": ["date", "ngày", "ngay", "ngày giao dịch", "ngay giao dich", "transaction date",
+             "posting date", "ngày hiệu lực", "thời gian", "time"],
+    "amount": ["amount", "số tiền", "so tien", "money", "giá trị", "value"],
+    "debit": ["debit", "ghi nợ", "ghi no", "số tiền ghi nợ", "tiền ra", "rút"],
+    "credit": ["credit", "ghi có", "ghi co", "số tiền ghi có", "tiền vào"],
+    "type": ["type", "transaction type", "loại giao dịch", "loai giao dich", "dr/cr", "nợ/có", "no/co"],
+    "category": ["category", "danh mục", "danh muc", "loại", "loai"],
+    "description": ["description", "mô tả", "mo ta", "nội dung", "noi dung", "diễn giải",
+                    "dien giai", "ghi chú", "ghi chu", "note", "details", "chi tiết giao dịch"],
+    "currency": ["currency", "tiền tệ", "loại tiền", "ccy"],
+}
+
+# Phần thập phân ở cuối số tiền sao kê ("150000.00", "1,234.50"); phân cách hàng nghìn luôn có 3 chữ số
+DECIMAL_PART = re.compile(r"[.,](\d{1,2})$")
+
+# Giá trị của cột loại giao dịch (so khớp không phân biệt hoa thường)
+DEBIT_TYPES = {"debit", "dr", "d", "nợ", "no", "ghi nợ", "ghi no", "chi", "expense", "out", "tiền ra"}
+CREDIT_TYPES = {"credit", "cr", "c", "có", "co", "ghi có", "ghi co", "thu", "income", "in", "tiền vào"}
+
+# File chỉ có một cột số tiền: tỷ lệ số âm >= SIGNED_MIN_RATIO là sao kê có dấu (số dương là khoản thu),
+# <= REFUND_MAX_RATIO là file chi tiêu không dấu với vài dòng hoàn tiền (số âm); ở giữa thì không đoán
+SIGNED_MIN_RATIO = 0.5
+REFUND_MAX_RATIO = 0.1
+
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d/%m/%y", "%Y/%m/%d", "%d.%m.%Y", "%m/%d/%Y")
+
+class ImportFormatError(Exception):
+    """File không đúng định dạng (thiếu cột bắt buộc, không đọc được header...)."""
+
+def _map_columns(header):
+    columns = {}
+    for index, name in enumerate(header):
+        key = name.strip().lower()
+        for field, aliases in COLUMN_ALIASES.items():
+            if key in aliases and field not in columns:
+                columns[field] = index
+    if "date" not in columns or ("amount" not in columns and "debit" not in columns):
+        raise ImportFormatError("File cần có cột ngày (date/ngày) và cột số tiền (amount/số tiền/ghi nợ).")
+    return columns
+
+@lru_cache(maxsize=4096)
+def parse_import_date(value: str) -> str:
+    """Chuẩn hóa ngày trong file về 'YYYY-MM-DD'; ném ValueError nếu không nhận dạng được."""
+    value = value.strip().split(" ")[0].split("T")[0]
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    raise ValueError(f"ngày không hợp lệ '{value}'")
+
+def _field(row, columns, name):
+    index = columns.get(name)
+    if index is None or index >= len(row):
+        return ""
+    return row[index].strip()
+
+def _sign_mode(rows, columns):
+    """
+    Cách phân biệt khoản chi / khoản thu, quyết định từ toàn bộ dữ liệu của file:
+    "debit" (cột ghi nợ / ghi có), "type" (cột loại giao dịch), "signed" (số âm là khoản chi)
+    hoặc "unsigned" (số dương là khoản chi, số âm là hoàn tiền). Ném ImportFormatError nếu không xác định được.
+    """
+    if "debit" in columns:
+        return "debit"
+    if "type" in columns:
+        for row in rows:
+            value = _field(row, columns, "type").lower()
+            if value and value not in DEBIT_TYPES and value not in CREDIT_TYPES:
+                raise ImportFormatError(
+                    f"Không nhận dạng được loại giao dịch '{value}'; cột loại giao dịch cần là ghi nợ/ghi có (debit/credit)."
+                )
+        return "type"
+    negative = positive = 0
+    for row in rows:
+        amount = _field(row, columns, "amount")
+        if amount.startswith("-"):
+            negative += 1
+        elif re.search(r"[1-9]", amount):
+            positive += 1
+    total = negative + positive
+    if not negative or negative <= total * REFUND_MAX_RATIO:
+        return "unsigned"
+    if negative >= total * SIGNED_MIN_RATIO:
+        return "signed"
+    raise ImportFormatError(
+        f"Cột số tiền có {negative:,} số âm và {positive:,} số dương nên không xác định được khoản nào là chi tiêu. "
+        "Hãy tách thành cột ghi nợ / ghi có (debit/credit) hoặc thêm cột loại giao dịch (type: debit/credit)."
+    )
+
+def _row_amount(row, columns, mode):
+    """(số tiền không dấu, là khoản thu hay không) của một dòng."""
+    if mode == "debit":
+        debit = _field(row, columns, "debit")
+        # Dòng không có số tiền ghi nợ là giao dịch ghi có (tiền vào)
+        if not re.search(r"[1-9]", debit):
+            credit = _field(row, columns, "credit") or _field(row, columns, "amount")
+            return credit.lstrip("+-").strip(), True
+        return debit.lstrip("+-").strip(), False
+    amount = _field(row, columns, "amount")
+    if mode == "type":
+        credit = _field(row, columns, "type").lower() in CREDIT_TYPES
+    elif mode == "signed":
+        credit = not amount.startswith("-")
+    else:
+        # Số âm trong file không dấu là hoàn tiền, không phải chi tiêu
+        credit = amount.startswith(("+", "-"))
+    return amount.lstrip("+-").strip(), credit
+
+def iter_csv_chunks(stream, chunk_size=5000):
+    """
+    Đọc file CSV theo luồng (không nạp toàn bộ vào bộ nhớ), trả về từng chunk
+    (line_no, date, amount_str, category, description, currency, credit).
+    File được đọc hai lượt: lượt đầu xác định cách phân biệt khoản chi / khoản thu, nên stream phải seek được.
+    """
+    start = stream.tell()
+    sample = stream.read(4096)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    stream.seek(start)
+    reader = csv.reader(stream, dialect)
+    header = next(reader, None)
+    if not header:
+        raise ImportFormatError("File rỗng.")
+    columns = _map_columns(header)
+    mode = _sign_mode(reader, columns)
+    stream.seek(start)
+    reader = csv.reader(stream, dialect)
+    next(reader)
+    chunk = []
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        amount, credit = _row_amount(row, columns, mode)
+        chunk.append((
+            reader.line_num,
+            _field(row, columns, "date"),
+            amount,
+            _field(row, columns, "category"),
+            _field(row, columns, "description"),
+            _field(row, columns, "currency"),
+            credit,
+        ))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def convert_import_amount(amount_str, currency=""):
+    """Số tiền không dấu trong file -> amount_info; giữ phần thập phân ("1,234.50") thay vì gộp vào phần nguyên."""
+    fraction = 0.0
+    match = DECIMAL_PART.search(amount_str)
+    if match:
+        fraction = float("0." + match.group(1))
+        amount_str = amount_str[:match.start()]
+    conv = convert_money_string_to_amount(f"{amount_str} {currency}" if currency else amount_str)
+    if fraction:
+        conv["original_amount"] += fraction
+        conv["amount_vnd"] += fraction * EXCHANGE_RATES.get(conv["currency"].lower(), 1)
+    return conv
+
+def convert_import_chunk(user_id, chunk, use_model=False):
+    """
+    Chuyển một chunk dòng CSV thành các bản ghi chi tiêu.
+    Trả về (expenses, errors, credits): errors là list (line_no, lý do), credits là list (line_no, số tiền)
+    các khoản thu (ghi có) bị bỏ qua.
+    """
+    parsed = []
+    errors = []
+    credits = []
+    for line_no, date_str, amount_str, category, description, currency, credit in chunk:
+        if credit:
+            credits.append((line_no, amount_str))
+            continue
+        try:
+            date = parse_import_date(date_str)
+        except ValueError as e:
+            errors.append((line_no, str(e)))
+            continue
+        conv = convert_import_amount(amount_str, currency)
+        if conv["amount_vnd"] <= 0:
+            errors.append((line_no, f"số tiền không hợp lệ '{amount_str}'"))
+            continue
+        parsed.append((date, conv, category, description))
+
+    # Phân loại theo lô những dòng chưa có danh mục, dựa trên mô tả giao dịch
+    to_classify = [description for _, _, category, description in parsed if not category]
+    classified = iter(extract_categories(to_classify, use_model=use_model))
+    expenses = []
+    for date, conv, category, description in parsed:
+        if not category:
+            category = next(classified)
+        expenses.append((user_id, date, conv["amount_vnd"], category, conv["currency"]))
+    return expenses, errors, credits
+
+def import_csv(path, user_id, db, chunk_size=5000, use_model=False):
+    """
+    Nhập chi tiêu từ file CSV theo từng chunk, ghi mỗi chunk bằng một transaction.
+    Sinh ra tiến độ sau mỗi chunk: dict {"rows", "imported", "errors", "credits"} (errors tích lũy,
+    credits là số khoản thu đã bỏ qua).
+    """
+    rows = 0
+    imported = 0
+    credits = 0
+    errors = []
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as stream:
+        for chunk in iter_csv_chunks(stream, chunk_size):
+            expenses, chunk_errors, chunk_credits = convert_import_chunk(user_id, chunk, use_model=use_model)
+            if expenses and not db.add_expenses(expenses):
+                chunk_errors = [(line_no, "lỗi ghi database") for line_no, *_ in chunk]
+                expenses = []
+            rows += len(chunk)
+            imported += len(expenses)
+            credits += len(chunk_credits)
+            errors += chunk_errors
+            yield {"rows": rows, "imported": imported, "errors": errors, "credits": credits}
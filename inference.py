@@ -0,0 +1,26 @@
+# inference.py
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from config import INFERENCE_WORKERS, PARSE_WORKERS
+
+# Pool giới hạn số luồng chạy NER, phân loại và sinh text cùng lúc.
+# Các lệnh chỉ đọc/ghi database chạy trực tiếp trên event loop nên không phải xếp hàng sau LLM.
+executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+# Pool cho phần xử lý tin nhắn (regex, dateparser). NER và phân loại bên trong được gửi tới
+# các micro-batcher, nên pool này cần đủ rộng để nhiều chat cùng chờ và được gom chung một batch.
+parse_executor = ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix="parse")
+
+async def run_inference(func, *args, **kwargs):
+    """Chạy một hàm inference đồng bộ trên pool và chờ kết quả mà không chặn event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+async def run_parsing(func, *args, **kwargs):
+    """Chạy bước trích xuất thông tin tin nhắn (dùng micro-batcher cho model) trên parse pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(parse_executor, functools.partial(func, *args, **kwargs))
+
+def shutdown(wait=True):
+    executor.shutdown(wait=wait, cancel_futures=True)
+    parse_executor.shutdown(wait=wait, cancel_futures=True)
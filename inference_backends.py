@@ -0,0 +1,201 @@
+# inference_backends.py
+"""
+Backend suy luận cho NER và bộ phân loại danh mục. Mọi backend đều trả về một transformers
+pipeline (cùng task, cùng định dạng kết quả), nên extract_amount / extract_category không
+cần biết mô hình đang chạy fp32, int8 hay ONNX Runtime:
+
+- transformers: pipeline gốc, fp32 (mặc định)
+- torch-int8:   lượng tử hóa động int8 các lớp Linear bằng torch khi load
+- onnx:         phiên ONNX Runtime qua optimum, từ thư mục đã export (có thể đã lượng tử hóa int8)
+
+Export / lượng tử hóa và kiểm tra độ chính xác so với fp32:
+    python inference_backends.py export --model ner --quantize
+    python inference_backends.py check --model ner --backend onnx
+"""
+import argparse
+import os
+import sys
+import time
+
+from config import (
+    HF_TOKEN, NER_MODEL, NER_TOKENIZER, CLASSIFIER_MODEL, CLASSIFIER_TOKENIZER,
+    INFERENCE_BACKEND, ONNX_MODEL_DIR, ONNX_QUANTIZED, ONNX_INTRA_OP_THREADS
+)
+
+BACKENDS = ("transformers", "torch-int8", "onnx")
+
+# Tên model trong registry -> (task, model, tokenizer, tham số thêm cho pipeline)
+MODEL_SPECS = {
+    "ner": ("ner", NER_MODEL, NER_TOKENIZER, {"aggregation_strategy": "simple"}),
+    "category": ("text-classification", CLASSIFIER_MODEL, CLASSIFIER_TOKENIZER, {}),
+}
+
+QUANTIZED_FILE = "model_quantized.onnx"
+
+# Câu mẫu cho bước kiểm tra độ chính xác khi không truyền --samples
+DEFAULT_SAMPLES = [
+    "ăn cá viên 200k", "đi chơi 100k", "mua sắm 3 triệu", "cà phê highlands 45.000 đồng",
+    "đổ xăng 80k hôm qua", "tiền điện tháng này 1tr2", "xem phim cgv 2 vé 180k",
+    "gửi tiết kiệm 5 triệu", "mua cổ phiếu 10tr", "grab đi làm 35 nghìn", "trả tiền nhà 4.500.000",
+    "ăn lẩu với bạn bè 650k", "mua áo trên shopee 299k", "nạp điện thoại 100 nghìn",
+    "Hôm nay tôi đã chi 150,000 đồng cho ăn trưa", "mua vé máy bay $120", "đi karaoke 400k tối qua",
+]
+
+
+def _auto_model_class(task):
+    if task == "ner":
+        from transformers import AutoModelForTokenClassification
+        return AutoModelForTokenClassification
+    from transformers import AutoModelForSequenceClassification
+    return AutoModelForSequenceClassification
+
+
+def _ort_model_class(task):
+    if task == "ner":
+        from optimum.onnxruntime import ORTModelForTokenClassification
+        return ORTModelForTokenClassification
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    return ORTModelForSequenceClassification
+
+
+def onnx_dir(name):
+    return os.path.join(ONNX_MODEL_DIR, name)
+
+
+def _load_transformers(task, model_id, tokenizer_id, kwargs):
+    from transformers import pipeline
+    return pipeline(task, model=model_id, tokenizer=tokenizer_id, token=HF_TOKEN, **kwargs)
+
+
+def _load_torch_int8(task, model_id, tokenizer_id, kwargs):
+    import torch
+    from transformers import AutoTokenizer, pipeline
+    model = _auto_model_class(task).from_pretrained(model_id, token=HF_TOKEN)
+    model.eval()
+    # Lượng tử hóa động: trọng số Linear lưu int8, activation lượng tử hóa lúc chạy (chỉ CPU)
+    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_id or model_id, token=HF_TOKEN)
+    return pipeline(task, model=model, tokenizer=tokenizer, device=-1, **kwargs)
+
+
+def _load_onnx(task, model_id, tokenizer_id, kwargs, name):
+    import onnxruntime
+    from transformers import AutoTokenizer, pipeline
+    path = onnx_dir(name)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"Chưa export ONNX cho '{name}' tại {path}; chạy: python inference_backends.py export --model {name}")
+    file_name = QUANTIZED_FILE if ONNX_QUANTIZED and os.path.exists(os.path.join(path, QUANTIZED_FILE)) else "model.onnx"
+    options = onnxruntime.SessionOptions()
+    if ONNX_INTRA_OP_THREADS:
+        options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+    model = _ort_model_class(task).from_pretrained(path, file_name=file_name, session_options=options)
+    tokenizer = AutoTokenizer.from_pretrained(path)
+    return pipeline(task, model=model, tokenizer=tokenizer, **kwargs)
+
+
+def load_pipeline(name, backend=None, fallback=True):
+    """
+    Load pipeline cho model `name` ("ner" / "category") bằng backend đã chọn trong config.
+    Nếu backend tối ưu không dùng được (thiếu thư viện, chưa export) thì quay về pipeline gốc.
+    """
+    backend = backend or INFERENCE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"INFERENCE_BACKEND không hợp lệ: {backend} (chọn một trong {', '.join(BACKENDS)})")
+    task, model_id, tokenizer_id, kwargs = MODEL_SPECS[name]
+    try:
+        if backend == "torch-int8":
+            return _load_torch_int8(task, model_id, tokenizer_id, kwargs)
+        if backend == "onnx":
+            return _load_onnx(task, model_id, tokenizer_id, kwargs, name)
+    except (ImportError, FileNotFoundError) as e:
+        if not fallback:
+            raise
+        print(f"Backend {backend} không khả dụng cho {name}, dùng transformers:", e)
+    return _load_transformers(task, model_id, tokenizer_id, kwargs)
+
+
+def export_onnx(name, quantize=False, output_dir=None):
+    """Export model sang ONNX (và tùy chọn lượng tử hóa động int8) vào ONNX_MODEL_DIR/<name>."""
+    from transformers import AutoTokenizer
+    task, model_id, tokenizer_id, _ = MODEL_SPECS[name]
+    path = output_dir or onnx_dir(name)
+    model = _ort_model_class(task).from_pretrained(model_id, export=True, token=HF_TOKEN)
+    model.save_pretrained(path)
+    AutoTokenizer.from_pretrained(tokenizer_id or model_id, token=HF_TOKEN).save_pretrained(path)
+    print(f"Đã export {name} ({model_id}) sang {path}")
+    if quantize:
+        from optimum.onnxruntime import ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        quantizer = ORTQuantizer.from_pretrained(path, file_name="model.onnx")
+        qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=path, quantization_config=qconfig)
+        print(f"Đã lượng tử hóa int8: {os.path.join(path, QUANTIZED_FILE)}")
+    return path
+
+
+def _prediction(name, output):
+    """Rút gọn kết quả pipeline thành giá trị so sánh được giữa hai backend."""
+    if name == "ner":
+        return tuple(sorted((ent["entity_group"], ent["word"].strip()) for ent in output))
+    output = output[0] if isinstance(output, list) else output
+    return output.get("label") or output.get("generated_text", "").strip()
+
+
+def _run(pipe, name, texts):
+    if name == "category":
+        from nlp_processor import _category_prompt
+        texts = [_category_prompt(text) for text in texts]
+    start = time.perf_counter()
+    outputs = [pipe(text) for text in texts]
+    elapsed = time.perf_counter() - start
+    return [_prediction(name, out) for out in outputs], elapsed / len(texts) * 1000
+
+
+def check_accuracy(name, backend, samples):
+    """So sánh backend với pipeline fp32 gốc trên cùng tập câu. Trả về (tỷ lệ khớp, danh sách lệch)."""
+    reference = load_pipeline(name, "transformers")
+    candidate = load_pipeline(name, backend, fallback=False)
+    expected, ref_ms = _run(reference, name, samples)
+    actual, cand_ms = _run(candidate, name, samples)
+    mismatches = [(text, e, a) for text, e, a in zip(samples, expected, actual) if e != a]
+    agreement = 1 - len(mismatches) / len(samples)
+    print(f"{name}: {backend} khớp fp32 {agreement:.1%} ({len(samples) - len(mismatches)}/{len(samples)}), "
+          f"{ref_ms:.1f} ms -> {cand_ms:.1f} ms mỗi câu")
+    return agreement, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Export model sang ONNX, tùy chọn lượng tử hóa int8")
+    export.add_argument("--model", choices=list(MODEL_SPECS), action="append", help="Mặc định: tất cả")
+    export.add_argument("--quantize", action="store_true")
+    export.add_argument("--output-dir")
+    check = sub.add_parser("check", help="Kiểm tra độ chính xác của backend so với fp32")
+    check.add_argument("--model", choices=list(MODEL_SPECS), action="append", help="Mặc định: tất cả")
+    check.add_argument("--backend", choices=[b for b in BACKENDS if b != "transformers"], default="onnx")
+    check.add_argument("--samples", help="File văn bản, mỗi dòng một tin nhắn chi tiêu")
+    check.add_argument("--min-agreement", type=float, default=0.98)
+    args = parser.parse_args()
+
+    names = args.model or list(MODEL_SPECS)
+    if args.command == "export":
+        for name in names:
+            export_onnx(name, quantize=args.quantize, output_dir=args.output_dir if len(names) == 1 else None)
+        return
+
+    samples = DEFAULT_SAMPLES
+    if args.samples:
+        with open(args.samples, encoding="utf-8") as f:
+            samples = [line.strip() for line in f if line.strip()]
+    failed = False
+    for name in names:
+        agreement, mismatches = check_accuracy(name, args.backend, samples)
+        for text, expected, actual in mismatches[:10]:
+            print(f"  - {text!r}: fp32={expected} {args.backend}={actual}")
+        failed |= agreement < args.min_agreement
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
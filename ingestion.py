@@ -0,0 +1,126 @@
+# ingestion.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class ExpenseWriter:
+    """
+    Hàng đợi ghi trễ (write-behind): gom các chi tiêu và người dùng đang chờ rồi ghi
+    bằng một transaction mỗi `flush_interval_ms` hoặc khi đủ `max_batch_rows` dòng,
+    thay vì một INSERT + commit cho mỗi tin nhắn.
+    Mỗi lần ghi trả về một Future, được resolve (True/False) sau khi batch chứa nó đã commit.
+    """
+
+    def __init__(self, db, flush_interval_ms=20, max_batch_rows=500, max_pending=10000):
+        self.db = db
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch_rows = max_batch_rows
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._worker = None
+        self.batches = 0
+        self.rows = 0
+
+    def _ensure_worker(self):
+        # Gọi khi đang giữ self._lock
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="expense-writer", daemon=True)
+            self._worker.start()
+
+    def _submit(self, kind, row):
+        future = Future()
+        # Kiểm tra và đưa vào hàng đợi trong cùng lock với close(): không phần tử nào nằm sau dấu "stop"
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("ExpenseWriter đã đóng")
+            self._ensure_worker()
+            self._queue.put_nowait((kind, row, future))
+        return future
+
+    def add_expense(self, user_id, date, amount, category, currency="VND", note=None):
+        """Đưa chi tiêu vào hàng đợi; ném queue.Full nếu hàng đợi đầy để caller ghi trực tiếp."""
+        return self._submit("expense", (user_id, date, amount, category, currency, note))
+
+    def add_expenses(self, rows):
+        """Đưa nhiều chi tiêu vào hàng đợi như một phần tử, để chúng được ghi trong cùng một transaction."""
+        return self._submit("expenses", list(rows))
+
+    def add_user(self, user_id, chat_id):
+        return self._submit("user", (user_id, chat_id))
+
+    def flush(self, timeout=None):
+        """Chờ cho đến khi mọi phần tử đã đưa vào hàng đợi trước lời gọi này được commit."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        future = Future()
+        while True:
+            with self._lock:
+                if self._worker is None:
+                    return True
+                if self._closed:
+                    # Đã đóng: mọi phần tử đã nằm trước dấu "stop", chỉ cần chờ thread ghi xong
+                    self._worker.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+                    return not self._worker.is_alive()
+                try:
+                    self._queue.put_nowait(("flush", None, future))
+                    break
+                except queue.Full:
+                    pass
+            if deadline is not None and time.monotonic() >= deadline:
+                raise queue.Full
+            time.sleep(self.flush_interval)
+        return future.result(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def close(self, timeout=None):
+        """Ngừng nhận ghi mới, ghi nốt các phần tử còn lại rồi dừng thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._worker is not None:
+            self._queue.put(("stop", None, Future()))
+            self._worker.join(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch_rows and batch[-1][0] not in ("flush", "stop"):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            expenses = [row for kind, row, _ in batch if kind == "expense"]
+            expenses += [row for kind, rows, _ in batch if kind == "expenses" for row in rows]
+            users = [row for kind, row, _ in batch if kind == "user"]
+            ok = True
+            if expenses or users:
+                # Lỗi bất kỳ chỉ làm hỏng batch này; thread phải sống tiếp để các Future còn lại được resolve
+                try:
+                    ok = self.db.write_batch(expenses=expenses, users=users)
+                except Exception as e:
+                    print(f"Lỗi khi ghi batch chi tiêu: {e}")
+                    ok = False
+                self.batches += 1
+                self.rows += len(expenses) + len(users)
+            for kind, _, future in batch:
+                future.set_result(ok if kind in ("expense", "expenses", "user") else True)
+            if batch[-1][0] == "stop":
+                return
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch_rows": (self.rows / self.batches) if self.batches else 0.0,
+            "pending": self._queue.qsize(),
+        }
@@ -1,16 +1,65 @@
 # main.py
-from telegram.ext import Updater
-from telegram_handler import setup_dispatcher
+import argparse
+from telegram.ext import Application
+from model_registry import models
+from config import (
+    TELEGRAM_TOKEN, TELEGRAM_BASE_URL, CONCURRENT_UPDATES, MODEL_WARMUP, METRICS_PORT, METRICS_HOST, WORKER_PROCESSES,
+    BOT_MODE
+)
+import inference
+import metrics
 import logging
 
-def main():
-    TOKEN = "YOUR_TELEGRAM_BOT_TOKEN_HERE"  # Replace with your Telegram bot token
-    updater = Updater(token=TOKEN, use_context=True)
-    dp = updater.dispatcher
-    setup_dispatcher(dp)
-    updater.start_polling()
+async def post_init(application: Application):
+    # Load các model trong nền sau khi bot đã nhận tin nhắn; trong lúc chờ, bot dùng fallback.
+    if MODEL_WARMUP:
+        models.warm_up()
+    if METRICS_PORT:
+        metrics.start_http_server(METRICS_PORT, METRICS_HOST)
     logging.info("Bot đã khởi chạy và đang lắng nghe tin nhắn...")
-    updater.idle()
+
+async def post_shutdown(application: Application):
+    from telegram_handler import writer
+    # Ghi nốt các chi tiêu còn trong hàng đợi trước khi thoát
+    writer.close()
+    inference.shutdown(wait=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot quản lý chi tiêu")
+    parser.add_argument(
+        "--workers", type=int, default=WORKER_PROCESSES,
+        help="Số worker process; > 0 bật chế độ supervisor chia update theo user_id"
+    )
+    parser.add_argument(
+        "--mode", choices=["polling", "webhook"], default=BOT_MODE,
+        help="Nhận update bằng long-polling hoặc qua webhook (cấu hình WEBHOOK_* trong .env)"
+    )
+    args = parser.parse_args()
+    if args.workers > 0:
+        # Supervisor không import telegram_handler: model và database chỉ được tạo trong các worker
+        from supervisor import run_supervisor
+        run_supervisor(args.workers, mode=args.mode)
+        return
+
+    from telegram_handler import setup_dispatcher
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .base_url(TELEGRAM_BASE_URL)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if args.mode == "webhook":
+        from webhook import run_webhook
+        # Update đến từ webhook server, không cần Updater (getUpdates)
+        application = builder.updater(None).build()
+        setup_dispatcher(application)
+        run_webhook(application)
+        return
+    application = builder.build()
+    setup_dispatcher(application)
+    application.run_polling()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,282 @@
+# metrics.py
+import bisect
+import functools
+import inspect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Ngưỡng bucket (giây) cho độ trễ: từ truy vấn SQLite (~0.1ms) đến sinh text (hàng chục giây)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+    def snapshot(self):
+        with self._lock:
+            return {key: value for key, value in self._values.items()}
+
+
+class Histogram:
+    """Histogram bucket cố định; mỗi lần observe chỉ tốn một bisect và một lock ngắn."""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+    def summary(self):
+        """Trả về {labels: (count, mean, p50, p95)}; phân vị được nội suy tuyến tính trong bucket."""
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        return {
+            key: (count, total / count if count else 0.0, self._quantile(counts, count, 0.5), self._quantile(counts, count, 0.95))
+            for key, (counts, total, count) in series.items()
+        }
+
+    def _quantile(self, counts, count, q):
+        if not count:
+            return 0.0
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Gauge:
+    """Giá trị đọc lúc scrape từ callback trả về một số hoặc dict {nhãn: số}."""
+
+    def __init__(self, name, help_text, callback, label="name"):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.label = label
+
+    def values(self):
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.warning(f"Không đọc được metric {self.name}: {e}")
+            return {}
+        if isinstance(value, dict):
+            return {((self.label, k),): v for k, v in value.items() if v is not None}
+        return {(): value}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(key)} {float(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def counter(self, name, help_text):
+        return self._get_or_create(name, lambda: Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._get_or_create(name, lambda: Histogram(name, help_text, buckets))
+
+    def gauge(self, name, help_text, callback, label="name"):
+        with self._lock:
+            self._metrics[name] = Gauge(name, help_text, callback, label)
+            return self._metrics[name]
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+
+registry = Registry()
+
+# Các metric dùng chung giữa các module
+stage_latency = registry.histogram("bot_stage_seconds", "Thời gian xử lý theo từng bước phân tích tin nhắn")
+inference_latency = registry.histogram("bot_inference_seconds", "Thời gian mỗi lần gọi pipeline mô hình")
+inference_batch_size = registry.histogram(
+    "bot_inference_batch_size", "Số phần tử trong mỗi lần gọi pipeline", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+db_latency = registry.histogram("bot_db_seconds", "Thời gian mỗi lời gọi phương thức Database")
+handler_latency = registry.histogram("bot_handler_seconds", "Thời gian xử lý mỗi lệnh / tin nhắn Telegram")
+errors = registry.counter("bot_errors_total", "Số lỗi theo thành phần")
+
+
+def timed(histogram, **labels):
+    """Decorator đo thời gian chạy của hàm (kể cả coroutine) vào histogram với các nhãn cho trước."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start, **labels)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """Chạy endpoint /metrics định dạng Prometheus trong một thread nền."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Metrics endpoint: http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def format_stats(limit=4000):
+    """Tóm tắt các metric cho lệnh /stats: số lần gọi, trung bình, p50/p95 (ms) và các gauge."""
+    lines = []
+    for metric in registry.metrics():
+        if isinstance(metric, Histogram):
+            rows = sorted(metric.summary().items())
+            if not rows:
+                continue
+            lines.append(f"{metric.name}:")
+            for key, (count, mean, p50, p95) in rows:
+                label = ",".join(str(v) for _, v in key) or "-"
+                if metric is inference_batch_size:
+                    lines.append(f"  {label}: n={count} avg={mean:.1f}")
+                else:
+                    lines.append(f"  {label}: n={count} avg={mean * 1000:.1f}ms p50={p50 * 1000:.1f}ms p95={p95 * 1000:.1f}ms")
+        elif isinstance(metric, Counter):
+            values = sorted(metric.snapshot().items())
+            if values:
+                lines.append(f"{metric.name}: " + ", ".join(f"{','.join(str(v) for _, v in k) or '-'}={n}" for k, n in values))
+        else:
+            values = sorted(metric.values().items())
+            if values and values[0][0] == ():
+                lines.append(f"{metric.name}: {values[0][1]:.3g}")
+            elif values:
+                lines.append(f"{metric.name}: " + ", ".join(
+                    f"{','.join(str(v) for _, v in k)}={value:.3g}" for k, value in values
+                ))
+    text = "\n".join(lines) or "Chưa có số liệu."
+    return text if len(text) <= limit else text[:limit] + "\n…"
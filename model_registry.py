@@ -0,0 +1,114 @@
+# model_registry.py
+import threading
+import time
+
+
+class ModelRegistry:
+    """
+    Registry cho các pipeline ML (NER, phân loại, sinh text).
+    Mỗi model chỉ được load ở lần đầu cần dùng, hoặc trong thread warm-up chạy nền
+    sau khi bot đã bắt đầu nhận tin nhắn, để các lệnh không cần ML được phục vụ ngay.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._errors = {}
+        self._load_times = {}
+        self._loading = set()
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader):
+        """Đăng ký hàm load (không tham số) cho model `name`."""
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+
+    def set(self, name, model):
+        """Gán trực tiếp một model đã có sẵn (ví dụ: stub khi benchmark)."""
+        with self._lock:
+            self._locks.setdefault(name, threading.Lock())
+            self._models[name] = model
+            self._errors.pop(name, None)
+
+    def get(self, name, wait=True):
+        """
+        Trả về model đã load. Nếu model chưa sẵn sàng:
+        - wait=True: load ngay trong thread hiện tại (chặn cho đến khi xong).
+        - wait=False: kích hoạt load nền và trả về None để caller dùng fallback.
+        Model load lỗi luôn trả về None.
+        """
+        if name in self._models:
+            return self._models[name]
+        if not wait:
+            self.load_async(name)
+            return None
+        return self._load(name)
+
+    def _load(self, name):
+        if name not in self._loaders and name not in self._models:
+            raise KeyError(f"Model chưa được đăng ký: {name}")
+        with self._locks[name]:
+            if name in self._models:
+                return self._models[name]
+            with self._lock:
+                self._loading.add(name)
+            start = time.perf_counter()
+            try:
+                model = self._loaders[name]()
+            except Exception as e:
+                print(f"Error loading model '{name}':", e)
+                self._errors[name] = str(e)
+                model = None
+            self._load_times[name] = time.perf_counter() - start
+            with self._lock:
+                self._models[name] = model
+                self._loading.discard(name)
+            return model
+
+    def load_async(self, name):
+        """Load model trong một thread nền (không làm gì nếu đang load hoặc đã load)."""
+        with self._lock:
+            if name in self._models or name in self._loading:
+                return None
+            self._loading.add(name)
+        thread = threading.Thread(target=self._load, args=(name,), name=f"load-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def warm_up(self, names=None):
+        """Load tuần tự các model trong một thread nền, tránh chiếm toàn bộ CPU cùng lúc."""
+        names = list(names) if names is not None else list(self._loaders)
+
+        def _run():
+            for name in names:
+                self._load(name)
+
+        thread = threading.Thread(target=_run, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self, name):
+        return self._models.get(name) is not None
+
+    def status(self):
+        """Trạng thái từng model: ready / loading / failed / pending."""
+        result = {}
+        for name in sorted(set(self._loaders) | set(self._models)):
+            if self._models.get(name) is not None:
+                result[name] = "ready"
+            elif name in self._loading:
+                result[name] = "loading"
+            elif name in self._errors or name in self._models:
+                result[name] = "failed"
+            else:
+                result[name] = "pending"
+        return result
+
+    def load_times(self):
+        """Thời gian load (giây) của các model đã load xong."""
+        return dict(self._load_times)
+
+
+models = ModelRegistry()
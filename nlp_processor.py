@@ -1,36 +1,72 @@
 # nlp_processor.py
 import re
+import threading
+from collections import Counter
 from datetime import datetime
-from transformers import pipeline
-import dateparser
-from config import HF_TOKEN, NER_MODEL, NER_TOKENIZER, CLASSIFIER_MODEL, CLASSIFIER_TOKENIZER
-
-# --- Pipeline NER --- 
-try:
-    ner_pipeline = pipeline(
-        "ner",
-        model=NER_MODEL,
-        tokenizer=NER_TOKENIZER,
-        aggregation_strategy="simple",
-        token=HF_TOKEN
-    )
-except Exception as e:
-    print("Error loading NER model:", e)
-    ner_pipeline = None
-
-# --- Pipeline for expense category classification ---
-try:
-    pipeline_category = pipeline(
-        "text-classification",
-        model=CLASSIFIER_MODEL,
-        tokenizer=CLASSIFIER_TOKENIZER,
-        token=HF_TOKEN
-    )
-except Exception as e:
-    print("Error loading expense category classifier:", e)
-    pipeline_category = None
-
-# Fallback static mapping for expense categories
+from config import (
+    MODEL_WAIT_FOR_LOAD,
+    BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, BATCH_MAX_QUEUE, BATCH_MAX_LATENCY_MS, FAST_PATH_THRESHOLD,
+    CATEGORY_CACHE_SIZE
+)
+from model_registry import models
+from inference_backends import load_pipeline
+from batching import MicroBatcher, BatchQueueFull
+from fast_parser import EXCHANGE_RATES, AMOUNT_PATTERN, KeywordIndex, parse_amount
+from date_resolver import DATE_HINT, normalize, resolve_date, strip_dates
+from cache import LRUCache
+from metrics import registry, errors, stage_latency, inference_latency, inference_batch_size
+
+# --- Pipeline NER và phân loại danh mục, qua backend chọn bằng INFERENCE_BACKEND (fp32 / int8 / ONNX) ---
+def _load_ner_pipeline():
+    return load_pipeline("ner")
+
+def _load_category_pipeline():
+    return load_pipeline("category")
+
+# Các pipeline được load lười qua registry; khi chưa sẵn sàng sẽ dùng fallback regex/static.
+models.register("ner", _load_ner_pipeline)
+models.register("category", _load_category_pipeline)
+
+# --- Micro-batching: gom request từ nhiều chat thành một batch (có padding) cho mỗi pipeline ---
+def _run_ner_batch(texts):
+    ner_pipeline = models.get("ner")
+    inference_batch_size.observe(len(texts), model="ner")
+    with inference_latency.time(model="ner"):
+        return ner_pipeline(texts, batch_size=min(len(texts), BATCH_MAX_SIZE))
+
+def _run_category_batch(prompts):
+    pipeline_category = models.get("category")
+    inference_batch_size.observe(len(prompts), model="category")
+    with inference_latency.time(model="category"):
+        outputs = pipeline_category(prompts, batch_size=min(len(prompts), BATCH_MAX_SIZE), max_new_tokens=10, truncation=True)
+    # Giữ cùng định dạng với lời gọi đơn lẻ: mỗi kết quả là một list các dict
+    return [out if isinstance(out, list) else [out] for out in outputs]
+
+ner_batcher = MicroBatcher(
+    "ner", _run_ner_batch,
+    max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+    max_queue=BATCH_MAX_QUEUE, max_latency_ms=BATCH_MAX_LATENCY_MS
+)
+category_batcher = MicroBatcher(
+    "category", _run_category_batch,
+    max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+    max_queue=BATCH_MAX_QUEUE, max_latency_ms=BATCH_MAX_LATENCY_MS
+)
+
+def batcher_stats() -> dict:
+    return {"ner": ner_batcher.stats(), "category": category_batcher.stats()}
+
+registry.gauge(
+    "bot_batch_queue_depth", "Số request đang chờ trong hàng đợi micro-batch",
+    lambda: {name: stats["queue_depth"] for name, stats in batcher_stats().items()}, label="model"
+)
+registry.gauge(
+    "bot_batch_avg_size", "Kích thước batch trung bình của mỗi pipeline",
+    lambda: {name: stats["avg_batch_size"] for name, stats in batcher_stats().items()}, label="model"
+)
+
+# Static keyword mapping for expense categories, used by the fast path and as fallback.
+# Keywords are matched on word boundaries; the longest match wins, ties go to the earlier entry.
 expense_categories_static = {
     "nhà": "Chi phí cố định",
     "điện": "Chi phí cố định",
@@ -41,8 +77,76 @@ expense_categories_static = {
     "chơi": "Giải trí",
     "đi": "Đi lại",
     "xe": "Đi lại",
-    "tiêu": "Tiêu dùng"
+    "tiêu": "Tiêu dùng",
+    "tiền nhà": "Chi phí cố định",
+    "thuê nhà": "Chi phí cố định",
+    "tiền điện": "Chi phí cố định",
+    "tiền nước": "Chi phí cố định",
+    "internet": "Chi phí cố định",
+    "wifi": "Chi phí cố định",
+    "tiền mạng": "Chi phí cố định",
+    "học phí": "Chi phí cố định",
+    "bảo hiểm": "Chi phí cố định",
+    "ăn sáng": "Tiêu dùng",
+    "ăn trưa": "Tiêu dùng",
+    "ăn tối": "Tiêu dùng",
+    "cà phê": "Tiêu dùng",
+    "cafe": "Tiêu dùng",
+    "trà sữa": "Tiêu dùng",
+    "phở": "Tiêu dùng",
+    "bún": "Tiêu dùng",
+    "cơm": "Tiêu dùng",
+    "siêu thị": "Tiêu dùng",
+    "đi chợ": "Tiêu dùng",
+    "quần áo": "Tiêu dùng",
+    "shopee": "Tiêu dùng",
+    "lazada": "Tiêu dùng",
+    "xem phim": "Giải trí",
+    "du lịch": "Giải trí",
+    "karaoke": "Giải trí",
+    "game": "Giải trí",
+    "netflix": "Giải trí",
+    "spotify": "Giải trí",
+    "nhậu": "Giải trí",
+    "grab": "Đi lại",
+    "taxi": "Đi lại",
+    "xăng": "Đi lại",
+    "đổ xăng": "Đi lại",
+    "gửi xe": "Đi lại",
+    "vé xe": "Đi lại",
+    "xe buýt": "Đi lại",
+    "vé máy bay": "Đi lại",
+    "đầu tư": "Đầu tư",
+    "chứng khoán": "Đầu tư",
+    "cổ phiếu": "Đầu tư",
+    "mua vàng": "Đầu tư",
+    "tiết kiệm": "Tiết kiệm",
+    "gửi tiết kiệm": "Tiết kiệm",
 }
+category_index = KeywordIndex(expense_categories_static)
+
+amount_regex = re.compile(r'(\d+(?:[.,]\d+)*\s*(?:triệu|tỷ|nghìn|k|đồng|usd|eur|gbp|vnd)?)', re.IGNORECASE)
+
+# Đếm số tin nhắn được phục vụ bởi fast path (không cần gọi transformers)
+_fast_path_counts = Counter()
+_fast_path_lock = threading.Lock()
+
+def _count_fast_path(field: str, fast: bool):
+    with _fast_path_lock:
+        _fast_path_counts[field + "_total"] += 1
+        if fast:
+            _fast_path_counts[field + "_fast"] += 1
+
+def fast_path_stats() -> dict:
+    """Tỷ lệ trích xuất số tiền / danh mục được phục vụ bởi fast path."""
+    with _fast_path_lock:
+        counts = dict(_fast_path_counts)
+    stats = {}
+    for field in ("amount", "category"):
+        total = counts.get(field + "_total", 0)
+        fast = counts.get(field + "_fast", 0)
+        stats[field] = {"total": total, "fast": fast, "ratio": (fast / total) if total else 0.0}
+    return stats
 
 def detect_intent(text: str) -> str:
     text_lower = text.lower()
@@ -58,12 +162,7 @@ def detect_intent(text: str) -> str:
 
 def convert_money_string_to_amount(money_str: str) -> dict:
     money_str = money_str.lower().strip()
-    exchange_rates = {
-        "usd": 23000,
-        "eur": 27000,
-        "gbp": 32000,
-        "vnd": 1,
-    }
+    exchange_rates = EXCHANGE_RATES
     detected_currency = "vnd"
     for cur in exchange_rates.keys():
         if cur in money_str:
@@ -98,71 +197,294 @@ def convert_money_string_to_amount(money_str: str) -> dict:
         "currency": detected_currency.upper()
     }
 
-def extract_amount(text: str) -> dict:
-    result = {"original_amount": 0, "amount_vnd": 0, "currency": "VND"}
-    if ner_pipeline:
-        entities = ner_pipeline(text)
-        money_entities = [ent for ent in entities if "MONEY" in ent['entity'].upper()]
-        if money_entities:
-            money_str = " ".join(ent['word'] for ent in money_entities)
-            conv = convert_money_string_to_amount(money_str)
-            if conv["amount_vnd"] > 0:
-                return conv
-    # Fallback using regex
-    amount_regex = re.compile(r'(\d+(?:[.,]\d+)*\s*(?:triệu|tỷ|nghìn|k|đồng|usd|eur|gbp|vnd)?)', re.IGNORECASE)
+def _amount_from_entities(entities):
+    money_entities = [ent for ent in entities if "MONEY" in ent['entity'].upper()]
+    if money_entities:
+        money_str = " ".join(ent['word'] for ent in money_entities)
+        conv = convert_money_string_to_amount(money_str)
+        if conv["amount_vnd"] > 0:
+            return conv
+    return None
+
+def _regex_amount(text: str) -> dict:
     match = amount_regex.search(text)
     if match:
         money_str = match.group(1)
         conv = convert_money_string_to_amount(money_str)
         return conv
-    return result
+    return {"original_amount": 0, "amount_vnd": 0, "currency": "VND"}
 
-def extract_date(text: str) -> str:
-    date_obj = dateparser.parse(text, languages=['vi'])
-    if date_obj:
-        return date_obj.strftime('%Y-%m-%d')
-    return datetime.now().strftime('%Y-%m-%d')
+def extract_amount(text: str) -> dict:
+    return extract_amounts([text])[0]
 
-def extract_category(text: str) -> str:
+def extract_amounts(texts: list) -> list:
     """
-    If the category classification pipeline is available, use it; otherwise, fallback to static mapping.
+    Trích xuất số tiền cho nhiều đoạn văn bản. Fast path ngữ pháp trước ("ăn cá viên 200k" không cần NER);
+    các đoạn còn lại được gửi vào NER batcher cùng lúc, cuối cùng mới dùng regex.
     """
-    if pipeline_category:
+    results = [None] * len(texts)
+    pending = []
+    for index, text in enumerate(texts):
+        fast_result, confidence = parse_amount(text)
+        _count_fast_path("amount", confidence >= FAST_PATH_THRESHOLD)
+        if confidence >= FAST_PATH_THRESHOLD:
+            results[index] = fast_result
+        else:
+            pending.append(index)
+    if pending and models.get("ner", wait=MODEL_WAIT_FOR_LOAD):
         try:
-            prompt = (f"Giao dịch chi tiêu: \"{text}\".\n"
-                      "Hãy xếp giao dịch này vào một trong các danh mục sau: Tiêu dùng, Đầu tư, Giải trí, Tiết kiệm, Đi lại, Chi phí cố định. "
-                      "Chỉ trả về tên danh mục.")
-            result = pipeline_category(prompt, max_new_tokens=10, truncation=True)
-            predicted_category = result[0]['generated_text'].strip()
-            return predicted_category
+            entity_lists = ner_batcher.run_many([texts[index] for index in pending])
+        except (BatchQueueFull, TimeoutError) as e:
+            print("NER batcher unavailable, falling back to regex:", e)
+            errors.inc(component="ner")
+            entity_lists = [[] for _ in pending]
+        for index, entities in zip(pending, entity_lists):
+            results[index] = _amount_from_entities(entities)
+    # Fallback using regex
+    return [result if result is not None else _regex_amount(text) for text, result in zip(texts, results)]
+
+def find_date(text: str, reference=None):
+    """Ngày được nhắc tới trong văn bản dạng 'YYYY-MM-DD', hoặc None nếu văn bản không nói tới ngày nào."""
+    reference = reference or datetime.now()
+    resolved = resolve_date(text, reference.date())
+    if resolved:
+        return resolved.strftime('%Y-%m-%d')
+    normalized = normalize(text)
+    if DATE_HINT.search(normalized):
+        import dateparser
+        # Bỏ số tiền trước khi gọi dateparser để tránh hiểu nhầm "200k" thành ngày
+        date_text = AMOUNT_PATTERN.sub(" ", normalized).strip()
+        with stage_latency.time(stage="dateparser"):
+            date_obj = dateparser.parse(date_text, languages=['vi'], settings={"RELATIVE_BASE": reference}) if date_text else None
+        if date_obj:
+            return date_obj.strftime('%Y-%m-%d')
+    return None
+
+def extract_date(text: str, reference=None) -> str:
+    """
+    Resolve the expense date. Common Vietnamese expressions are handled by the precompiled
+    resolver; dateparser is only used when the text hints at a date no known pattern matches.
+    """
+    reference = reference or datetime.now()
+    return find_date(text, reference) or reference.strftime('%Y-%m-%d')
+
+# Cache danh mục hai tầng: LRU toàn cục (từ khóa -> danh mục do mô hình phân loại) và
+# bộ nhớ bền theo từng người dùng (CategoryMemory), được gắn vào lúc khởi động bot.
+category_cache = LRUCache(maxsize=CATEGORY_CACHE_SIZE)
+category_memory = None
+
+def set_category_memory(memory):
+    global category_memory
+    category_memory = memory
+
+def category_key(text: str) -> str:
+    """Chuẩn hóa nội dung giao dịch thành từ khóa: bỏ số tiền, cụm chỉ ngày và dấu câu."""
+    key = strip_dates(AMOUNT_PATTERN.sub(" ", normalize(text)))
+    key = re.sub(r"[^\w\s]", " ", key)
+    return re.sub(r"\s+", " ", key).strip()
+
+def category_cache_stats() -> dict:
+    return {
+        "global": category_cache.stats(),
+        "user": category_memory.stats() if category_memory else None,
+    }
+
+registry.gauge(
+    "bot_category_cache_hit_ratio", "Tỷ lệ hit của cache danh mục (global: LRU, user: bộ nhớ theo người dùng)",
+    lambda: {name: stats["hit_rate"] for name, stats in category_cache_stats().items() if stats}, label="cache"
+)
+registry.gauge(
+    "bot_fast_path_ratio", "Tỷ lệ trích xuất được phục vụ bởi fast path quy tắc",
+    lambda: {name: stats["ratio"] for name, stats in fast_path_stats().items()}, label="field"
+)
+
+def _category_prompt(text: str) -> str:
+    return (f"Giao dịch chi tiêu: \"{text}\".\n"
+            "Hãy xếp giao dịch này vào một trong các danh mục sau: Tiêu dùng, Đầu tư, Giải trí, Tiết kiệm, Đi lại, Chi phí cố định. "
+            "Chỉ trả về tên danh mục.")
+
+def _static_category(text: str) -> str:
+    category, _ = category_index.best(text)
+    return category or "Khác"
+
+def _known_category(text: str, key: str, user_id=None):
+    """Danh mục không cần gọi mô hình: bộ nhớ của người dùng, từ khóa rõ ràng (fast path), cache toàn cục."""
+    if user_id and key and category_memory:
+        learned = category_memory.lookup(user_id, key)
+        if learned:
+            return learned
+    fast_category, confidence = category_index.best(text)
+    _count_fast_path("category", confidence >= FAST_PATH_THRESHOLD)
+    if confidence >= FAST_PATH_THRESHOLD:
+        return fast_category
+    return category_cache.get(key) if key else None
+
+def extract_category(text: str, user_id=None) -> str:
+    """
+    Resolve the category in order: the user's learned keyword memory, an unambiguous keyword
+    (fast path), the global classifier cache, the category classification pipeline, and finally
+    the static mapping. Cache hits never call pipeline_category.
+    """
+    return extract_item_categories([text], user_id)[0]
+
+def extract_item_categories(texts: list, user_id=None) -> list:
+    """
+    Dạng theo lô của extract_category cho các khoản chi của cùng một người dùng: các khoản chưa biết
+    danh mục được gửi vào batcher phân loại cùng lúc, kết quả được ghi vào cache và bộ nhớ người dùng.
+    """
+    keys = [category_key(text) for text in texts]
+    categories = [_known_category(text, key, user_id) for text, key in zip(texts, keys)]
+    pending = [index for index, category in enumerate(categories) if not category]
+    if pending and models.get("category", wait=MODEL_WAIT_FOR_LOAD):
+        try:
+            results = category_batcher.run_many([_category_prompt(texts[index]) for index in pending])
+            for index, result in zip(pending, results):
+                predicted_category = result[0]['generated_text'].strip()
+                categories[index] = predicted_category
+                if keys[index]:
+                    category_cache.set(keys[index], predicted_category)
+                    if user_id and category_memory:
+                        category_memory.learn(user_id, keys[index], predicted_category)
         except Exception as e:
             print("Error during category classification:", e)
+            errors.inc(component="category")
     # Fallback static mapping
-    text_lower = text.lower()
-    for key, category in expense_categories_static.items():
-        if key in text_lower:
-            return category
-    return "Khác"
+    return [category or _static_category(text) for text, category in zip(texts, categories)]
 
-def extract_expense_info(text: str) -> dict:
-    intent = detect_intent(text)
-    result = {"intent": intent, "original_text": text}
-    if intent != "expense_entry":
-        return result
-    amount_info = extract_amount(text)
-    category = extract_category(text)
-    date_info = extract_date(text)
+def extract_categories(texts: list, use_model: bool = True) -> list:
+    """
+    Batched form of extract_category: each distinct text is classified once, with a single
+    pipeline call for the whole list. Falls back to static mapping for anything not classified.
+    """
+    unique_texts = list(dict.fromkeys(texts))
+    categories = {}
+    keys = {text: category_key(text) for text in unique_texts}
+    for text in unique_texts:
+        cached = category_cache.get(keys[text]) if keys[text] else None
+        if cached:
+            categories[text] = cached
+    to_classify = [text for text in unique_texts if text not in categories]
+    if use_model and to_classify and models.get("category", wait=MODEL_WAIT_FOR_LOAD):
+        try:
+            results = _run_category_batch([_category_prompt(text) for text in to_classify])
+            for text, result in zip(to_classify, results):
+                categories[text] = result[0]['generated_text'].strip()
+                if keys[text]:
+                    category_cache.set(keys[text], categories[text])
+        except Exception as e:
+            print("Error during category classification:", e)
+            errors.inc(component="category")
+    for text in unique_texts:
+        if text not in categories:
+            categories[text] = _static_category(text)
+    return [categories[text] for text in texts]
+
+# Các khoản chi trong một tin nhắn được ngăn bởi xuống dòng, ";" hoặc dấu phẩy không nằm giữa hai chữ số
+# (để "150,000 đồng" không bị tách)
+ITEM_SEPARATOR = re.compile(r"[\n;]|(?<!\d),|,(?!\d)")
+
+# Số có phân cách hàng nghìn ("150.000", "1,200,000") được coi là số tiền dù không có đơn vị
+GROUPED_NUMBER = re.compile(r"\d{1,3}(?:[.,]\d{3})+")
+
+def _has_amount(fragment: str) -> bool:
+    """
+    Đoạn có số tiền rõ ràng: có đơn vị / tiền tệ, số có phân cách hàng nghìn, hoặc parser quy tắc đủ tin cậy.
+    Số lượng trần như "mua 2 cái áo" không tính, để "mua 2 cái áo, 300k" vẫn là một khoản chi.
+    """
+    text = strip_dates(normalize(fragment))
+    for match in AMOUNT_PATTERN.finditer(text):
+        if match.group("unit") or match.group("prefix") or GROUPED_NUMBER.fullmatch(match.group("number")):
+            return True
+    return parse_amount(text)[1] >= FAST_PATH_THRESHOLD
+
+def _fragments(text: str) -> list:
+    fragments = (fragment.strip(" \t-•*+.:") for fragment in ITEM_SEPARATOR.split(text))
+    return [fragment for fragment in fragments if fragment]
+
+def _leading_header(text: str) -> str:
+    """Các đoạn không có số tiền ở đầu tin nhắn, ví dụ dòng "hôm qua:" trước danh sách chi tiêu."""
+    header = []
+    for fragment in _fragments(text):
+        if _has_amount(fragment):
+            break
+        header.append(fragment)
+    return " ".join(header)
+
+def split_expense_items(text: str) -> list:
+    """
+    Tách tin nhắn thành từng khoản chi. Đoạn không có số tiền ("hôm qua:", "ăn sáng, trưa 50k")
+    được ghép vào khoản chi ngay sau nó, hoặc khoản chi cuối nếu nằm ở cuối tin nhắn.
+    """
+    items, pending = [], []
+    for fragment in _fragments(text):
+        if _has_amount(fragment):
+            items.append(", ".join(pending + [fragment]))
+            pending = []
+        else:
+            pending.append(fragment)
+    if pending:
+        if items:
+            items[-1] = ", ".join([items[-1]] + pending)
+        else:
+            items.append(", ".join(pending))
+    return items or [text]
+
+def _expense_fields(text, amount_info, category, date_info) -> dict:
     missing_fields = []
     if amount_info["amount_vnd"] == 0:
         missing_fields.append("amount")
-    complete = (len(missing_fields) == 0)
-    result.update({
+    return {
+        "text": text,
         "amount_info": amount_info,
         "category": category,
+        "category_key": category_key(text),
         "date": date_info,
-        "complete": complete,
+        "complete": not missing_fields,
         "missing_fields": missing_fields
-    })
+    }
+
+def extract_expense_items(text: str, user_id=None) -> dict:
+    """
+    Như extract_expense_info nhưng cho tin nhắn có thể gồm nhiều khoản chi ("ăn sáng 30k\ncafe 25k").
+    Số tiền và danh mục của mọi khoản được trích xuất theo lô; khoản không nhắc ngày dùng ngày ở dòng
+    đầu tin nhắn ("hôm qua:") nếu có, không thì hôm nay. Kết quả có "items": list các dict cùng trường
+    với extract_expense_info.
+    """
+    with stage_latency.time(stage="intent"):
+        intent = detect_intent(text)
+    result = {"intent": intent, "original_text": text}
+    if intent != "expense_entry":
+        return result
+    with stage_latency.time(stage="split"):
+        texts = split_expense_items(text)
+    with stage_latency.time(stage="amount"):
+        amounts = extract_amounts(texts)
+    with stage_latency.time(stage="category"):
+        categories = extract_item_categories(texts, user_id)
+    with stage_latency.time(stage="date"):
+        reference = datetime.now()
+        header = _leading_header(text) if len(texts) > 1 else ""
+        default_date = (find_date(header, reference) if header else None) or reference.strftime('%Y-%m-%d')
+        dates = [find_date(item_text, reference) or default_date for item_text in texts]
+    result["items"] = [
+        _expense_fields(item_text, amount_info, category, date_info)
+        for item_text, amount_info, category, date_info in zip(texts, amounts, categories, dates)
+    ]
+    return result
+
+def extract_expense_info(text: str, user_id=None) -> dict:
+    with stage_latency.time(stage="intent"):
+        intent = detect_intent(text)
+    result = {"intent": intent, "original_text": text}
+    if intent != "expense_entry":
+        return result
+    with stage_latency.time(stage="amount"):
+        amount_info = extract_amount(text)
+    with stage_latency.time(stage="category"):
+        category = extract_category(text, user_id)
+    with stage_latency.time(stage="date"):
+        date_info = extract_date(text)
+    result.update(_expense_fields(text, amount_info, category, date_info))
     return result
 
 def parse_profile_info(text: str) -> dict:
@@ -200,6 +522,18 @@ def parse_profile_info(text: str) -> dict:
     return profile
 
 if __name__ == "__main__":
+    # Tách khoản chi: số lượng trần không phải số tiền nên không tạo khoản chi riêng
+    split_cases = {
+        "mua 2 cái áo, 300k": ["mua 2 cái áo, 300k"],
+        "ăn 2 tô phở, 100k": ["ăn 2 tô phở, 100k"],
+        "đổ 5 lít xăng, 120k": ["đổ 5 lít xăng, 120k"],
+        "ăn sáng 30k, cafe 25k": ["ăn sáng 30k", "cafe 25k"],
+        "hôm qua:\nbánh mì 20k\ngửi xe 5.000": ["hôm qua, bánh mì 20k", "gửi xe 5.000"],
+    }
+    for text, expected in split_cases.items():
+        assert split_expense_items(text) == expected, (text, split_expense_items(text))
+
+    models.warm_up().join()
     # Test expense extraction
     test_texts = [
         "ăn cá viên 200k",
@@ -0,0 +1,83 @@
+# prompt_cache.py
+import copy
+import threading
+import time
+
+from metrics import registry
+
+prefix_hits = registry.counter("bot_prompt_prefix_total", "Số lần sinh text dùng lại (hit) hoặc phải tính (miss) KV-cache của prefix")
+
+
+class PrefixCache:
+    """
+    KV-cache (past_key_values) của phần prompt cố định cho một causal LM, tính một lần mỗi process.
+    Mỗi lần sinh text chỉ còn phải prefill phần token thay đổi phía sau prefix.
+
+    Prefix và phần thay đổi được tokenize riêng rồi ghép id, nên ranh giới token luôn trùng với
+    cache. Model không hỗ trợ truyền cache vào generate thì bị tắt và caller dùng prompt đầy đủ.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._model = None
+        self._prefix_ids = None
+        self._cache = None
+        self._disabled = False
+        self.prefill_seconds = None
+
+    def prime(self, model, tokenizer):
+        """Tính KV-cache của prefix cho `model` (nếu chưa có). Trả về False nếu model không dùng được cache."""
+        if self._disabled:
+            return False
+        if self._model is model:
+            prefix_hits.inc(result="hit")
+            return True
+        with self._lock:
+            if self._model is model:
+                prefix_hits.inc(result="hit")
+                return True
+            try:
+                import torch
+                from transformers import DynamicCache
+                prefix_ids = tokenizer(self.prefix, return_tensors="pt").input_ids.to(model.device)
+                start = time.perf_counter()
+                with torch.no_grad():
+                    output = model(input_ids=prefix_ids, past_key_values=DynamicCache(), use_cache=True)
+                self.prefill_seconds = time.perf_counter() - start
+            except Exception as e:
+                print("Không thể tạo KV-cache cho prefix prompt, dùng prompt đầy đủ:", e)
+                self._disabled = True
+                return False
+            self._prefix_ids = prefix_ids
+            self._cache = output.past_key_values
+            self._model = model
+            prefix_hits.inc(result="miss")
+            return True
+
+    @property
+    def prefix_tokens(self):
+        return 0 if self._prefix_ids is None else self._prefix_ids.shape[-1]
+
+    def inputs(self, model, tokenizer, suffix_ids):
+        """
+        Tham số cho model.generate: input_ids = prefix + `suffix_ids` và một bản sao KV-cache của prefix
+        (generate ghi thêm vào cache nên mỗi request cần bản riêng). Trả về None nếu không dùng được cache.
+        """
+        if not self.prime(model, tokenizer):
+            return None
+        import torch
+        suffix = torch.tensor([suffix_ids], dtype=self._prefix_ids.dtype, device=self._prefix_ids.device)
+        input_ids = torch.cat([self._prefix_ids, suffix], dim=-1)
+        return {
+            "input_ids": input_ids,
+            "attention_mask": torch.ones_like(input_ids),
+            "past_key_values": copy.deepcopy(self._cache),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._model = None
+            self._prefix_ids = None
+            self._cache = None
+            self._disabled = False
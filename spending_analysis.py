@@ -1,11 +1,22 @@
 # spending_analysis.py
-import pandas as pd
+import hashlib
+import time
 from datetime import datetime, timedelta
-from database import Database
-from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer, pipeline
-from config import HF_TOKEN, GEN_MODEL, GEN_TOKENIZER, GEN_DEVICE
+from database import get_database
+from config import (
+    HF_TOKEN, GEN_MODEL, GEN_TOKENIZER, GEN_DEVICE, GEN_PREFIX_CACHE, GEN_PROMPT_MAX_TOKENS, GEN_MAX_NEW_TOKENS,
+    MODEL_WAIT_FOR_LOAD,
+    COMMENTARY_CACHE_SIZE, COMMENTARY_CACHE_TTL, STREAM_TOKEN_TIMEOUT
+)
+from model_registry import models
+from inference import executor
+from cache import LRUCache
+from prompt_cache import PrefixCache
+from metrics import registry, errors, stage_latency, inference_latency, timed
+
+def _load_gen_pipeline():
+    from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer, pipeline
 
-try:
     # Load configuration for the generation model
     config = AutoConfig.from_pretrained(
         GEN_MODEL,
@@ -37,15 +48,41 @@ try:
         tokenizer=tokenizer,
         device=GEN_DEVICE  # Sử dụng thiết bị từ config: GPU (0) hoặc CPU (-1)
     )
-except Exception as e:
-    print("Error loading text generation model:", e)
-    gen_pipeline = None
+    # Tính sẵn KV-cache của phần hướng dẫn cố định ngay khi load (thường trong thread warm-up)
+    if GEN_PREFIX_CACHE:
+        prefix_cache.prime(gen_pipeline.model, gen_pipeline.tokenizer)
+    return gen_pipeline
 
-def analyze_spending(user_id, period="month"):
-    """
-    Analyze the user's spending data and generate a natural financial review in Vietnamese.
-    """
-    db = Database()
+models.register("gen", _load_gen_pipeline)
+
+# Phần hướng dẫn cố định đứng đầu prompt để KV-cache của nó được dùng lại cho mọi request;
+# số liệu thay đổi theo người dùng nằm sau, ở dạng rút gọn.
+PROMPT_PREFIX = (
+    "Bạn là trợ lý tài chính cá nhân. Dựa trên số liệu chi tiêu và thông tin cá nhân bên dưới, hãy đưa ra "
+    "nhận xét và lời khuyên cải thiện cách chi tiêu một cách tự nhiên, có cảm xúc và phù hợp với hoàn cảnh. Ví dụ:\n"
+    "- Nếu chi tiêu vượt ngân sách, cảnh báo nhẹ nhàng và đề xuất giảm các khoản chi không cần thiết.\n"
+    "- Nếu một danh mục chi tiêu quá cao, gợi ý tối ưu hóa hoặc cắt giảm.\n"
+    "- Nếu chi tiêu ổn định, khen ngợi và động viên tiếp tục duy trì.\n\n"
+    "Số liệu:\n"
+)
+PROMPT_TAIL = "\nNhận xét:"
+
+prefix_cache = PrefixCache(PROMPT_PREFIX)
+
+NO_DATA_MESSAGE = "Không có dữ liệu chi tiêu trong khoảng thời gian đã chọn."
+
+# Cache nhận xét đã sinh, theo fingerprint của phần số liệu (analysis_details)
+commentary_cache = LRUCache(maxsize=COMMENTARY_CACHE_SIZE, ttl=COMMENTARY_CACHE_TTL)
+
+registry.gauge(
+    "bot_commentary_cache_hit_ratio", "Tỷ lệ hit của cache nhận xét chi tiêu",
+    lambda: commentary_cache.stats()["hit_rate"]
+)
+
+def _fingerprint(analysis_details: str) -> str:
+    return hashlib.sha1(analysis_details.encode("utf-8")).hexdigest()
+
+def _period_range(period):
     today = datetime.now()
 
     # Xác định khoảng thời gian phân tích: day, week, month.
@@ -63,69 +100,213 @@ def analyze_spending(user_id, period="month"):
         else:
             next_month = today.replace(month=today.month+1, day=1)
         end_date = (next_month - timedelta(days=1)).strftime('%Y-%m-%d')
+    return start_date, end_date
 
-    # Lấy dữ liệu chi tiêu từ database
-    expenses = db.get_expenses_by_period(user_id, start_date, end_date)
-    if not expenses:
-        return "Không có dữ liệu chi tiêu trong khoảng thời gian đã chọn."
+def load_analysis_data(db, user_id, period="month"):
+    """Số liệu của kỳ phân tích: (SpendingSummary, profile), hoặc None nếu không có chi tiêu trong kỳ."""
+    start_date, end_date = _period_range(period)
+    # Tổng và phân bổ theo danh mục được tính trong SQLite (GROUP BY trên bảng rollup)
+    summary = db.get_spending_summary(user_id, start_date, end_date)
+    if not summary:
+        return None
+    return summary, db.get_profile(user_id)
 
-    # Nếu dữ liệu không có cột 'currency', thêm mặc định là "VND".
-    if len(expenses[0]) == 5:
-        expenses = [row + ("VND",) for row in expenses]
-
-    df = pd.DataFrame(expenses, columns=["id", "user_id", "date", "amount", "category", "currency"])
-    total = df["amount"].sum()
-    category_sum = df.groupby("category")["amount"].sum()
+def format_analysis_details(summary, profile):
+    """Báo cáo số liệu gửi cho người dùng (tổng, phân bổ theo danh mục, so sánh với hồ sơ)."""
+    total = summary.total
 
     # Xây dựng báo cáo chi tiết
-    analysis_details = f"Từ {start_date} đến {end_date}, tổng chi tiêu của bạn là {total:,.0f} đồng.\n"
-    if not category_sum.empty:
-        analysis_details += "Chi tiêu theo từng danh mục:\n"
-        for cat, amt in category_sum.items():
-            percentage = (amt / total * 100) if total > 0 else 0
-            analysis_details += f" - {cat}: {amt:,.0f} đồng ({percentage:.1f}%)\n"
-
-    # Lấy thông tin profile của người dùng từ database
-    profile = db.get_profile(user_id)
+    analysis_details = f"Từ {summary.start_date} đến {summary.end_date}, tổng chi tiêu của bạn là {total:,.0f} đồng.\n"
+    analysis_details += "Chi tiêu theo từng danh mục:\n"
+    for cat, amt in summary.by_category:
+        percentage = (amt / total * 100) if total > 0 else 0
+        analysis_details += f" - {cat}: {amt:,.0f} đồng ({percentage:.1f}%)\n"
+
     if profile:
-        name, income, budget, savings_goal, spending_targets = profile
         analysis_details += f"\nThông tin cá nhân:\n"
-        analysis_details += f" - Ngân sách định sẵn: {budget:,.0f} đồng\n"
-        analysis_details += f" - Thu nhập: {income:,.0f} đồng\n"
-        analysis_details += f" - Mục tiêu tiết kiệm: {savings_goal:,.0f} đồng\n"
-        analysis_details += f" - Mục tiêu sử dụng: {spending_targets}\n"
-        if total > budget:
+        analysis_details += f" - Ngân sách định sẵn: {profile.budget:,.0f} đồng\n"
+        analysis_details += f" - Thu nhập: {profile.income:,.0f} đồng\n"
+        analysis_details += f" - Mục tiêu tiết kiệm: {profile.savings_goal:,.0f} đồng\n"
+        analysis_details += f" - Mục tiêu sử dụng: {profile.spending_targets}\n"
+        if total > profile.budget:
             analysis_details += "⚠️ Bạn đã vượt ngân sách định sẵn!\n"
         else:
             analysis_details += "✅ Chi tiêu của bạn nằm trong ngân sách định sẵn.\n"
     else:
         analysis_details += "\nChưa có thông tin cá nhân để so sánh.\n"
+    return analysis_details
 
-    # Tạo prompt cho mô hình sinh text
-    prompt = (
-        f"{analysis_details}\n"
-        "Dựa trên các số liệu và thông tin cá nhân trên, hãy đưa ra nhận xét và lời khuyên cải thiện cách chi tiêu của bạn một cách tự nhiên, "
-        "có cảm xúc và phù hợp với hoàn cảnh. Ví dụ:\n"
-        "- Nếu chi tiêu vượt ngân sách, cảnh báo nhẹ nhàng và đề xuất giảm các khoản chi không cần thiết.\n"
-        "- Nếu một danh mục chi tiêu quá cao, gợi ý tối ưu hóa hoặc cắt giảm.\n"
-        "- Nếu chi tiêu ổn định, khen ngợi và động viên tiếp tục duy trì.\n"
-    )
-    
-    print("Prompt:", prompt)
-    
+def build_analysis_details(db, user_id, period="month"):
+    """
+    Build the numeric summary (totals, per-category breakdown, profile comparison).
+    Returns None when there is no spending data in the period.
+    """
+    data = load_analysis_data(db, user_id, period)
+    return format_analysis_details(*data) if data else None
+
+def format_prompt_details(summary, profile, max_categories=None):
+    """
+    Số liệu rút gọn cho mô hình: các danh mục lớn nhất trước, phần còn lại gộp thành "các mục khác"
+    khi giới hạn bởi `max_categories`.
+    """
+    total = summary.total
+    categories = sorted(summary.by_category, key=lambda item: item[1], reverse=True)
+    if max_categories is not None and len(categories) > max_categories:
+        rest = sum(amt for _, amt in categories[max_categories:])
+        categories = categories[:max_categories] + [("các mục khác", rest)]
+    share = lambda amt: f"{amt / total * 100:.0f}%" if total > 0 else "0%"
+    lines = [
+        f"Kỳ {summary.start_date} đến {summary.end_date}, tổng chi {total:,.0f}đ.",
+        "Danh mục: " + "; ".join(f"{cat} {amt:,.0f}đ ({share(amt)})" for cat, amt in categories) + ".",
+    ]
+    if profile:
+        status = "đã vượt ngân sách" if total > profile.budget else "trong ngân sách"
+        lines.append(
+            f"Thu nhập {profile.income:,.0f}đ, ngân sách {profile.budget:,.0f}đ ({status}), "
+            f"mục tiêu tiết kiệm {profile.savings_goal:,.0f}đ."
+        )
+        if profile.spending_targets:
+            lines.append(f"Mục tiêu sử dụng: {profile.spending_targets}.")
+    else:
+        lines.append("Chưa có thông tin cá nhân.")
+    return "\n".join(lines)
+
+def build_prompt(prompt_details):
+    return PROMPT_PREFIX + prompt_details + PROMPT_TAIL
+
+def prompt_details_ids(tokenizer, summary, profile, max_tokens=GEN_PROMPT_MAX_TOKENS):
+    """
+    Token id của phần số liệu (kèm PROMPT_TAIL), trong giới hạn `max_tokens`: bớt dần số danh mục
+    được liệt kê riêng, cuối cùng mới cắt bớt token.
+    """
+    tail_ids = tokenizer(PROMPT_TAIL, add_special_tokens=False).input_ids
+    max_categories = len(summary.by_category)
+    while True:
+        ids = tokenizer(format_prompt_details(summary, profile, max_categories), add_special_tokens=False).input_ids
+        if len(ids) + len(tail_ids) <= max_tokens or max_categories <= 1:
+            break
+        max_categories = max(1, max_categories // 2)
+    return ids[:max(0, max_tokens - len(tail_ids))] + tail_ids
+
+def _generation_inputs(gen_pipeline, summary, profile):
+    """
+    Tham số cho model.generate. Mặc định dùng KV-cache của PROMPT_PREFIX và chỉ prefill phần số liệu;
+    nếu cache bị tắt hoặc model không hỗ trợ thì tokenize lại toàn bộ prompt.
+    """
+    model, tokenizer = gen_pipeline.model, gen_pipeline.tokenizer
+    details_ids = prompt_details_ids(tokenizer, summary, profile)
+    if GEN_PREFIX_CACHE:
+        inputs = prefix_cache.inputs(model, tokenizer, details_ids)
+        if inputs is not None:
+            return inputs
+    prompt = PROMPT_PREFIX + tokenizer.decode(details_ids)
+    return dict(tokenizer(prompt, return_tensors="pt").to(model.device))
+
+def generate_commentary(gen_pipeline, summary, profile):
+    """Sinh nhận xét (chỉ phần văn bản mới) cho số liệu đã cho."""
+    if getattr(gen_pipeline, "model", None) is None:
+        # Pipeline không phải transformers (ví dụ stub khi benchmark): gọi trực tiếp với prompt đầy đủ
+        generated = gen_pipeline(
+            build_prompt(format_prompt_details(summary, profile)),
+            max_new_tokens=GEN_MAX_NEW_TOKENS, num_return_sequences=1, return_full_text=False
+        )
+        return generated[0]['generated_text']
+    inputs = _generation_inputs(gen_pipeline, summary, profile)
+    output = gen_pipeline.model.generate(**inputs, max_new_tokens=GEN_MAX_NEW_TOKENS)
+    return gen_pipeline.tokenizer.decode(output[0][inputs["input_ids"].shape[-1]:], skip_special_tokens=True)
+
+def _unavailable_commentary():
+    if models.status().get("gen") in ("loading", "pending"):
+        return "Mô hình ngôn ngữ đang được tải, vui lòng thử lại sau ít phút để nhận nhận xét tự động."
+    return "Không thể tạo nhận xét tự động vì mô hình ngôn ngữ không sẵn sàng."
+
+@timed(stage_latency, stage="analyze_spending")
+def analyze_spending(user_id, period="month"):
+    """
+    Analyze the user's spending data and generate a natural financial review in Vietnamese.
+    """
+    db = get_database()
+    with stage_latency.time(stage="analysis_summary"):
+        data = load_analysis_data(db, user_id, period)
+    if data is None:
+        return NO_DATA_MESSAGE
+    analysis_details = format_analysis_details(*data)
+
+    # Số liệu không đổi thì dùng lại nhận xét đã sinh trước đó
+    fingerprint = _fingerprint(analysis_details)
+    cached = commentary_cache.get(fingerprint)
+    if cached is not None:
+        return cached
+
+    gen_pipeline = models.get("gen", wait=MODEL_WAIT_FOR_LOAD)
     if gen_pipeline:
         try:
-            generated = gen_pipeline(prompt, max_new_tokens=100, num_return_sequences=1, truncation=True)
-            commentary = generated[0]['generated_text']
-            print("Generated commentary:", commentary)
+            with inference_latency.time(model="gen"):
+                generated = generate_commentary(gen_pipeline, *data)
+            print("Generated commentary:", generated)
+            # Hướng dẫn nằm ở đầu prompt nên không trả lại prompt; người dùng nhận số liệu kèm nhận xét
+            commentary = f"{analysis_details}\n{generated.strip()}"
+            commentary_cache.set(fingerprint, commentary)
         except Exception as e:
             commentary = "Có lỗi xảy ra khi tạo nhận xét tự động."
             print("Error during generation:", e)
+            errors.inc(component="gen")
     else:
-        commentary = "Không thể tạo nhận xét tự động vì mô hình ngôn ngữ không sẵn sàng."
+        commentary = _unavailable_commentary()
     
     return commentary
 
+def stream_spending_analysis(user_id, period="month"):
+    """
+    Streaming variant of analyze_spending. The first item yielded is the numeric summary,
+    available before generation starts; the following items are commentary text chunks
+    as the model produces them.
+    """
+    db = get_database()
+    with stage_latency.time(stage="analysis_summary"):
+        data = load_analysis_data(db, user_id, period)
+    if data is None:
+        yield NO_DATA_MESSAGE
+        return
+    analysis_details = format_analysis_details(*data)
+    yield analysis_details
+
+    # Nhận xét dạng streaming chỉ gồm phần được sinh thêm, nên cache riêng với analyze_spending
+    cache_key = _fingerprint(analysis_details) + ":stream"
+    cached = commentary_cache.get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    gen_pipeline = models.get("gen", wait=MODEL_WAIT_FOR_LOAD)
+    if not gen_pipeline:
+        yield _unavailable_commentary()
+        return
+
+    from transformers import TextIteratorStreamer
+
+    tokenizer = gen_pipeline.tokenizer
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=STREAM_TOKEN_TIMEOUT)
+    started = time.perf_counter()
+    inputs = _generation_inputs(gen_pipeline, *data)
+    # Sinh text trên pool inference (giới hạn số luồng), còn caller đọc token từ streamer
+    generation = executor.submit(gen_pipeline.model.generate, **inputs, max_new_tokens=GEN_MAX_NEW_TOKENS, streamer=streamer)
+    commentary = ""
+    try:
+        for chunk in streamer:
+            if not commentary:
+                inference_latency.observe(time.perf_counter() - started, model="gen_first_token")
+            commentary += chunk
+            yield chunk
+        generation.result()
+        inference_latency.observe(time.perf_counter() - started, model="gen_stream")
+        commentary_cache.set(cache_key, commentary)
+    except Exception as e:
+        print("Error during generation:", e)
+        errors.inc(component="gen")
+        yield "\n(Có lỗi xảy ra khi tạo nhận xét tự động.)"
+
 if __name__ == "__main__":
+    models.get("gen")
     result = analyze_spending("12345", period="month")
     print(result)
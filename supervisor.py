@@ -0,0 +1,303 @@
+# supervisor.py
+"""
+Chế độ nhiều process: supervisor nhận update từ Telegram một lần duy nhất rồi chia cho N worker
+theo crc32(user_id) % N. Mỗi worker là một process riêng với model, connection database và
+hàng đợi ghi riêng, nên phần tokenize / regex / glue code chạy song song trên nhiều core.
+Mọi update của cùng một người dùng luôn vào cùng một worker và được xử lý tuần tự ở đó,
+nên thứ tự các chi tiêu của một người không bị đảo.
+"""
+import asyncio
+import logging
+import multiprocessing as mp
+import queue
+import time
+import zlib
+
+from telegram import Update
+from telegram.ext import Application, ApplicationHandlerStop, ContextTypes, TypeHandler
+
+from config import (
+    TELEGRAM_TOKEN, TELEGRAM_BASE_URL, CONCURRENT_UPDATES, MODEL_WARMUP, METRICS_PORT, METRICS_HOST,
+    WORKER_QUEUE_SIZE, WORKER_HEARTBEAT_TIMEOUT, WORKER_HEALTH_INTERVAL, WORKER_MAX_RESTART_BACKOFF
+)
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+routed = registry.counter("bot_supervisor_routed_total", "Số update đã chuyển cho từng worker")
+restarts = registry.counter("bot_supervisor_restarts_total", "Số lần khởi động lại worker")
+lost_updates = registry.counter(
+    "bot_supervisor_lost_updates_total", "Số update bị mất khi worker chết hoặc bị dừng giữa chừng"
+)
+
+
+def shard_key(update: Update):
+    """Khóa phân shard: user_id, hoặc chat_id nếu update không có người gửi."""
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return 0
+
+
+def shard_for(key, workers):
+    return zlib.crc32(str(key).encode("utf-8")) % workers
+
+
+class Supervisor:
+    def __init__(self, workers, queue_size=WORKER_QUEUE_SIZE, heartbeat_timeout=WORKER_HEARTBEAT_TIMEOUT):
+        self.workers = workers
+        self.heartbeat_timeout = heartbeat_timeout
+        # spawn: worker khởi tạo model / SQLite từ đầu, không thừa hưởng trạng thái của supervisor
+        self._ctx = mp.get_context("spawn")
+        self.queue_size = queue_size
+        self.queues = [self._ctx.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.heartbeats = self._ctx.Array("d", workers, lock=False)
+        # Số update mỗi worker đã xử lý xong (chỉ worker đó ghi), so với số đã chuyển để biết update bị mất
+        self.finished = self._ctx.Array("q", workers, lock=False)
+        self._dispatched = [0] * workers
+        self.processes = [None] * workers
+        self._started_at = [0.0] * workers
+        self._restarts = [0] * workers
+        self._next_start = [0.0] * workers
+        self._stopping = False
+        registry.gauge(
+            "bot_worker_queue_depth", "Số update đang chờ trong hàng đợi của từng worker",
+            self.queue_depths, label="worker"
+        )
+        registry.gauge(
+            "bot_worker_alive", "Worker còn chạy (1) hay không (0)",
+            lambda: {str(i): int(p is not None and p.is_alive()) for i, p in enumerate(self.processes)}, label="worker"
+        )
+
+    def start_worker(self, index):
+        self.heartbeats[index] = 0.0
+        self.finished[index] = 0
+        process = self._ctx.Process(
+            target=run_worker, args=(index, self.workers, self.queues[index], self.heartbeats, self.finished),
+            name=f"bot-worker-{index}", daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+        self._started_at[index] = time.time()
+        logger.info(f"Đã khởi động worker {index} (pid {process.pid})")
+
+    def start(self):
+        for index in range(self.workers):
+            self.start_worker(index)
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        index = shard_for(shard_key(update), self.workers)
+        data = update.to_dict()
+        try:
+            self.queues[index].put_nowait(data)
+        except queue.Full:
+            # Worker quá tải: chờ chỗ trống (backpressure) thay vì bỏ update;
+            # worker được khởi động lại trong lúc chờ thì chuyển sang queue mới
+            while True:
+                worker_queue = self.queues[index]
+                try:
+                    await asyncio.to_thread(worker_queue.put, data, True, 1)
+                    break
+                except (queue.Full, ValueError):
+                    continue
+        self._dispatched[index] += 1
+        routed.inc(worker=str(index))
+        raise ApplicationHandlerStop
+
+    def _healthy(self, index, now):
+        process = self.processes[index]
+        if process is None or not process.is_alive():
+            return False
+        if now - self._started_at[index] < self.heartbeat_timeout:
+            return True
+        return now - self.heartbeats[index] < self.heartbeat_timeout
+
+    async def monitor(self):
+        """Kiểm tra sức khỏe định kỳ; worker chết hoặc mất heartbeat được khởi động lại (có backoff)."""
+        while not self._stopping:
+            await asyncio.sleep(WORKER_HEALTH_INTERVAL)
+            now = time.time()
+            for index in range(self.workers):
+                if self._stopping or self._healthy(index, now) or now < self._next_start[index]:
+                    continue
+                process = self.processes[index]
+                if process is not None and process.is_alive():
+                    logger.error(f"Worker {index} không phản hồi quá {self.heartbeat_timeout}s, dừng và khởi động lại")
+                    process.terminate()
+                    await asyncio.to_thread(process.join, 5)
+                else:
+                    logger.error(f"Worker {index} đã dừng (exit code {process.exitcode if process else None}), khởi động lại")
+                # Crash liên tục thì giãn thời gian khởi động lại; chạy ổn định đủ lâu thì reset backoff
+                if now - self._started_at[index] > WORKER_MAX_RESTART_BACKOFF:
+                    self._restarts[index] = 0
+                backoff = min(WORKER_MAX_RESTART_BACKOFF, 2 ** self._restarts[index])
+                self._restarts[index] += 1
+                self._next_start[index] = now + backoff
+                restarts.inc(worker=str(index))
+                await self._replace_queue(index)
+                self.start_worker(index)
+
+    async def _replace_queue(self, index):
+        """
+        Worker bị terminate() có thể đang giữ lock đọc của queue nên queue cũ không dùng lại được.
+        Chuyển các update còn lấy ra được sang queue mới, phần còn lại (kể cả update worker cũ
+        đã nhận nhưng chưa xử lý xong) được ghi log và đếm là bị mất.
+        """
+        old_queue = self.queues[index]
+        new_queue = self.queues[index] = self._ctx.Queue(maxsize=self.queue_size)
+        dispatched = self._dispatched[index]
+        self._dispatched[index] = 0
+        moved = await asyncio.to_thread(self._drain_queue, index, old_queue, new_queue)
+        lost = dispatched - self.finished[index] - moved
+        if lost > 0:
+            lost_updates.inc(lost, worker=str(index))
+            logger.error(f"Worker {index}: mất {lost} update khi khởi động lại")
+        self._dispatched[index] += moved
+
+    def _drain_queue(self, index, old_queue, new_queue):
+        moved = 0
+        try:
+            while True:
+                new_queue.put_nowait(old_queue.get(timeout=0.1))
+                moved += 1
+        except queue.Empty:
+            pass
+        except Exception as e:
+            logger.error(f"Không chuyển được update từ hàng đợi cũ của worker {index}: {e}")
+        old_queue.close()
+        # Không chờ feeder thread đẩy nốt dữ liệu vào pipe không còn ai đọc
+        old_queue.cancel_join_thread()
+        return moved
+
+    def queue_depths(self):
+        depths = {}
+        for index, worker_queue in enumerate(self.queues):
+            try:
+                depths[str(index)] = worker_queue.qsize()
+            except NotImplementedError:
+                return {}
+        return depths
+
+    def stop(self, timeout=10):
+        self._stopping = True
+        for worker_queue in self.queues:
+            try:
+                worker_queue.put(None, timeout=1)
+            except queue.Full:
+                pass
+        deadline = time.time() + timeout
+        for process in self.processes:
+            if process is not None:
+                process.join(max(0.0, deadline - time.time()))
+                if process.is_alive():
+                    process.terminate()
+
+
+def run_supervisor(workers, mode="polling"):
+    supervisor = Supervisor(workers)
+
+    async def post_init(application: Application):
+        supervisor.start()
+        application.create_task(supervisor.monitor())
+        if METRICS_PORT:
+            import metrics
+            metrics.start_http_server(METRICS_PORT, METRICS_HOST)
+        logging.info(f"Supervisor đã khởi chạy với {workers} worker")
+
+    async def post_shutdown(application: Application):
+        await asyncio.to_thread(supervisor.stop)
+
+    # Supervisor chỉ nhận và chuyển tiếp update, xử lý tuần tự để giữ đúng thứ tự nhận
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .base_url(TELEGRAM_BASE_URL)
+        .concurrent_updates(False)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if mode == "webhook":
+        from webhook import run_webhook
+        application = builder.updater(None).build()
+        application.add_handler(TypeHandler(Update, supervisor.dispatch), group=-1)
+        # Một consumer: giữ thứ tự; worker quá tải làm hàng đợi webhook đầy và Telegram nhận 429
+        run_webhook(application, concurrency=1)
+        return
+    application = builder.build()
+    application.add_handler(TypeHandler(Update, supervisor.dispatch), group=-1)
+    application.run_polling(allowed_updates=Update.ALL_TYPES)
+
+
+# --- Worker process ---
+
+def run_worker(index, workers, update_queue, heartbeats, finished):
+    logging.basicConfig(
+        format=f'%(asctime)s - worker-{index} - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    asyncio.run(_worker_main(index, workers, update_queue, heartbeats, finished))
+
+
+async def _worker_main(index, workers, update_queue, heartbeats, finished):
+    from telegram_handler import setup_dispatcher, writer
+    from model_registry import models
+    import inference
+    import metrics
+
+    application = Application.builder().token(TELEGRAM_TOKEN).base_url(TELEGRAM_BASE_URL).updater(None).build()
+    # Job định kỳ (nhắc nhở hằng ngày) chỉ chạy ở worker 0 để không gửi trùng
+    setup_dispatcher(application, schedule_jobs=(index == 0))
+    if MODEL_WARMUP:
+        models.warm_up()
+    if METRICS_PORT:
+        metrics.start_http_server(METRICS_PORT + 1 + index, METRICS_HOST)
+
+    async def heartbeat():
+        while True:
+            heartbeats[index] = time.time()
+            await asyncio.sleep(1)
+
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(CONCURRENT_UPDATES)
+    user_locks = {}
+    tasks = set()
+    async with application:
+        await application.start()
+        heartbeat_task = asyncio.create_task(heartbeat())
+        while True:
+            await slots.acquire()
+            data = await loop.run_in_executor(None, update_queue.get)
+            if data is None:
+                slots.release()
+                break
+            update = Update.de_json(data, application.bot)
+            task = asyncio.create_task(
+                _process_in_order(application, user_locks, shard_key(update), update, slots, finished, index)
+            )
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        heartbeat_task.cancel()
+        await application.stop()
+    writer.close()
+    inference.shutdown(wait=False)
+
+
+async def _process_in_order(application, user_locks, key, update, slots, finished, index):
+    """Các update của cùng một người dùng chờ nhau theo thứ tự nhận (asyncio.Lock phục vụ FIFO)."""
+    entry = user_locks.get(key)
+    if entry is None:
+        entry = user_locks[key] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            await application.process_update(update)
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Lỗi khi xử lý update {update.update_id}: {e}")
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del user_locks[key]
+        finished[index] += 1
+        slots.release()
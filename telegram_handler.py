@@ -1,49 +1,239 @@
 # telegram_handler.py
-from telegram import Update
-from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackContext
-from datetime import datetime, timedelta
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, ContextTypes, filters
+from datetime import datetime, timedelta, time as dt_time
+from zoneinfo import ZoneInfo
+import asyncio
+import io
 import logging
+import os
+import queue
+import tempfile
+import time
 
-from nlp_processor import extract_expense_info, detect_intent, parse_profile_info
-from spending_analysis import analyze_spending
-from database import Database
+from nlp_processor import (
+    extract_expense_items, detect_intent, parse_profile_info, batcher_stats, fast_path_stats,
+    category_cache_stats, set_category_memory
+)
+from spending_analysis import analyze_spending, stream_spending_analysis
+from database import get_database, profile_cache_stats
+from model_registry import models
+from inference import run_inference, run_parsing
+from ingestion import ExpenseWriter
+from category_memory import CategoryMemory
+from baselines import check_expense
+from importer import import_csv, ImportFormatError
+from delivery import DeliveryQueue
+from metrics import registry, handler_latency, timed, format_stats
+from config import (
+    INGEST_FLUSH_INTERVAL_MS, INGEST_MAX_BATCH_ROWS, INGEST_MAX_PENDING, INGEST_DURABLE,
+    IMPORT_CHUNK_SIZE, IMPORT_USE_MODEL, REVIEW_DEBOUNCE_SECONDS,
+    STREAM_COMMENTARY, STREAM_EDIT_INTERVAL,
+    REMINDER_TIME, REMINDER_TIMEZONE, REMINDER_PAGE_SIZE, REMINDER_RATE, REMINDER_CONCURRENCY, REMINDER_MAX_RETRIES,
+    ADMIN_USER_IDS, INFERENCE_BACKEND, REPORT_PAGE_ROWS, REPORT_PAGE_CHARS
+)
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
-db = Database()
+db = get_database()
+category_memory = CategoryMemory(db)
+set_category_memory(category_memory)
+writer = ExpenseWriter(
+    db,
+    flush_interval_ms=INGEST_FLUSH_INTERVAL_MS,
+    max_batch_rows=INGEST_MAX_BATCH_ROWS,
+    max_pending=INGEST_MAX_PENDING
+)
+
+registry.gauge("bot_ingest_queue_depth", "Số chi tiêu đang chờ ghi theo lô", lambda: writer.stats()["pending"])
+registry.gauge(
+    "bot_model_ready", "Mô hình đã sẵn sàng (1) hay chưa (0)",
+    lambda: {name: int(state == "ready") for name, state in models.status().items()}, label="model"
+)
+registry.gauge("bot_model_load_seconds", "Thời gian load mô hình", models.load_times, label="model")
+
+def queue_expense(user_id, date, amount, category, currency="VND", note=None):
+    """
+    Đưa chi tiêu vào hàng đợi ghi theo lô. Trả về asyncio future, resolve thành True
+    khi lô chứa chi tiêu đã commit. Nếu hàng đợi đầy thì ghi trực tiếp.
+    """
+    try:
+        return asyncio.wrap_future(writer.add_expense(user_id, date, amount, category, currency, note))
+    except queue.Full:
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(db.add_expense(user_id, date, amount, category, currency, note))
+        return future
+
+def queue_expenses(user_id, rows):
+    """
+    Đưa nhiều chi tiêu (date, amount, category, currency, note) của một người dùng vào hàng đợi ghi
+    như một phần tử, để cả nhóm được commit trong cùng một transaction.
+    """
+    rows = [(user_id, *row) for row in rows]
+    try:
+        return asyncio.wrap_future(writer.add_expenses(rows))
+    except queue.Full:
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(db.add_expenses(rows))
+        return future
+
+# Các lượt phân tích đang chờ debounce, theo user_id
+pending_reviews = {}
+
+def schedule_review(context: ContextTypes.DEFAULT_TYPE, user_id, chat_id):
+    """
+    Lên lịch phân tích chi tiêu sau REVIEW_DEBOUNCE_SECONDS. Nếu người dùng nhập thêm
+    chi tiêu trong lúc chờ, lượt cũ bị hủy để cả loạt chỉ sinh một nhận xét.
+    """
+    task = pending_reviews.get(user_id)
+    if task is not None:
+        task.cancel()
+    pending_reviews[user_id] = context.application.create_task(
+        _debounced_review(context, user_id, chat_id)
+    )
 
-def start(update: Update, context: CallbackContext):
+async def _debounced_review(context: ContextTypes.DEFAULT_TYPE, user_id, chat_id):
+    try:
+        await asyncio.sleep(REVIEW_DEBOUNCE_SECONDS)
+    except asyncio.CancelledError:
+        return
+    # Đã hết thời gian chờ: từ đây lượt này không bị hủy nữa
+    if pending_reviews.get(user_id) is asyncio.current_task():
+        del pending_reviews[user_id]
+    await send_review(context.bot, chat_id, user_id)
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+STREAM_FINAL_EDIT_RETRIES = 3
+
+async def _edit_streamed_message(message, text, retries=0):
+    """
+    Sửa tin nhắn đang stream; bỏ qua lỗi 'not modified'. Khi bị giới hạn tần suất thì chờ retry_after
+    rồi thử lại tối đa `retries` lần. Trả về True nếu tin nhắn đã hiển thị `text`.
+    """
+    for attempt in range(retries + 1):
+        try:
+            await message.edit_text(text[:TELEGRAM_MESSAGE_LIMIT])
+            return True
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+            return True
+    return False
+
+async def send_review(bot, chat_id, user_id, header=""):
+    """
+    Gửi nhận xét chi tiêu tháng. Ở chế độ streaming, phần số liệu được gửi ngay, sau đó
+    nhận xét được cập nhật dần vào một tin nhắn, tối đa một lần sửa mỗi STREAM_EDIT_INTERVAL giây.
+    """
+    if not STREAM_COMMENTARY:
+        review_message = await run_inference(analyze_spending, user_id, period="month")
+        await bot.send_message(chat_id=chat_id, text=header + review_message)
+        return
+
+    stream = stream_spending_analysis(user_id, period="month")
+    summary = await asyncio.to_thread(next, stream, None)
+    await bot.send_message(chat_id=chat_id, text=header + summary)
+    message = None
+    commentary = ""
+    shown = ""
+    last_edit = 0.0
+    while True:
+        chunk = await asyncio.to_thread(next, stream, None)
+        if chunk is None:
+            break
+        commentary += chunk
+        if not commentary.strip():
+            continue
+        if message is None:
+            message = await bot.send_message(chat_id=chat_id, text=commentary[:TELEGRAM_MESSAGE_LIMIT])
+            shown = commentary
+            last_edit = time.monotonic()
+        elif time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL:
+            # Lần sửa bị giới hạn tần suất không cập nhật `shown`, để lần sau (hoặc lần cuối) gửi lại
+            if await _edit_streamed_message(message, commentary):
+                shown = commentary
+            last_edit = time.monotonic()
+    if message is not None and commentary != shown:
+        # Lần sửa cuối phải hiển thị trọn nhận xét: thử lại sau retry_after
+        await _edit_streamed_message(message, commentary, retries=STREAM_FINAL_EDIT_RETRIES)
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.message.from_user
     chat_id = update.message.chat_id
     user_id = str(user.id)
-    db.add_user(user_id, chat_id)
-    update.message.reply_text(
+    try:
+        writer.add_user(user_id, chat_id)
+    except queue.Full:
+        db.add_user(user_id, chat_id)
+    await update.message.reply_text(
         "Chào bạn! Tôi là bot quản lý chi tiêu cá nhân thông minh.\n"
         "Hãy cập nhật thông tin cá nhân của bạn bằng lệnh /profile.\n"
         "Ví dụ: /profile Tên: Huy, Thu nhập: 15,000,000 đồng, Ngân sách: 10,000,000 đồng, Mục tiêu tiết kiệm: 5,000,000 đồng, Mục tiêu sử dụng: Tiêu dùng, Đầu tư, Giải trí, Chi phí cố định, Tiết kiệm.\n"
         "Sau đó, bạn có thể nhập giao dịch chi tiêu như: 'Hôm nay tôi đã chi 150,000 đồng cho ăn trưa'."
     )
 
-def help_command(update: Update, context: CallbackContext):
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     help_text = (
         "Hướng dẫn sử dụng bot:\n"
         "- /profile: Cập nhật thông tin cá nhân.\n"
         "- Nhập giao dịch chi tiêu bằng câu lệnh tự nhiên.\n"
         "- Bot sẽ tự động review và đưa ra lời khuyên sau mỗi giao dịch.\n"
-        "- Các lệnh báo cáo: /report, /report_week, /report_month."
+        "- Các lệnh báo cáo: /report, /report_week, /report_month (thêm 'tóm tắt' để xem bản rút gọn).\n"
+        "- /import: Nhập nhiều chi tiêu từ file CSV hoặc sao kê ngân hàng.\n"
+        "- /category <danh mục>: Sửa danh mục của chi tiêu vừa nhập, bot sẽ ghi nhớ cho lần sau.\n"
+        "- /status: Xem trạng thái sẵn sàng của các mô hình AI."
     )
-    update.message.reply_text(help_text)
+    await update.message.reply_text(help_text)
+
+async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    labels = {
+        "ready": "✅ sẵn sàng",
+        "loading": "⏳ đang tải",
+        "pending": "⏸ chưa tải",
+        "failed": "❌ lỗi (dùng chế độ dự phòng)",
+    }
+    status_text = f"Trạng thái mô hình (backend {INFERENCE_BACKEND}):\n"
+    for name, state in models.status().items():
+        status_text += f"- {name}: {labels.get(state, state)}\n"
+    status_text += "\nMicro-batching:\n"
+    for name, stats in batcher_stats().items():
+        status_text += (
+            f"- {name}: {stats['batches']} batch, {stats['items']} request, "
+            f"batch TB {stats['avg_batch_size']:.1f} (max {stats['max_batch_size']}), "
+            f"hàng đợi {stats['queue_depth']}, từ chối {stats['rejected']}\n"
+        )
+    status_text += "\nFast path (không cần mô hình):\n"
+    for name, stats in fast_path_stats().items():
+        status_text += f"- {name}: {stats['fast']}/{stats['total']} ({stats['ratio']:.0%})\n"
+    status_text += "\nCache danh mục:\n"
+    for name, stats in category_cache_stats().items():
+        if stats:
+            status_text += f"- {name}: {stats['hits']} hit / {stats['misses']} miss ({stats['hit_rate']:.0%})\n"
+    stats = profile_cache_stats()
+    status_text += f"- hồ sơ: {stats['hits']} hit / {stats['misses']} miss ({stats['hit_rate']:.0%})\n"
+    await update.message.reply_text(status_text)
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Chỉ quản trị viên (ADMIN_USER_IDS) được xem số liệu vận hành
+    if str(update.message.from_user.id) not in ADMIN_USER_IDS:
+        await update.message.reply_text("Lệnh này chỉ dành cho quản trị viên.")
+        return
+    await update.message.reply_text(format_stats(TELEGRAM_MESSAGE_LIMIT - 100))
 
-def profile(update: Update, context: CallbackContext):
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.message.from_user
     user_id = str(user.id)
     text = update.message.text
     profile_data = parse_profile_info(text)
     if not profile_data.get("name"):
-        update.message.reply_text("Không nhận diện được tên. Vui lòng nhập lại theo định dạng mẫu.")
+        await update.message.reply_text("Không nhận diện được tên. Vui lòng nhập lại theo định dạng mẫu.")
         return
     db.add_profile(
         user_id,
@@ -53,124 +243,432 @@ def profile(update: Update, context: CallbackContext):
         profile_data["savings_goal"],
         profile_data["spending_targets"]
     )
-    update.message.reply_text("Thông tin cá nhân của bạn đã được cập nhật.")
+    await update.message.reply_text("Thông tin cá nhân của bạn đã được cập nhật.")
 
-def handle_message(update: Update, context: CallbackContext):
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.message.from_user
     chat_id = update.message.chat_id
     user_id = str(user.id)
     text = update.message.text
-    info = extract_expense_info(text)
-    intent = info.get("intent", "unknown")
+    parsed = await run_parsing(extract_expense_items, text, user_id)
+    intent = parsed.get("intent", "unknown")
     
     if intent == "expense_entry":
-        amount = info["amount_info"]["amount_vnd"]
-        if amount > 50000000:
-            update.message.reply_text("❗ Khoản chi này khá lớn! Bạn có chắc chắn rằng đây là khoản chi cần thiết không?")
-        
+        if len(parsed["items"]) > 1:
+            await save_expense_items(update, context, user_id, chat_id, parsed["items"])
+            return
+        info = parsed["items"][0]
+        # Cảnh báo theo lịch sử, thu nhập và ngân sách của người dùng, tính trước khi ghi khoản chi này
+        for warning in check_expense(db, user_id, info["category"], info["amount_info"]["amount_vnd"], info["date"]):
+            await update.message.reply_text(warning)
+
         amount_info = info["amount_info"]
         amount_vnd = amount_info["amount_vnd"]
         original_amount = amount_info["original_amount"]
         currency = amount_info["currency"]
         category = info["category"]
         date_info = info["date"]
-        db.add_expense(user_id, date_info, amount_vnd, category, currency)
+        committed = queue_expense(user_id, date_info, amount_vnd, category, currency, info["category_key"])
+        if INGEST_DURABLE and not await committed:
+            await update.message.reply_text("Không thể lưu chi tiêu, vui lòng thử lại sau.")
+            return
         if currency != "VND":
-            update.message.reply_text(
+            await update.message.reply_text(
                 f"Đã lưu chi tiêu: {amount_vnd:,.0f} đồng (tương đương {original_amount:,.0f} {currency}), loại: {category}, vào ngày {date_info}."
             )
         else:
-            update.message.reply_text(
+            await update.message.reply_text(
                 f"Đã lưu chi tiêu: {amount_vnd:,.0f} đồng, loại: {category}, vào ngày {date_info}."
             )
-        review_message = analyze_spending(user_id, period="month")
-        update.message.reply_text(review_message)
+        # Đảm bảo chi tiêu đã được commit trước khi phân tích lại
+        if not await committed:
+            return
+        schedule_review(context, user_id, chat_id)
     elif intent == "report":
-        update.message.reply_text("Để xem báo cáo, hãy sử dụng các lệnh: /report, /report_week, /report_month.")
+        await update.message.reply_text("Để xem báo cáo, hãy sử dụng các lệnh: /report, /report_week, /report_month.")
     elif intent == "reminder":
-        update.message.reply_text("Lệnh nhắc nhở đã được nhận. Tôi sẽ nhắc bạn mỗi ngày tổng chi tiêu.")
+        await update.message.reply_text("Lệnh nhắc nhở đã được nhận. Tôi sẽ nhắc bạn mỗi ngày tổng chi tiêu.")
     elif intent == "profile":
-        profile(update, context)
+        await profile(update, context)
     else:
-        update.message.reply_text("Xin lỗi, tôi không hiểu yêu cầu của bạn. Vui lòng nhập lại hoặc dùng /help để được hỗ trợ.")
+        await update.message.reply_text("Xin lỗi, tôi không hiểu yêu cầu của bạn. Vui lòng nhập lại hoặc dùng /help để được hỗ trợ.")
 
-def review(update: Update, context: CallbackContext):
-    user = update.message.from_user
-    user_id = str(user.id)
-    analysis_message = analyze_spending(user_id, period="month")
-    update.message.reply_text("Nhận xét cách chi tiêu của bạn:\n" + analysis_message)
+async def save_expense_items(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id, chat_id, items):
+    """
+    Lưu các khoản chi của một tin nhắn nhiều dòng: một transaction, một tin nhắn xác nhận (kèm cảnh báo)
+    và một lượt phân tích lại.
+    """
+    saved = [item for item in items if item["complete"]]
+    skipped = [item for item in items if not item["complete"]]
+    if not saved:
+        await update.message.reply_text("Không nhận ra số tiền trong tin nhắn, vui lòng nhập lại, ví dụ: ăn sáng 30k")
+        return
+    warnings = []
+    # Các khoản chưa được ghi khi kiểm tra: cộng dồn khoản tháng này để cảnh báo ngân sách tính cả các khoản trước đó
+    month = datetime.now().strftime("%Y-%m")
+    pending = 0.0
+    for item in saved:
+        amount_vnd = item["amount_info"]["amount_vnd"]
+        warnings += check_expense(db, user_id, item["category"], amount_vnd, item["date"], pending=pending)
+        if item["date"][:7] == month:
+            pending += amount_vnd
+    committed = queue_expenses(user_id, [
+        (item["date"], item["amount_info"]["amount_vnd"], item["category"], item["amount_info"]["currency"], item["category_key"])
+        for item in saved
+    ])
+    if INGEST_DURABLE and not await committed:
+        await update.message.reply_text("Không thể lưu chi tiêu, vui lòng thử lại sau.")
+        return
+    total = sum(item["amount_info"]["amount_vnd"] for item in saved)
+    lines = [f"Đã lưu {len(saved)} chi tiêu, tổng {total:,.0f} đồng:"]
+    for item in saved:
+        amount_info = item["amount_info"]
+        line = f" - {item['text']}: {amount_info['amount_vnd']:,.0f} đồng"
+        if amount_info["currency"] != "VND":
+            line += f" ({amount_info['original_amount']:,.0f} {amount_info['currency']})"
+        lines.append(line + f", loại: {item['category']}, ngày {item['date']}")
+    if skipped:
+        lines.append("Không nhận ra số tiền ở: " + "; ".join(f"'{item['text']}'" for item in skipped))
+    lines += warnings
+    text = "\n".join(lines)
+    await update.message.reply_text(text if len(text) <= TELEGRAM_MESSAGE_LIMIT else text[:TELEGRAM_MESSAGE_LIMIT - 1] + "…")
+    # Đảm bảo chi tiêu đã được commit trước khi phân tích lại
+    if not await committed:
+        return
+    schedule_review(context, user_id, chat_id)
+
+async def category(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = str(update.message.from_user.id)
+    new_category = " ".join(context.args).strip()
+    if not new_category:
+        await update.message.reply_text("Vui lòng nhập danh mục mới, ví dụ: /category Giải trí")
+        return
+    # Chi tiêu vừa nhập có thể còn trong hàng đợi ghi
+    await asyncio.to_thread(writer.flush)
+    expense = db.get_last_expense(user_id)
+    if expense is None:
+        await update.message.reply_text("Bạn chưa có chi tiêu nào để sửa.")
+        return
+    expense_id, _, date, amount, old_category, _, note = expense
+    if not db.update_expense_category(expense_id, new_category):
+        await update.message.reply_text("Không thể cập nhật danh mục, vui lòng thử lại sau.")
+        return
+    if note:
+        category_memory.learn(user_id, note, new_category, source="user")
+    await update.message.reply_text(
+        f"Đã đổi danh mục chi tiêu {amount:,.0f} đồng ngày {date} từ '{old_category}' sang '{new_category}'."
+        + (f" Lần sau, '{note}' sẽ được xếp vào '{new_category}'." if note else "")
+    )
 
-def report(update: Update, context: CallbackContext):
+async def review(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.message.from_user
     user_id = str(user.id)
-    today = datetime.now().strftime("%Y-%m-%d")
-    total = db.get_total_expense_by_date(user_id, today)
-    expenses = db.get_expenses_by_date(user_id, today)
-    report_text = f"Báo cáo chi tiêu ngày {today}:\n"
-    for expense in expenses:
-        if len(expense) == 5:
-            expense = expense + ("VND",)
-        if expense[5] != "VND":
-            report_text += f"- {expense[4]}: {expense[3]:,.0f} đồng ({expense[5]})\n"
+    await send_review(context.bot, update.message.chat_id, user_id, header="Nhận xét cách chi tiêu của bạn:\n")
+
+# --- Báo cáo: phân trang theo khóa (date, id), mỗi trang chỉ đọc các dòng của chính nó ---
+# callback_data: "rp:<kỳ>:<ngày bắt đầu kỳ>:s" (tóm tắt) hoặc
+# "rp:<kỳ>:<ngày bắt đầu kỳ>:d:<n|p>:<date>:<id>:<offset>" (chi tiết, trang sau / trang trước)
+REPORT_CALLBACK_PREFIX = "rp"
+
+def _report_range(period, start=None):
+    """Khoảng ngày của kỳ báo cáo ("d" ngày, "w" tuần, "m" tháng) chứa hôm nay, hoặc bắt đầu từ `start`."""
+    if start:
+        start_dt = datetime.strptime(start, "%Y-%m-%d")
+    else:
+        today = datetime.now()
+        if period == "w":
+            start_dt = today - timedelta(days=today.weekday())
+        elif period == "m":
+            start_dt = today.replace(day=1)
         else:
-            report_text += f"- {expense[4]}: {expense[3]:,.0f} đồng\n"
-    report_text += f"Tổng cộng: {total:,.0f} đồng"
-    update.message.reply_text(report_text)
+            start_dt = today
+    if period == "w":
+        end_dt = start_dt + timedelta(days=6)
+    elif period == "m":
+        end_dt = (start_dt.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    else:
+        end_dt = start_dt
+    return start_dt.strftime("%Y-%m-%d"), end_dt.strftime("%Y-%m-%d")
 
-def report_week(update: Update, context: CallbackContext):
-    user = update.message.from_user
-    user_id = str(user.id)
-    today = datetime.now()
-    start_week = (today - timedelta(days=today.weekday())).strftime("%Y-%m-%d")
-    end_week = (today + timedelta(days=6 - today.weekday())).strftime("%Y-%m-%d")
-    expenses = db.get_expenses_by_period(user_id, start_week, end_week)
-    total = sum(expense[3] for expense in expenses)
-    report_text = f"Báo cáo chi tiêu tuần ({start_week} đến {end_week}):\n"
-    for expense in expenses:
-        report_text += f"- {expense[2]} - {expense[4]}: {expense[3]:,.0f} đồng\n"
-    report_text += f"Tổng cộng: {total:,.0f} đồng"
-    update.message.reply_text(report_text)
-
-def report_month(update: Update, context: CallbackContext):
-    user = update.message.from_user
-    user_id = str(user.id)
-    today = datetime.now()
-    start_month = today.replace(day=1).strftime("%Y-%m-%d")
-    if today.month == 12:
-        next_month = today.replace(year=today.year+1, month=1, day=1)
+def _report_title(period, start, end):
+    if period == "w":
+        return f"Báo cáo chi tiêu tuần ({start} đến {end})"
+    if period == "m":
+        return f"Báo cáo chi tiêu tháng {int(start[5:7])}/{start[:4]}"
+    return f"Báo cáo chi tiêu ngày {start}"
+
+def _report_line(period, expense):
+    _, _, date, amount, category, currency = expense
+    line = f"- {category}: {amount:,.0f} đồng" if period == "d" else f"- {date} - {category}: {amount:,.0f} đồng"
+    if currency and currency != "VND":
+        line += f" ({currency})"
+    return line + "\n"
+
+def build_report_page(user_id, period, start=None, direction="n", key=None, offset=0):
+    """
+    Dựng một trang báo cáo chi tiết. `offset` là số thứ tự của dòng đầu trang (khi sang trang sau)
+    hoặc của dòng ngay sau trang (khi lùi trang). Trả về (text, reply_markup); text luôn
+    không vượt REPORT_PAGE_CHARS vì chỉ giữ trọn các dòng còn vừa.
+    """
+    start, end = _report_range(period, start)
+    count = db.get_expense_count(user_id, start, end)
+    total = db.get_total_by_period(user_id, start, end)
+    header = f"{_report_title(period, start, end)}:\n"
+    footer = f"Tổng cộng: {total:,.0f} đồng ({count:,} khoản)"
+    if not count:
+        return header + "Chưa có chi tiêu nào.\n" + footer, None
+
+    rows = db.get_expenses_page(
+        user_id, start, end, key=key, direction="prev" if direction == "p" else "next", limit=REPORT_PAGE_ROWS
+    )
+    budget = REPORT_PAGE_CHARS - len(header) - len(footer) - 64
+    lines = [_report_line(period, row) for row in rows]
+    # Khi lùi trang giữ các dòng sát trang hiện tại nhất, khi sang trang giữ các dòng đầu
+    ordered = list(zip(rows, lines))[::-1] if direction == "p" else list(zip(rows, lines))
+    kept = []
+    used = 0
+    for row, line in ordered:
+        if kept and used + len(line) > budget:
+            break
+        kept.append((row, line))
+        used += len(line)
+    if direction == "p":
+        kept.reverse()
+        offset = max(0, offset - len(kept))
+    if not kept:
+        return header + "Không còn chi tiêu nào trong trang này.\n" + footer, _report_markup(period, start, None, None, 0, 0, count)
+
+    first, last = kept[0][0], kept[-1][0]
+    page = f"Khoản {offset + 1}–{offset + len(kept)} / {count:,}\n"
+    text = header + page + "".join(line for _, line in kept) + footer
+    return text, _report_markup(period, start, first, last, offset, len(kept), count)
+
+def _report_markup(period, start, first, last, offset, shown, count):
+    base = f"{REPORT_CALLBACK_PREFIX}:{period}:{start}"
+    nav = []
+    if first is not None and offset > 0:
+        nav.append(InlineKeyboardButton("◀ Trước", callback_data=f"{base}:d:p:{first[2]}:{first[0]}:{offset}"))
+    if last is not None and offset + shown < count:
+        nav.append(InlineKeyboardButton("Sau ▶", callback_data=f"{base}:d:n:{last[2]}:{last[0]}:{offset + shown}"))
+    keyboard = [nav] if nav else []
+    keyboard.append([InlineKeyboardButton("📊 Tóm tắt", callback_data=f"{base}:s")])
+    return InlineKeyboardMarkup(keyboard)
+
+def build_report_summary(user_id, period, start=None):
+    """Báo cáo rút gọn chỉ từ bảng rollup: tổng, số khoản, trung bình/ngày, theo danh mục và ngày chi nhiều nhất."""
+    start, end = _report_range(period, start)
+    summary = db.get_spending_summary(user_id, start, end)
+    count = db.get_expense_count(user_id, start, end)
+    text = f"{_report_title(period, start, end)} (tóm tắt):\n"
+    text += f"Tổng cộng: {summary.total:,.0f} đồng ({count:,} khoản)\n"
+    if summary:
+        if period != "d":
+            days = db.get_daily_totals(user_id, start, end)
+            elapsed = (min(datetime.now(), datetime.strptime(end, "%Y-%m-%d")) - datetime.strptime(start, "%Y-%m-%d")).days + 1
+            text += f"Trung bình: {summary.total / max(1, elapsed):,.0f} đồng/ngày\n"
+            peak_day, peak_total, _ = max(days, key=lambda d: d[1])
+            text += f"Ngày chi nhiều nhất: {peak_day} ({peak_total:,.0f} đồng)\n"
+        text += "Theo danh mục:\n"
+        for category, amount in sorted(summary.by_category, key=lambda c: c[1], reverse=True):
+            percentage = amount / summary.total * 100 if summary.total else 0
+            text += f"- {category}: {amount:,.0f} đồng ({percentage:.1f}%)\n"
+    markup = InlineKeyboardMarkup([[
+        InlineKeyboardButton("📋 Chi tiết", callback_data=f"{REPORT_CALLBACK_PREFIX}:{period}:{start}:d:n:::0")
+    ]])
+    return text[:REPORT_PAGE_CHARS], markup
+
+async def _send_report(update: Update, context: ContextTypes.DEFAULT_TYPE, period):
+    user_id = str(update.message.from_user.id)
+    # "/report_month tóm tắt" hoặc "/report_month summary": chỉ gửi số liệu tổng hợp
+    if " ".join(context.args or []).lower() in ("tóm tắt", "tomtat", "summary"):
+        text, markup = build_report_summary(user_id, period)
     else:
-        next_month = today.replace(month=today.month+1, day=1)
-    end_month = (next_month - timedelta(days=1)).strftime("%Y-%m-%d")
-    expenses = db.get_expenses_by_period(user_id, start_month, end_month)
-    total = sum(expense[3] for expense in expenses)
-    report_text = f"Báo cáo chi tiêu tháng {today.month}/{today.year}:\n"
-    for expense in expenses:
-        report_text += f"- {expense[2]} - {expense[4]}: {expense[3]:,.0f} đồng\n"
-    report_text += f"Tổng cộng: {total:,.0f} đồng"
-    update.message.reply_text(report_text)
-
-def daily_reminder(context: CallbackContext):
-    bot = context.bot
-    today = datetime.now().strftime("%Y-%m-%d")
-    users = db.get_all_users()
-    for user in users:
-        user_id, chat_id = user
-        total = db.get_total_expense_by_date(user_id, today)
-        message = (
-            f"Nhắc nhở: Hôm nay ({today}), bạn đã chi tiêu tổng cộng {total:,.0f} đồng.\n"
-            "Hãy cân nhắc trước khi mua sắm thêm nhé!"
-        )
-        try:
-            bot.send_message(chat_id=chat_id, text=message)
-        except Exception as e:
-            logger.error(f"Lỗi khi gửi tin nhắc nhở đến chat_id {chat_id}: {e}")
-
-def setup_dispatcher(dispatcher):
-    dispatcher.add_handler(CommandHandler("start", start))
-    dispatcher.add_handler(CommandHandler("help", help_command))
-    dispatcher.add_handler(CommandHandler("profile", profile))
-    dispatcher.add_handler(CommandHandler("review", review))
-    dispatcher.add_handler(CommandHandler("report", report))
-    dispatcher.add_handler(CommandHandler("report_week", report_week))
-    dispatcher.add_handler(CommandHandler("report_month", report_month))
-    dispatcher.add_handler(MessageHandler(Filters.text & ~Filters.command, handle_message))
+        text, markup = build_report_page(user_id, period)
+    await update.message.reply_text(text, reply_markup=markup)
+
+async def report(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _send_report(update, context, "d")
+
+async def report_week(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _send_report(update, context, "w")
+
+async def report_month(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _send_report(update, context, "m")
+
+async def report_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    user_id = str(query.from_user.id)
+    parts = query.data.split(":")
+    try:
+        period, start, mode = parts[1], parts[2], parts[3]
+        if mode == "s":
+            text, markup = build_report_summary(user_id, period, start)
+        else:
+            direction, date, expense_id, offset = parts[4], parts[5], parts[6], int(parts[7])
+            key = (date, int(expense_id)) if date else None
+            text, markup = build_report_page(user_id, period, start, direction, key, offset)
+    except (IndexError, ValueError):
+        await query.answer("Báo cáo không hợp lệ, vui lòng gọi lại lệnh báo cáo.")
+        return
+    await query.answer()
+    try:
+        await query.edit_message_text(text, reply_markup=markup)
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            raise
+
+async def import_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(
+        "Gửi file CSV (hoặc file sao kê ngân hàng xuất ra CSV) vào cuộc trò chuyện để nhập chi tiêu.\n"
+        "File cần có dòng tiêu đề với cột ngày (date/ngày) và số tiền (amount/số tiền/ghi nợ); "
+        "các cột danh mục (category/danh mục), mô tả (description/nội dung) và tiền tệ (currency) là tùy chọn.\n"
+        "Sao kê có cả khoản thu cần cột ghi có (credit), cột loại giao dịch (type: debit/credit) "
+        "hoặc số âm cho khoản chi.\n"
+        "Ví dụ:\ndate,amount,description\n2024-03-01,45000,cà phê\n02/03/2024,3 triệu,tiền nhà"
+    )
+
+async def import_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = str(update.message.from_user.id)
+    progress_message = await update.message.reply_text("Đang tải file...")
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        file = await update.message.document.get_file()
+        await file.download_to_drive(path)
+        progress = {"rows": 0, "imported": 0, "errors": [], "credits": 0}
+        last_edit = 0.0
+        chunks = import_csv(path, user_id, db, chunk_size=IMPORT_CHUNK_SIZE, use_model=IMPORT_USE_MODEL)
+        while True:
+            # Mỗi chunk được phân tích và ghi trong thread riêng để không chặn event loop
+            step = await asyncio.to_thread(next, chunks, None)
+            if step is None:
+                break
+            progress = step
+            if time.monotonic() - last_edit >= 2:
+                last_edit = time.monotonic()
+                await progress_message.edit_text(
+                    f"Đang nhập... đã xử lý {progress['rows']:,} dòng, lưu {progress['imported']:,} chi tiêu."
+                )
+    except ImportFormatError as e:
+        await progress_message.edit_text(f"Không thể nhập file: {e}")
+        return
+    finally:
+        os.remove(path)
+
+    errors = progress["errors"]
+    summary = (
+        f"Hoàn tất nhập file: {progress['imported']:,}/{progress['rows']:,} dòng đã được lưu"
+        f", {len(errors):,} dòng lỗi."
+    )
+    if progress["credits"]:
+        summary += f" Bỏ qua {progress['credits']:,} khoản thu hoặc hoàn tiền (ghi có, ví dụ tiền lương) vì không phải chi tiêu."
+
+    await progress_message.edit_text(summary)
+    if errors:
+        preview = "\n".join(f"- Dòng {line_no}: {reason}" for line_no, reason in errors[:20])
+        await update.message.reply_text("Các dòng lỗi:\n" + preview)
+        if len(errors) > 20:
+            report_file = io.BytesIO("\n".join(f"{line_no},{reason}" for line_no, reason in errors).encode("utf-8"))
+            await update.message.reply_document(report_file, filename="import_errors.csv")
+
+async def daily_reminder(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Gửi tổng chi tiêu trong ngày cho mọi người dùng. Đọc database theo từng trang,
+    gửi qua DeliveryQueue có giới hạn tốc độ và lưu checkpoint sau mỗi trang
+    để lần chạy sau (khi bot bị dừng giữa chừng) tiếp tục từ người dùng kế tiếp.
+    """
+    today = datetime.now(ZoneInfo(REMINDER_TIMEZONE)).strftime("%Y-%m-%d")
+    checkpoint = await asyncio.to_thread(db.get_reminder_checkpoint, today)
+    last_user_id, sent, failed, finished = checkpoint or ("", 0, 0, 0)
+    if finished:
+        logger.info(f"Nhắc nhở ngày {today} đã gửi xong ({sent} tin), bỏ qua.")
+        return
+    if last_user_id:
+        logger.info(f"Tiếp tục gửi nhắc nhở ngày {today} sau user_id {last_user_id}.")
+    # Chi tiêu vừa nhập có thể còn trong hàng đợi ghi
+    await asyncio.to_thread(writer.flush)
+
+    started = time.monotonic()
+    async with DeliveryQueue(
+        context.bot,
+        rate=REMINDER_RATE,
+        concurrency=REMINDER_CONCURRENCY,
+        max_retries=REMINDER_MAX_RETRIES
+    ) as delivery:
+        while True:
+            page = await asyncio.to_thread(db.get_daily_totals_page, today, last_user_id, REMINDER_PAGE_SIZE)
+            if not page:
+                break
+            for user_id, chat_id, total in page:
+                message = (
+                    f"Nhắc nhở: Hôm nay ({today}), bạn đã chi tiêu tổng cộng {total:,.0f} đồng.\n"
+                    "Hãy cân nhắc trước khi mua sắm thêm nhé!"
+                )
+                await delivery.put(chat_id, message)
+            # Chỉ ghi checkpoint khi cả trang đã gửi xong, nên khi chạy lại không ai bị bỏ sót
+            await delivery.join()
+            last_user_id = page[-1][0]
+            await asyncio.to_thread(
+                db.save_reminder_checkpoint, today, last_user_id, sent + delivery.sent, failed + delivery.failed
+            )
+        stats = delivery.stats()
+    await asyncio.to_thread(
+        db.save_reminder_checkpoint, today, last_user_id, sent + stats["sent"], failed + stats["failed"], True
+    )
+    logger.info(
+        f"Đã gửi nhắc nhở ngày {today}: {stats['sent']} thành công, {stats['failed']} lỗi, "
+        f"{stats['retried']} lần gửi lại trong {time.monotonic() - started:.1f}s."
+    )
+
+async def resume_daily_reminder(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Chạy khi bot khởi động: gửi tiếp lượt nhắc nhở hôm nay nếu lượt trước bị dừng giữa chừng
+    (checkpoint chưa finished), hoặc nếu đã qua REMINDER_TIME mà hôm nay chưa gửi xong.
+    """
+    now = datetime.now(ZoneInfo(REMINDER_TIMEZONE))
+    checkpoint = await asyncio.to_thread(db.get_reminder_checkpoint, now.strftime("%Y-%m-%d"))
+    if checkpoint is not None and checkpoint[3]:
+        return
+    hour, minute = (int(part) for part in REMINDER_TIME.split(":"))
+    if checkpoint is None and now.time() < dt_time(hour=hour, minute=minute):
+        return
+    await daily_reminder(context)
+
+def schedule_daily_reminder(application: Application):
+    if application.job_queue is None:
+        logger.warning('Chưa cài JobQueue (pip install "python-telegram-bot[job-queue]"), không lên lịch nhắc nhở.')
+        return
+    hour, minute = (int(part) for part in REMINDER_TIME.split(":"))
+    application.job_queue.run_daily(
+        daily_reminder,
+        time=dt_time(hour=hour, minute=minute, tzinfo=ZoneInfo(REMINDER_TIMEZONE)),
+        name="daily_reminder"
+    )
+    # run_daily chỉ chạy vào giờ hẹn: lượt bị gián đoạn hôm nay được tiếp tục ngay khi khởi động lại
+    application.job_queue.run_once(resume_daily_reminder, when=0, name="resume_daily_reminder")
+
+def _instrumented(name, callback):
+    return timed(handler_latency, handler=name)(callback)
+
+def setup_dispatcher(application: Application, schedule_jobs=True):
+    application.add_handler(CommandHandler("start", _instrumented("start", start)))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("status", status))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("profile", _instrumented("profile", profile)))
+    application.add_handler(CommandHandler("review", _instrumented("review", review)))
+    application.add_handler(CommandHandler("category", _instrumented("category", category)))
+    application.add_handler(CommandHandler("report", _instrumented("report", report)))
+    application.add_handler(CommandHandler("report_week", _instrumented("report_week", report_week)))
+    application.add_handler(CommandHandler("report_month", _instrumented("report_month", report_month)))
+    application.add_handler(CallbackQueryHandler(
+        _instrumented("report_page", report_page), pattern=f"^{REPORT_CALLBACK_PREFIX}:"
+    ))
+    application.add_handler(CommandHandler("import", import_command))
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension("csv") | filters.Document.MimeType("text/csv"),
+        _instrumented("import_document", import_document)
+    ))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, _instrumented("message", handle_message)))
+    if schedule_jobs:
+        schedule_daily_reminder(application)
@@ -0,0 +1,192 @@
+# webhook.py
+"""
+Chế độ webhook: một server HTTP/1.1 nhỏ trên asyncio nhận update Telegram POST tới WEBHOOK_PATH,
+kiểm tra header X-Telegram-Bot-Api-Secret-Token rồi đưa update vào một hàng đợi có giới hạn.
+Một nhóm consumer lấy update từ hàng đợi và gọi application.process_update.
+
+Khi hàng đợi đầy, server trả 429 (kèm Retry-After); khi đang dừng thì trả 503. Telegram coi mọi
+phản hồi khác 2xx là lỗi và gửi lại update sau, nên bot không nhận nhiều hơn khả năng xử lý.
+Server chỉ nói HTTP thường; TLS do reverse proxy (nginx, caddy...) phía trước đảm nhận.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import signal
+import time
+
+from telegram import Update
+from telegram.ext import Application
+
+from config import (
+    CONCURRENT_UPDATES, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WEBHOOK_MAX_PENDING, WEBHOOK_MAX_CONNECTIONS
+)
+from metrics import registry, errors, handler_latency
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1 << 20
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+REASONS = {
+    200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 429: "Too Many Requests", 503: "Service Unavailable",
+}
+
+requests_total = registry.counter("bot_webhook_requests_total", "Số request webhook theo mã trạng thái trả về")
+queue_wait = registry.histogram("bot_webhook_queue_seconds", "Thời gian update webhook chờ trong hàng đợi trước khi được xử lý")
+
+
+class WebhookServer:
+    def __init__(self, application: Application, path=WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                 max_pending=WEBHOOK_MAX_PENDING, concurrency=CONCURRENT_UPDATES):
+        if not secret_token:
+            raise ValueError("Chế độ webhook cần WEBHOOK_SECRET để xác thực request từ Telegram")
+        self.application = application
+        self.path = path
+        self._secret = secret_token.encode("utf-8")
+        self.concurrency = concurrency
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self._server = None
+        self._consumers = []
+        self._accepting = False
+        registry.gauge("bot_webhook_queue_depth", "Số update webhook đang chờ xử lý", self.queue.qsize)
+
+    async def start(self, host=WEBHOOK_LISTEN, port=WEBHOOK_PORT):
+        self._consumers = [asyncio.create_task(self._consume()) for _ in range(self.concurrency)]
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        self._accepting = True
+        address = self._server.sockets[0].getsockname()
+        logger.info(f"Webhook server: http://{address[0]}:{address[1]}{self.path}")
+        return address
+
+    async def stop(self, timeout=10):
+        """Ngừng nhận update (trả 503), xử lý nốt hàng đợi trong `timeout` giây rồi dừng consumer."""
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Bỏ {self.queue.qsize()} update webhook chưa xử lý khi dừng")
+        for task in self._consumers:
+            task.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def accept(self, method, target, headers, body):
+        """Kiểm tra request và đưa update vào hàng đợi. Trả về mã trạng thái HTTP."""
+        if target.split("?", 1)[0] != self.path:
+            return 404
+        if method != "POST":
+            return 405
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, "").encode("utf-8"), self._secret):
+            return 403
+        if not self._accepting:
+            return 503
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return 400
+        if not isinstance(data, dict) or "update_id" not in data:
+            return 400
+        try:
+            self.queue.put_nowait((data, time.perf_counter()))
+        except asyncio.QueueFull:
+            return 429
+        return 200
+
+    async def _handle_connection(self, reader, writer):
+        # Telegram giữ kết nối keep-alive và gửi tuần tự nhiều update trên cùng một kết nối
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, keep_alive=False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                if length < 0 or length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413 if length > 0 else 400, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status = self.accept(method, target, headers, body)
+                requests_total.inc(status=str(status))
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, keep_alive):
+        headers = [
+            f"HTTP/1.1 {status} {REASONS[status]}",
+            "Content-Length: 0",
+            "Connection: " + ("keep-alive" if keep_alive else "close"),
+        ]
+        if status == 429:
+            headers.append("Retry-After: 1")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+    async def _consume(self):
+        while True:
+            data, enqueued_at = await self.queue.get()
+            queue_wait.observe(time.perf_counter() - enqueued_at)
+            try:
+                with handler_latency.time(handler="webhook_update"):
+                    await self.application.process_update(Update.de_json(data, self.application.bot))
+            except Exception as e:
+                logger.error(f"Lỗi khi xử lý update webhook {data.get('update_id')}: {e}")
+                errors.inc(component="webhook")
+            finally:
+                self.queue.task_done()
+
+
+def run_webhook(application: Application, concurrency=CONCURRENT_UPDATES):
+    """Chạy bot ở chế độ webhook cho đến khi nhận SIGINT / SIGTERM (thay cho application.run_polling)."""
+    asyncio.run(_serve(application, concurrency))
+
+
+async def _serve(application: Application, concurrency):
+    server = WebhookServer(application, concurrency=concurrency)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        await server.start()
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES
+            )
+            logger.info(f"Đã đăng ký webhook {WEBHOOK_URL}")
+        await stop.wait()
+    finally:
+        await server.stop()
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)